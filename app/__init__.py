@@ -1,7 +1,6 @@
 import os
 from http.client import HTTPException
 
-import stripe
 from flask import Flask, Response, render_template
 from flask_login import LoginManager
 from flask_mail import Mail
@@ -24,14 +23,22 @@ login_manager.login_view = "/login"
 login_manager.login_message = None
 
 from app.models.user import User  # noqa: E402
+from app.utils.availability import AvailabilityIndex  # noqa: E402
+from app.utils.caching import UserCache  # noqa: E402
+from app.utils.events import EventBroker  # noqa: E402
+from app.utils.stripe_client import StripeClient  # noqa: E402
 
+user_cache = UserCache()
+event_broker = EventBroker()
+stripe_client = StripeClient()
+availability_index = AvailabilityIndex()
 
-# Define user loader to associate current user with User instance
+
+# Define user loader to associate current user with User instance, reusing
+# cached data if available
 @login_manager.user_loader
 def load_user(user_id: str) -> User:
-    return db.session.execute(
-        db.select(User).filter_by(id=int(user_id))
-    ).scalar_one_or_none()
+    return user_cache.load(int(user_id), User.get_with_profile)
 
 
 # Flask application factory
@@ -47,12 +54,12 @@ def create_app(config: Config = None, celery_worker: bool = False):
     migrate.init_app(app, db)
     mail.init_app(app)
     login_manager.init_app(app)
+    user_cache.init_app(app)
+    event_broker.init_app(app)
+    stripe_client.init_app(app)
+    availability_index.init_app(app)
     app.serialiser = URLSafeTimedSerializer(app.config["SECRET_KEY"])
 
-    # Configure Stripe
-    stripe.api_key = app.config["STRIPE_SECRET_KEY"]
-    stripe.api_version = "2023-10-16"
-
     # Initialise CSRF protection conditionally
     if app.config["WTF_CSRF_ENABLED"]:
         csrf.init_app(app)
@@ -61,8 +68,13 @@ def create_app(config: Config = None, celery_worker: bool = False):
     from app.utils.celery import celery_init_app
 
     app.celery = celery_init_app(app)
+
+    # Workers serve no requests, so build URLs for the configured site in any
+    # app context, as emails are rendered by them
     if celery_worker:
-        return app
+        from app.utils.mail import site_url_config
+
+        app.config.update(site_url_config(app.config["SITE_URL"]))
 
     # Register context processor to inject global variables
     @app.context_processor
@@ -77,8 +89,8 @@ def create_app(config: Config = None, celery_worker: bool = False):
     with app.app_context():
         from app.models import seed_db
 
-        # Reset database
-        if app.config["RESET_DB"]:
+        # Reset database, unless app is for a worker sharing it
+        if app.config["RESET_DB"] and not celery_worker:
             db.drop_all()
             db.create_all()
             db.session.commit()
@@ -99,14 +111,15 @@ def create_app(config: Config = None, celery_worker: bool = False):
             )
 
     # Register blueprints with endpoints
-    from app.views import (appointment_types, appointments, auth, clients,
-                           main, messages, profile)
+    from app.views import (appointment_types, appointments, auth, availability,
+                           clients, main, messages, profile)
     from app.views import stripe as stripe_bp
     from app.views import therapists, treatment_plans, users
 
     app.register_blueprint(appointment_types.bp)
     app.register_blueprint(appointments.bp)
     app.register_blueprint(auth.bp)
+    app.register_blueprint(availability.bp)
     app.register_blueprint(clients.bp)
     app.register_blueprint(profile.bp)
     app.register_blueprint(main.bp)
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
 
@@ -11,6 +12,22 @@ class Config(object):
     ENV: str = os.environ["ENV"]
     SECRET_KEY: str = os.environ["SECRET_KEY"]
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
+    PAGE_SIZE: int = 20
+
+    # Cache of users loaded for each request, either "memory" or "redis"
+    USER_CACHE_BACKEND: Optional[str] = None
+    USER_CACHE_TTL: int = 300
+    USER_CACHE_SIZE: int = 10000
+
+    # Therapists' open slots are offered for booking within a window of days,
+    # starting at steps of minutes, from an index reloaded after a TTL in seconds
+    AVAILABILITY_DAYS: int = 30
+    AVAILABILITY_SLOT_STEP: int = 15
+    AVAILABILITY_TTL: int = 60
+
+    # Fan-out of real-time events to users, either "memory" or "redis"
+    EVENT_BROKER: str = "memory"
+    EVENT_HEARTBEAT: int = 15
 
     # Flask Mail configuration
     MAIL_SERVER: str = "smtp.gmail.com"
@@ -22,11 +39,59 @@ class Config(object):
     MAIL_DEFAULT_SENDER: str = MAIL_USERNAME
     MAIL_SUPPRESS_SEND: bool = False
 
+    # Root URL of site for absolute links in emails queued outside of a request
+    SITE_URL: str = os.environ.get("SITE_URL", "http://localhost:5000/")
+
+    # Emails are sent from an outbox in batches, retrying with exponential backoff,
+    # each batch being claimed for a lease of seconds while it is sent
+    MAIL_BATCH_SIZE: int = 50
+    MAIL_CLAIM_LEASE: int = 300
+    MAIL_MAX_ATTEMPTS: int = 5
+    MAIL_RETRY_BACKOFF: int = 30
+
     # Stripe configuration
     STRIPE_SECRET_KEY: str = os.environ["STRIPE_SECRET_KEY"]
     STRIPE_PUBLISHABLE_KEY: str = os.environ["STRIPE_PUBLISHABLE_KEY"]
     STRIPE_WEBHOOK_SECRET: str = os.environ["STRIPE_WEBHOOK_SECRET"]
 
+    # Stripe API calls share a pool of connections, with bounded timeouts and
+    # retries of failed calls which are safe to retry
+    STRIPE_API_BASE: str = "https://api.stripe.com"
+    STRIPE_POOL_SIZE: int = 10
+    STRIPE_CONNECT_TIMEOUT: float = 5
+    STRIPE_READ_TIMEOUT: float = 20
+    STRIPE_MAX_NETWORK_RETRIES: int = 2
+    STRIPE_SLOW_CALL_THRESHOLD: float = 2
+    # Seconds between summaries of Stripe call latencies logged by each process
+    STRIPE_STATS_INTERVAL: int = 15 * 60
+
+    # Number of upcoming occurrences of recurring series stored as appointments,
+    # which must be paid via Stripe a number of seconds before they take place
+    APPOINTMENT_SERIES_AHEAD: int = 4
+    APPOINTMENT_SERIES_PAYMENT_NOTICE: int = 48 * 60 * 60
+
+    # Slots are held for appointments awaiting payment via Stripe for a number of
+    # seconds. Checkout closes a margin before the hold expires, so that payments
+    # completed at the last moment are processed while the slot is still held,
+    # and must stay open for at least Stripe's minimum of 30 minutes.
+    APPOINTMENT_HOLD_TTL: int = 40 * 60
+
+    # Holds are extended when a new checkout session is opened, up to this many
+    # seconds after booking, after which the slot must be booked again
+    APPOINTMENT_HOLD_MAX: int = 2 * 60 * 60
+
+    # Checkout sessions are reused until shortly before they expire, and expire
+    # this many seconds before the slot's hold
+    STRIPE_CHECKOUT_EXPIRY_MARGIN: int = 300
+
+    # Webhook events are stored and processed by a worker in batches, retrying
+    # with exponential backoff, each batch being claimed for a lease of seconds
+    # while it is processed
+    STRIPE_EVENT_BATCH_SIZE: int = 50
+    STRIPE_EVENT_CLAIM_LEASE: int = 300
+    STRIPE_EVENT_MAX_ATTEMPTS: int = 5
+    STRIPE_EVENT_RETRY_BACKOFF: int = 30
+
 
 class DevConfig(Config):
     DEBUG: bool = True
@@ -36,11 +101,35 @@ class DevConfig(Config):
     ERROR_HANDLER: bool = True
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///" + os.path.join(basedir, "mindli.sqlite")
     SEED_FROM_EXTERNAL_API: bool = True
+    USER_CACHE_BACKEND: Optional[str] = "memory"
+    EVENT_BROKER: str = "redis"
     CELERY_ENABLED: bool = True
     CELERY: dict = {
         "broker_url": "redis://localhost",
         "result_backend": "redis://localhost",
         "task_ignore_result": True,
+        # Periodically send emails and process Stripe events whose retries are
+        # due, or which were stored while broker was unavailable
+        "beat_schedule": {
+            "drain-email-outbox": {
+                "task": "app.utils.celery.drain_email_outbox",
+                "schedule": 10,
+            },
+            "process-stripe-events": {
+                "task": "app.utils.celery.process_stripe_events",
+                "schedule": 10,
+            },
+            # Release slots held for appointments whose checkout expired
+            "release-expired-holds": {
+                "task": "app.utils.celery.release_expired_holds",
+                "schedule": 60,
+            },
+            # Store upcoming occurrences of recurring series as appointments
+            "book-series-occurrences": {
+                "task": "app.utils.celery.book_series_occurrences",
+                "schedule": 60 * 60,
+            },
+        },
     }
 
 
@@ -52,6 +141,7 @@ class ProdConfig(Config):
     ERROR_HANDLER: bool = True
     SQLALCHEMY_DATABASE_URI: str = os.environ.get("DATABASE_URL")
     SEED_FROM_EXTERNAL_API: bool = False
+    EVENT_BROKER: str = "redis"
 
 
 class TestConfig(Config):
@@ -61,6 +151,7 @@ class TestConfig(Config):
     WTF_CSRF_ENABLED: str = False
     ERROR_HANDLER: bool = False
     SQLALCHEMY_DATABASE_URI: str = "sqlite://"  # Use in-memory database
+    MAIL_SUPPRESS_SEND: bool = True
     SEED_FROM_EXTERNAL_API: bool = False
     CELERY_ENABLED: bool = False
     CELERY: dict = {
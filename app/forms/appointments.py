@@ -1,5 +1,6 @@
 from wtforms import (BooleanField, DateField, IntegerField, SelectField,
-                     StringField, SubmitField, TextAreaField, TimeField)
+                     SelectMultipleField, StringField, SubmitField,
+                     TextAreaField, TimeField)
 from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 from app.constants import CURRENCIES
@@ -39,6 +40,20 @@ class BookAppointmentForm(CustomFlaskForm):
         return
 
 
+class BookAppointmentSeriesForm(BookAppointmentForm):
+    interval_weeks = IntegerField(
+        "Repeat every (weeks)",
+        default=1,
+        validators=[DataRequired(), NumberRange(min=1, max=4)],
+    )
+    count = IntegerField(
+        "Number of appointments",
+        validators=[Optional(), NumberRange(min=2, max=52)],
+    )
+    end_date = DateField("End date", format="%Y-%m-%d", validators=[Optional()])
+    submit = SubmitField("Book Series")
+
+
 class UpdateAppointmentForm(CustomFlaskForm):
     action = CustomSelectField(
         "Action",
@@ -73,6 +88,31 @@ class UpdateAppointmentForm(CustomFlaskForm):
         return
 
 
+class BulkUpdateAppointmentsForm(CustomFlaskForm):
+    # Appointments are validated individually by the view, so that valid ones are
+    # updated even if others are not
+    appointment_ids = SelectMultipleField(
+        "Appointments",
+        choices=[],
+        coerce=int,
+        validate_choice=False,
+        validators=[DataRequired()],
+    )
+    action = CustomSelectField(
+        "Action",
+        choices=[
+            ("", "Select action"),
+            (AppointmentStatus.CONFIRMED.name, "Confirm"),
+            (AppointmentStatus.COMPLETED.name, "Completed"),
+            (AppointmentStatus.CANCELLED.name, "Cancel"),
+            (AppointmentStatus.NO_SHOW.name, "No Show"),
+        ],
+        default="",
+        validators=[DataRequired()],
+    )
+    submit = SubmitField("Update")
+
+
 class AppointmentNotesForm(CustomFlaskForm):
     text = TextAreaField("Notes", validators=[DataRequired()])
     issues = CustomSelectMultipleField(
@@ -0,0 +1,60 @@
+import calendar
+
+from wtforms import (BooleanField, DateTimeLocalField, HiddenField,
+                     SubmitField, TimeField)
+from wtforms.validators import DataRequired, InputRequired
+
+from app.forms import CustomFlaskForm, CustomSelectField
+from app.models.availability import AvailabilityException, WorkingHours
+from app.utils.validators import AfterField
+
+
+class WorkingHoursForm(CustomFlaskForm):
+    weekday = CustomSelectField(
+        "Day",
+        choices=[("", "Select day")]
+        + [(str(i), name) for i, name in enumerate(calendar.day_name)],
+        default="",
+        validators=[DataRequired()],
+    )
+    start_time = TimeField("Start", validators=[DataRequired()])
+    end_time = TimeField("End", validators=[DataRequired(), AfterField("start_time")])
+    submit = SubmitField("Save")
+    working_hours: WorkingHours = None
+
+    def __init__(self, *args, **kwargs):
+        super(WorkingHoursForm, self).__init__(*args, **kwargs)
+        working_hours = kwargs.get("obj")
+        if working_hours:
+            self.working_hours = working_hours
+            self.weekday.data = str(working_hours.weekday)
+        return
+
+
+class AvailabilityExceptionForm(CustomFlaskForm):
+    start = DateTimeLocalField(
+        "Start", format="%Y-%m-%dT%H:%M", validators=[DataRequired()]
+    )
+    end = DateTimeLocalField(
+        "End",
+        format="%Y-%m-%dT%H:%M",
+        validators=[DataRequired(), AfterField("start")],
+    )
+    is_available = BooleanField("Available (extra hours rather than time off)")
+    submit = SubmitField("Save")
+    exception: AvailabilityException = None
+
+    def __init__(self, *args, **kwargs):
+        super(AvailabilityExceptionForm, self).__init__(*args, **kwargs)
+        self.exception = kwargs.get("obj")
+        return
+
+
+class DeleteWorkingHoursForm(CustomFlaskForm):
+    working_hours_id = HiddenField("Working hours ID", validators=[InputRequired()])
+    submit = SubmitField("Delete")
+
+
+class DeleteAvailabilityExceptionForm(CustomFlaskForm):
+    exception_id = HiddenField("Exception ID", validators=[InputRequired()])
+    submit = SubmitField("Delete")
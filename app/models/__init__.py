@@ -12,22 +12,29 @@ class SeedableMixin:
 
 from .appointment import Appointment
 from .appointment_notes import AppointmentNotes
+from .appointment_search import AppointmentSearch
+from .appointment_series import AppointmentSeries
 from .appointment_type import AppointmentType
-from .associations import (client_issue, note_intervention, note_issue,
-                           therapist_intervention, therapist_issue,
+from .associations import (client_issue, email_appointment, note_intervention,
+                           note_issue, therapist_intervention, therapist_issue,
                            therapist_language, therapist_title)
+from .availability import AvailabilityException, WorkingHours
 from .client import Client
 from .conversation import Conversation
+from .email_outbox import EmailOutbox
 from .enums import Gender, TherapyMode, UserRole
 from .intervention import Intervention
 from .issue import Issue
 from .language import Language
 from .message import Message
+from .stripe_event import StripeEvent
 from .therapist import Therapist
+from .therapist_search import TherapistSearch, TherapistSearchVersion
 from .therapy_exercise import TherapyExercise
 from .title import Title
 from .treatment_plan import TreatmentPlan
 from .user import User
+from .user_name_ngram import UserNameNgram
 
 
 # Seed database models in order
@@ -43,12 +50,15 @@ def seed_db(db: SQLAlchemy, use_fake_data: bool) -> None:
         fake = Faker()
         User.seed(db, fake)
         Therapist.seed(db, fake)
+        WorkingHours.seed(db, fake)
         Client.seed(db, fake)
         TreatmentPlan.seed(db)
         Conversation.seed(db)
         Message.seed(db, fake)
         AppointmentType.seed(db, fake)
+        TherapistSearch.seed(db)
         Appointment.seed(db, fake)
         AppointmentNotes.seed(db, fake)
         TherapyExercise.seed(db, fake)
+        AppointmentSearch.seed(db)
     return
@@ -1,11 +1,13 @@
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 from faker import Faker
 from flask_login import current_user
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.ext.hybrid import hybrid_property
 
 from app import db
 from app.constants import EXAMPLE_CLIENT_EMAIL, EXAMPLE_THERAPIST_EMAIL
@@ -16,10 +18,14 @@ from app.models.user import User
 
 
 class Appointment(SeedableMixin, db.Model):
-    id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    therapist_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("therapist.id"), index=True
+    # Therapist/client pairs are indexed together for relationship checks, which
+    # also serves lookups by therapist alone
+    __table_args__ = (
+        sa.Index("ix_appointment_therapist_id_client_id", "therapist_id", "client_id"),
     )
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    therapist_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("therapist.id"))
     client_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("client.id"), index=True)
     appointment_type_id: so.Mapped[int] = so.mapped_column(
         sa.ForeignKey("appointment_type.id", ondelete="CASCADE"), index=True
@@ -31,6 +37,24 @@ class Appointment(SeedableMixin, db.Model):
     payment_status: so.Mapped["PaymentStatus"] = so.mapped_column(
         sa.Enum(PaymentStatus), default=PaymentStatus.PENDING
     )
+    created_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=datetime.now
+    )
+    # Time until which slot is held for an appointment awaiting payment, after
+    # which it is released
+    hold_expires_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime, index=True
+    )
+    # Recurring series which appointment is an occurrence of, if any
+    series_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("appointment_series.id", ondelete="SET NULL"), index=True
+    )
+    # Latest Stripe Checkout session, reused for payment attempts until it expires
+    checkout_session_id: so.Mapped[Optional[str]] = so.mapped_column(sa.String(255))
+    checkout_session_url: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    checkout_session_expires_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime
+    )
 
     therapist: so.Mapped["Therapist"] = so.relationship(back_populates="appointments")
     client: so.Mapped["Client"] = so.relationship(back_populates="appointments")
@@ -43,6 +67,108 @@ class Appointment(SeedableMixin, db.Model):
     exercise: so.Mapped["TherapyExercise"] = so.relationship(
         back_populates="appointment",
     )
+    series: so.Mapped[Optional["AppointmentSeries"]] = so.relationship(
+        back_populates="appointments"
+    )
+
+    @hybrid_property
+    def is_busy(self) -> bool:
+        # Whether appointment occupies the therapist's time, which appointments
+        # awaiting payment only do until their hold expires
+        return self.appointment_status != AppointmentStatus.CANCELLED and (
+            self.hold_expires_at is None or self.hold_expires_at > datetime.now()
+        )
+
+    @is_busy.inplace.expression
+    @classmethod
+    def _is_busy_expression(cls) -> sa.ColumnElement[bool]:
+        return sa.and_(
+            cls.appointment_status != AppointmentStatus.CANCELLED,
+            sa.or_(cls.hold_expires_at.is_(None), cls.hold_expires_at > datetime.now()),
+        )
+
+    @classmethod
+    def release_expired_holds(cls) -> List[int]:
+        # Cancel appointments whose payment was not completed before their hold
+        # expired in one statement, returning their IDs
+        return db.session.scalars(
+            db.update(cls)
+            .where(
+                cls.payment_status != PaymentStatus.SUCCEEDED,
+                cls.appointment_status != AppointmentStatus.CANCELLED,
+                cls.hold_expires_at <= datetime.now(),
+            )
+            .values(appointment_status=AppointmentStatus.CANCELLED)
+            .returning(cls.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+    @classmethod
+    def bulk_update_status(
+        cls, therapist_id: int, appointment_ids: List[int], status: AppointmentStatus
+    ) -> int:
+        # Set status of therapist's appointments in one statement, skipping any
+        # changed concurrently to the same status or cancelled
+        updated = db.session.execute(
+            db.update(cls)
+            .where(
+                cls.id.in_(appointment_ids),
+                cls.therapist_id == therapist_id,
+                cls.appointment_status.not_in([status, AppointmentStatus.CANCELLED]),
+            )
+            .values(appointment_status=status)
+        ).rowcount
+
+        # Bulk updates bypass the session's record of changed appointments, so
+        # have therapist's availability reloaded once committed if slots are freed
+        if updated and status == AppointmentStatus.CANCELLED:
+            db.session.info.setdefault("availability_therapist_ids", set()).add(
+                therapist_id
+            )
+        return updated
+
+    @classmethod
+    def has_conflict(
+        cls,
+        therapist_id: int,
+        start: datetime,
+        end: datetime,
+        appointment_id: Optional[int] = None,
+    ) -> bool:
+        # Check for busy appointments of therapist overlapping an interval, other
+        # than the appointment being moved
+        return bool(cls.busy_intervals(therapist_id, start, end, appointment_id))
+
+    @classmethod
+    def busy_intervals(
+        cls,
+        therapist_id: int,
+        start: datetime,
+        end: datetime,
+        appointment_id: Optional[int] = None,
+    ) -> List[Tuple[datetime, datetime]]:
+        # Intervals of therapist's busy appointments overlapping a period, in one
+        # query, other than the appointment being moved. Appointments last less
+        # than a day, so only those starting within a day before are compared in
+        # Python, which avoids dialect-specific date arithmetic.
+        from app.models.appointment_type import AppointmentType
+
+        rows = db.session.execute(
+            db.select(cls.time, AppointmentType.duration)
+            .join(cls.appointment_type)
+            .where(
+                cls.therapist_id == therapist_id,
+                cls.id != appointment_id if appointment_id else sa.true(),
+                cls.is_busy,
+                cls.time > start - timedelta(days=1),
+                cls.time < end,
+            )
+            .order_by(cls.time)
+        )
+        intervals = [
+            (time, time + timedelta(minutes=duration)) for time, duration in rows
+        ]
+        return [interval for interval in intervals if interval[1] > start]
 
     @property
     def this_user(self) -> User:
@@ -0,0 +1,174 @@
+import re
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from app import db
+from app.models.appointment import Appointment
+from app.models.appointment_notes import AppointmentNotes
+from app.models.therapy_exercise import TherapyExercise
+
+
+class AppointmentSearch:
+    # Full-text index over appointment notes and exercises, kept outside the ORM
+    # as an FTS5 virtual table on SQLite or a table of tsvectors on Postgres
+    table = sa.table(
+        "appointment_search",
+        sa.column("appointment_id", sa.Integer),
+        sa.column("notes", sa.Text),
+        sa.column("exercise_title", sa.Text),
+        sa.column("exercise_description", sa.Text),
+    )
+
+    # Searchable columns and the model attributes they are derived from
+    COLUMNS = {
+        "notes": AppointmentNotes.text,
+        "exercise_title": TherapyExercise.title,
+        "exercise_description": TherapyExercise.description,
+    }
+
+    @classmethod
+    def create(cls, target, connection: Connection, **kw) -> None:
+        if connection.dialect.name == "sqlite":
+            statements = [
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS appointment_search USING fts5(
+                    appointment_id UNINDEXED,
+                    notes,
+                    exercise_title,
+                    exercise_description,
+                    tokenize = 'porter unicode61'
+                )
+                """
+            ]
+        elif connection.dialect.name == "postgresql":
+            statements = [
+                """
+                CREATE TABLE IF NOT EXISTS appointment_search (
+                    appointment_id INTEGER PRIMARY KEY
+                        REFERENCES appointment (id) ON DELETE CASCADE,
+                    notes TEXT,
+                    exercise_title TEXT,
+                    exercise_description TEXT
+                )
+                """
+            ]
+            for column in cls.COLUMNS:
+                statements += [
+                    f"""
+                    ALTER TABLE appointment_search
+                    ADD COLUMN IF NOT EXISTS {column}_vector tsvector
+                    GENERATED ALWAYS AS (
+                        to_tsvector('english', coalesce({column}, ''))
+                    ) STORED
+                    """,
+                    f"""
+                    CREATE INDEX IF NOT EXISTS ix_appointment_search_{column}
+                    ON appointment_search USING GIN ({column}_vector)
+                    """,
+                ]
+        else:
+            return
+
+        # Full-text search is optional, so queries fall back to pattern matching
+        # if the database does not support it (e.g. SQLite built without FTS5)
+        try:
+            with connection.begin_nested():
+                for statement in statements:
+                    connection.execute(sa.text(statement))
+        except sa.exc.DBAPIError:
+            pass
+        return
+
+    @classmethod
+    def drop(cls, target, connection: Connection, **kw) -> None:
+        connection.execute(sa.text("DROP TABLE IF EXISTS appointment_search"))
+        return
+
+    @classmethod
+    def available(cls) -> bool:
+        available = current_app.extensions.get("appointment_search")
+        if available is None:
+            available = sa.inspect(db.engine).has_table("appointment_search")
+            current_app.extensions["appointment_search"] = available
+        return available
+
+    @classmethod
+    def index(cls, appointment: Appointment) -> None:
+        # Replace indexed text for this appointment with its current notes/exercise
+        if not cls.available():
+            return
+
+        notes, exercise = appointment.notes, appointment.exercise
+        db.session.execute(
+            sa.delete(cls.table).where(cls.table.c.appointment_id == appointment.id)
+        )
+        db.session.execute(
+            sa.insert(cls.table).values(
+                appointment_id=appointment.id,
+                notes=notes.text if notes else None,
+                exercise_title=exercise.title if exercise else None,
+                exercise_description=exercise.description if exercise else None,
+            )
+        )
+        return
+
+    @classmethod
+    def match(cls, column: str, term: str) -> Select:
+        # Select IDs of appointments with text in this column matching search term
+        words = re.findall(r"\w+", term.lower())
+        if cls.available() and words:
+            if db.engine.dialect.name == "sqlite":
+                query = " AND ".join(f'"{word}"*' for word in words)
+                condition = cls.table.c[column].op("MATCH")(query)
+            else:
+                query = " & ".join(f"{word}:*" for word in words)
+                vector = sa.literal_column(f"appointment_search.{column}_vector")
+                condition = vector.op("@@")(sa.func.to_tsquery("english", query))
+            return db.select(cls.table.c.appointment_id).where(condition)
+
+        # Fall back to scanning source table for substring
+        attribute = cls.COLUMNS[column]
+        return db.select(attribute.class_.appointment_id).where(
+            sa.func.lower(attribute).like(f"%{term.lower()}%")
+        )
+
+    @classmethod
+    def backfill(cls) -> int:
+        # Create index if missing, e.g. in databases created before it existed,
+        # and rebuild it from notes and exercises of every appointment
+        cls.create(db.metadata, db.session.connection())
+        db.session.commit()
+        current_app.extensions.pop("appointment_search", None)
+        if not cls.available():
+            return 0
+
+        db.session.execute(sa.delete(cls.table))
+        result = db.session.execute(
+            sa.insert(cls.table).from_select(
+                list(cls.table.c),
+                db.select(
+                    Appointment.id,
+                    AppointmentNotes.text,
+                    TherapyExercise.title,
+                    TherapyExercise.description,
+                )
+                .outerjoin(AppointmentNotes)
+                .outerjoin(TherapyExercise),
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def seed(cls, db: SQLAlchemy) -> None:
+        cls.backfill()
+        return
+
+
+# Maintain full-text index alongside tables created from model metadata
+sa.event.listen(db.metadata, "after_create", AppointmentSearch.create)
+sa.event.listen(db.metadata, "before_drop", AppointmentSearch.drop)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, List, Optional
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+
+
+class AppointmentSeries(db.Model):
+    # Appointments recurring at an interval of weeks, optionally ending after a
+    # count of occurrences or at a time, like a weekly RRULE. Occurrences are
+    # computed as needed, and only the next few are stored as appointments.
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    therapist_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("therapist.id"), index=True
+    )
+    client_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("client.id"), index=True)
+    appointment_type_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("appointment_type.id", ondelete="CASCADE")
+    )
+    start: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    interval_weeks: so.Mapped[int] = so.mapped_column(sa.Integer, default=1)
+    count: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer)
+    until: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    # Latest occurrence stored as an appointment, after which occurrences are due
+    generated_until: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    is_active: so.Mapped[bool] = so.mapped_column(sa.Boolean, default=True, index=True)
+
+    therapist: so.Mapped["Therapist"] = so.relationship()
+    client: so.Mapped["Client"] = so.relationship()
+    appointment_type: so.Mapped["AppointmentType"] = so.relationship()
+    appointments: so.Mapped[List["Appointment"]] = so.relationship(
+        back_populates="series"
+    )
+
+    @property
+    def step(self) -> timedelta:
+        return timedelta(weeks=self.interval_weeks)
+
+    def occurrences(self, after: Optional[datetime] = None) -> Iterator[datetime]:
+        # Occurrences after a time, starting from the first one after it rather
+        # than expanding the series from its start
+        i = 0
+        if after is not None and after >= self.start:
+            i = (after - self.start) // self.step + 1
+        while self.count is None or i < self.count:
+            time = self.start + i * self.step
+            if self.until and time > self.until:
+                return
+            yield time
+            i += 1
+
+    def due_occurrences(self, ahead: int, now: datetime) -> List[datetime]:
+        # Occurrences among the given number ahead of now not yet stored
+        return [
+            time
+            for time in islice(self.occurrences(now), ahead)
+            if not self.generated_until or time > self.generated_until
+        ]
+
+    def has_more_occurrences(self, now: datetime) -> bool:
+        # Whether any occurrences after now are yet to be stored
+        after = max(now, self.generated_until) if self.generated_until else now
+        return next(self.occurrences(after), None) is not None
@@ -64,3 +64,18 @@ plan_intervention = sa.Table(
     sa.Column("plan_id", sa.ForeignKey("treatment_plan.id"), primary_key=True),
     sa.Column("intervention_id", sa.ForeignKey("intervention.id"), primary_key=True),
 )
+
+email_appointment = sa.Table(
+    "email_appointment",
+    db.Model.metadata,
+    sa.Column(
+        "email_id",
+        sa.ForeignKey("email_outbox.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sa.Column(
+        "appointment_id",
+        sa.ForeignKey("appointment.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+)
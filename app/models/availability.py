@@ -0,0 +1,61 @@
+from datetime import datetime, time
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from faker import Faker
+from flask_sqlalchemy import SQLAlchemy
+
+from app import db
+from app.models import SeedableMixin
+from app.models.therapist import Therapist
+
+
+class WorkingHours(SeedableMixin, db.Model):
+    # Weekly recurring hours in which a therapist can be booked, with weekdays
+    # numbered from Monday as 0
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    therapist_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("therapist.id", ondelete="CASCADE"), index=True
+    )
+    weekday: so.Mapped[int] = so.mapped_column(sa.Integer)
+    start_time: so.Mapped[time] = so.mapped_column(sa.Time)
+    end_time: so.Mapped[time] = so.mapped_column(sa.Time)
+
+    therapist: so.Mapped["Therapist"] = so.relationship()
+
+    @classmethod
+    def seed(cls, db: SQLAlchemy, fake: Faker) -> None:
+        # Give every therapist office hours on weekdays
+        therapist_ids = db.session.execute(db.select(Therapist.id)).scalars().all()
+        db.session.add_all(
+            [
+                WorkingHours(
+                    therapist_id=therapist_id,
+                    weekday=weekday,
+                    start_time=time(9),
+                    end_time=time(18),
+                )
+                for therapist_id in therapist_ids
+                for weekday in range(5)
+            ]
+        )
+        db.session.commit()
+        return
+
+
+class AvailabilityException(db.Model):
+    # One-off change to a therapist's working hours, either time off within them
+    # or extra hours outside them
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    therapist_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("therapist.id", ondelete="CASCADE")
+    )
+    start: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    end: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    is_available: so.Mapped[bool] = so.mapped_column(sa.Boolean, default=False)
+
+    therapist: so.Mapped["Therapist"] = so.relationship()
+
+    __table_args__ = (
+        sa.Index("ix_availability_exception_therapist_id_end", "therapist_id", "end"),
+    )
@@ -14,6 +14,7 @@ from app.models import SeedableMixin
 from app.models.enums import Occupation, ReferralSource, UserRole
 from app.models.issue import Issue
 from app.models.user import User
+from app.utils.caching import request_cached_property
 
 
 class Client(SeedableMixin, db.Model):
@@ -44,7 +45,8 @@ class Client(SeedableMixin, db.Model):
 
     @property
     def is_current_user(self) -> bool:
-        return current_user.id == self.user.id
+        # Compare foreign key to avoid loading user, unless profile is unsaved
+        return current_user.id == (self.user_id or self.user.id)
 
     @property
     def age(self) -> int:
@@ -60,7 +62,7 @@ class Client(SeedableMixin, db.Model):
             )
         )
 
-    @property
+    @request_cached_property
     def onboarding_complete(self) -> bool:
         return self and self.user.gender and self.issues
 
@@ -1,28 +1,63 @@
 import random
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 from flask_login import current_user
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.sql import Select
 
 from app import db
 from app.constants import EXAMPLE_THERAPIST_EMAIL
 from app.models import SeedableMixin
 from app.models.enums import UserRole
 from app.models.user import User
+from app.utils.caching import mark_user_changed
 
 
 class Conversation(SeedableMixin, db.Model):
+    # Each participant's inbox is read in order of latest message
+    __table_args__ = (
+        sa.Index(
+            "ix_conversation_therapist_user_id_last_message_at",
+            "therapist_user_id",
+            "last_message_at",
+        ),
+        sa.Index(
+            "ix_conversation_client_user_id_last_message_at",
+            "client_user_id",
+            "last_message_at",
+        ),
+    )
+
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    therapist_user_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("user.id"), index=True
+    therapist_user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("user.id"))
+    client_user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("user.id"))
+
+    # Latest message is denormalised so inbox needs no aggregation over messages
+    last_message_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("message.id", use_alter=True)
+    )
+    last_message_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+
+    # Read state of each participant, with counts of messages sent since
+    therapist_last_read_message_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("message.id", use_alter=True)
     )
-    client_user_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("user.id"), index=True
+    client_last_read_message_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("message.id", use_alter=True)
     )
+    therapist_unread_count: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
+    client_unread_count: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
+
     messages: so.Mapped[List["Message"]] = so.relationship(
-        back_populates="conversation", cascade="all, delete-orphan"
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        foreign_keys="Message.conversation_id",
+    )
+    last_message: so.Mapped[Optional["Message"]] = so.relationship(
+        foreign_keys=[last_message_id], post_update=True
     )
 
     therapist_user: so.Mapped["User"] = so.relationship(
@@ -46,6 +81,124 @@ class Conversation(SeedableMixin, db.Model):
         elif current_user.role == UserRole.CLIENT:
             return self.therapist_user
 
+    @property
+    def unread_count(self) -> int:
+        return getattr(self, f"{self.participant(current_user.id)}_unread_count")
+
+    @property
+    def other_last_read_message_id(self) -> Optional[int]:
+        if self.participant(current_user.id) == "therapist":
+            return self.client_last_read_message_id
+        return self.therapist_last_read_message_id
+
+    def has_participant(self, user_id: int) -> bool:
+        return user_id in (self.therapist_user_id, self.client_user_id)
+
+    def participant(self, user_id: int) -> str:
+        # Prefix of read state columns for this participant
+        return "therapist" if user_id == self.therapist_user_id else "client"
+
+    def add_message(self, message: "Message") -> None:
+        self.messages.append(message)
+        self.last_message = message
+        self.last_message_at = message.timestamp
+
+        # Count message as unread for recipient, incrementing in the database so
+        # that concurrent messages are all counted
+        recipient = (
+            "client" if message.author_id == self.therapist_user_id else "therapist"
+        )
+        self.update_unread_count(recipient, 1)
+        return
+
+    def mark_read(self, user_id: int, message_id: int) -> bool:
+        # Mark messages up to this one as read by participant, returning whether
+        # read state changed
+        participant = self.participant(user_id)
+        last_read = getattr(self, f"{participant}_last_read_message_id")
+        if last_read and message_id <= last_read:
+            return False
+        setattr(self, f"{participant}_last_read_message_id", message_id)
+
+        # Count messages from other participant which remain unread
+        from app.models.message import Message
+
+        unread = 0
+        if message_id != self.last_message_id:
+            unread = db.session.execute(
+                db.select(sa.func.count(Message.id)).where(
+                    Message.conversation_id == self.id,
+                    Message.id > message_id,
+                    Message.author_id != user_id,
+                )
+            ).scalar()
+        self.update_unread_count(
+            participant, unread - getattr(self, f"{participant}_unread_count")
+        )
+        return True
+
+    def update_unread_count(self, participant: str, change: int) -> None:
+        if not change:
+            return
+        column = getattr(Conversation, f"{participant}_unread_count")
+        setattr(self, f"{participant}_unread_count", column + change)
+
+        user_id = getattr(self, f"{participant}_user_id")
+        db.session.execute(
+            sa.update(User)
+            .where(User.id == user_id)
+            .values(unread_message_count=User.unread_message_count + change)
+        )
+        mark_user_changed(user_id)
+        return
+
+    @classmethod
+    def inbox(cls, user: User) -> Select:
+        # Select user's conversations with their latest messages and the other
+        # participant, with new conversations first
+        if user.role == UserRole.THERAPIST:
+            participant, other_user = cls.therapist_user_id, cls.client_user
+        else:
+            participant, other_user = cls.client_user_id, cls.therapist_user
+        return (
+            db.select(cls)
+            .where(participant == user.id)
+            .options(so.joinedload(cls.last_message), so.joinedload(other_user))
+            .order_by(cls.last_message_at.desc().nulls_first(), cls.id.desc())
+        )
+
+    @classmethod
+    def refresh_last_messages(cls) -> int:
+        # Recompute latest message of every conversation, e.g. after bulk inserts
+        # or for conversations created before it was maintained
+        from app.models.message import Message
+
+        latest = db.select(
+            Message.conversation_id,
+            Message.id,
+            Message.timestamp,
+            sa.func.row_number()
+            .over(
+                partition_by=Message.conversation_id,
+                order_by=(Message.timestamp.desc(), Message.id.desc()),
+            )
+            .label("position"),
+        ).subquery()
+        rows = db.session.execute(
+            db.select(latest.c.conversation_id, latest.c.id, latest.c.timestamp).where(
+                latest.c.position == 1
+            )
+        ).all()
+        if rows:
+            db.session.execute(
+                sa.update(cls),
+                [
+                    {"id": id, "last_message_id": message_id, "last_message_at": time}
+                    for id, message_id, time in rows
+                ],
+            )
+        return len(rows)
+
     @classmethod
     def seed(cls, db: SQLAlchemy) -> None:
         # Fetch example therapist and client to create conversations between
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+from app.models.appointment import Appointment
+from app.models.appointment_series import AppointmentSeries
+from app.models.client import Client
+from app.models.enums import EmailSubject
+from app.models.therapist import Therapist
+
+
+class EmailOutbox(db.Model):
+    # Emails waiting to be sent, which are rendered and drained in batches by a
+    # worker. Pending emails have a next attempt time, which is pushed back while
+    # an email is claimed for sending, and cleared once sent or given up on.
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    subject: so.Mapped["EmailSubject"] = so.mapped_column(sa.Enum(EmailSubject))
+    recipient_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("user.id", ondelete="CASCADE")
+    )
+    appointment_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("appointment.id", ondelete="CASCADE")
+    )
+    # Recurring series whose occurrences email describes, with times of those
+    # which could not be booked
+    series_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("appointment_series.id", ondelete="CASCADE")
+    )
+    skipped_times: so.Mapped[Optional[List[str]]] = so.mapped_column(sa.JSON)
+    # Root URL of site which email was requested from, for absolute links
+    base_url: so.Mapped[Optional[str]] = so.mapped_column(sa.String(255))
+    created_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime, index=True
+    )
+    attempts: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
+    sent_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    last_error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+
+    recipient: so.Mapped["User"] = so.relationship()
+    appointment: so.Mapped[Optional["Appointment"]] = so.relationship()
+    series: so.Mapped[Optional["AppointmentSeries"]] = so.relationship()
+    # Appointments covered by an email grouping several updates
+    appointments: so.Mapped[List["Appointment"]] = so.relationship(
+        secondary="email_appointment"
+    )
+
+    @classmethod
+    def claim_batch(cls, size: int, lease: int) -> List["EmailOutbox"]:
+        # Claim a batch of emails due to be sent by deferring them for a lease of
+        # seconds, keeping only those which were not claimed concurrently. The
+        # claim is committed so that emails are sent without holding locks, and
+        # emails are retried once the lease expires if never marked as sent.
+        now = datetime.now()
+        due_ids = (
+            db.session.execute(
+                db.select(cls.id)
+                .where(cls.next_attempt_at <= now)
+                .order_by(cls.id)
+                .limit(size)
+            )
+            .scalars()
+            .all()
+        )
+        if not due_ids:
+            return []
+
+        claimed_ids = (
+            db.session.execute(
+                db.update(cls)
+                .where(cls.id.in_(due_ids), cls.next_attempt_at <= now)
+                .values(next_attempt_at=now + timedelta(seconds=lease))
+                .returning(cls.id)
+                .execution_options(synchronize_session=False)
+            )
+            .scalars()
+            .all()
+        )
+        db.session.commit()
+        if not claimed_ids:
+            return []
+
+        return (
+            db.session.execute(
+                db.select(cls)
+                .where(cls.id.in_(claimed_ids))
+                .order_by(cls.id)
+                .options(
+                    so.selectinload(cls.recipient),
+                    so.selectinload(cls.appointment).options(
+                        so.joinedload(Appointment.therapist).joinedload(Therapist.user),
+                        so.joinedload(Appointment.client).joinedload(Client.user),
+                    ),
+                    so.selectinload(cls.appointments).options(
+                        so.joinedload(Appointment.therapist).joinedload(Therapist.user),
+                        so.joinedload(Appointment.client).joinedload(Client.user),
+                    ),
+                    so.selectinload(cls.series)
+                    .joinedload(AppointmentSeries.therapist)
+                    .joinedload(Therapist.user),
+                )
+                .execution_options(populate_existing=True)
+            )
+            .scalars()
+            .all()
+        )
+
+    def mark_sent(self) -> None:
+        self.sent_at = datetime.now()
+        self.next_attempt_at = None
+        return
+
+    def mark_failed(self, error: Exception, max_attempts: int, backoff: int) -> None:
+        # Retry with exponential backoff until attempts are exhausted
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.next_attempt_at = None
+        else:
+            delay = backoff * 2 ** (self.attempts - 1)
+            self.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+        return
@@ -12,6 +12,12 @@ class EmailSubject(Enum):
     APPOINTMENT_RESCHEDULED = "Appointment Rescheduled"
     APPOINTMENT_CANCELLED = "Appointment Cancelled"
     APPOINTMENT_NO_SHOW_CLIENT = "Missed Appointment"
+    PAYMENT_REFUND_CLIENT = "Payment To Be Refunded"
+    APPOINTMENTS_CONFIRMED_CLIENT = "Appointments Confirmed"
+    APPOINTMENTS_CANCELLED = "Appointments Cancelled"
+    APPOINTMENTS_NO_SHOW_CLIENT = "Missed Appointments"
+    SERIES_BOOKED_CLIENT = "Recurring Appointments Booked"
+    SERIES_RELEASED_CLIENT = "Unpaid Appointments Released"
 
 
 @unique
@@ -82,3 +88,4 @@ class PaymentStatus(Enum):
     PENDING = "Pending"
     SUCCEEDED = "Succeeded"
     FAILED = "Failed"
+    REFUND_DUE = "Refund Due"
@@ -13,17 +13,27 @@ from app.models.user import User
 
 
 class Message(db.Model):
-    id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    conversation_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("conversation.id"), index=True
+    # Message history is paginated by time within each conversation
+    __table_args__ = (
+        sa.Index(
+            "ix_message_conversation_id_timestamp_id",
+            "conversation_id",
+            "timestamp",
+            "id",
+        ),
     )
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    conversation_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("conversation.id"))
     author_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("user.id"), index=True)
     content: so.Mapped[str] = so.mapped_column(sa.Text)
     timestamp: so.Mapped[datetime] = so.mapped_column(
         sa.DateTime, default=datetime.now()
     )
 
-    conversation: so.Mapped["Conversation"] = so.relationship(back_populates="messages")
+    conversation: so.Mapped["Conversation"] = so.relationship(
+        back_populates="messages", foreign_keys=[conversation_id]
+    )
     author: so.Mapped["User"] = so.relationship(back_populates="messages")
 
     @classmethod
@@ -62,5 +72,15 @@ class Message(db.Model):
                     )
                 )
         db.session.add_all(messages)
+        db.session.flush()
+        Conversation.refresh_last_messages()
+
+        # Treat seeded messages as read by both participants
+        db.session.execute(
+            sa.update(Conversation).values(
+                therapist_last_read_message_id=Conversation.last_message_id,
+                client_last_read_message_id=Conversation.last_message_id,
+            )
+        )
         db.session.commit()
         return
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+
+class StripeEvent(db.Model):
+    # Webhook events received from Stripe, keyed by their Stripe event ID so that
+    # redelivered events are stored once. Events are processed by a worker in the
+    # order they were created for each appointment, and pending events have a
+    # next attempt time, which is cleared once processed or given up on.
+    id: so.Mapped[str] = so.mapped_column(sa.String(255), primary_key=True)
+    type: so.Mapped[str] = so.mapped_column(sa.String(255))
+    appointment_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey("appointment.id", ondelete="SET NULL")
+    )
+    payload: so.Mapped[str] = so.mapped_column(sa.Text)
+    created: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    received_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime, index=True
+    )
+    attempts: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
+    processed_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    last_error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+
+    __table_args__ = (
+        sa.Index("ix_stripe_event_appointment_id_created", "appointment_id", "created"),
+    )
+
+    @classmethod
+    def record(cls, event: dict, payload: str) -> bool:
+        # Store event unless it has already been received, returning whether it
+        # is new
+        metadata = event["data"]["object"].get("metadata") or {}
+        appointment_id = metadata.get("appointment_id")
+        try:
+            db.session.add(
+                cls(
+                    id=event["id"],
+                    type=event["type"],
+                    appointment_id=int(appointment_id) if appointment_id else None,
+                    payload=payload,
+                    created=datetime.fromtimestamp(event["created"]),
+                    received_at=datetime.now(),
+                    next_attempt_at=datetime.now(),
+                )
+            )
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return True
+
+    @classmethod
+    def claim_batch(cls, size: int, lease: int) -> List["StripeEvent"]:
+        # Claim a batch of events due to be processed by deferring them for a
+        # lease of seconds, keeping only those which were not claimed
+        # concurrently. Events are only claimed once earlier events for the same
+        # appointment are no longer pending, and the claim is committed so that
+        # events are processed without holding locks. Events are retried once
+        # the lease expires if never marked as processed.
+        now = datetime.now()
+        earlier = so.aliased(cls)
+        due_ids = (
+            db.session.execute(
+                db.select(cls.id)
+                .where(
+                    cls.next_attempt_at <= now,
+                    ~sa.exists().where(
+                        earlier.appointment_id == cls.appointment_id,
+                        earlier.next_attempt_at.is_not(None),
+                        sa.or_(
+                            earlier.created < cls.created,
+                            sa.and_(
+                                earlier.created == cls.created, earlier.id < cls.id
+                            ),
+                        ),
+                    ),
+                )
+                .order_by(cls.created, cls.id)
+                .limit(size)
+            )
+            .scalars()
+            .all()
+        )
+        if not due_ids:
+            return []
+
+        claimed_ids = (
+            db.session.execute(
+                db.update(cls)
+                .where(cls.id.in_(due_ids), cls.next_attempt_at <= now)
+                .values(next_attempt_at=now + timedelta(seconds=lease))
+                .returning(cls.id)
+                .execution_options(synchronize_session=False)
+            )
+            .scalars()
+            .all()
+        )
+        db.session.commit()
+        if not claimed_ids:
+            return []
+
+        return (
+            db.session.execute(
+                db.select(cls)
+                .where(cls.id.in_(claimed_ids))
+                .order_by(cls.created, cls.id)
+                .execution_options(populate_existing=True)
+            )
+            .scalars()
+            .all()
+        )
+
+    def mark_processed(self) -> None:
+        self.processed_at = datetime.now()
+        self.next_attempt_at = None
+        return
+
+    def mark_failed(self, error: Exception, max_attempts: int, backoff: int) -> None:
+        # Retry with exponential backoff until attempts are exhausted
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.next_attempt_at = None
+        else:
+            delay = backoff * 2 ** (self.attempts - 1)
+            self.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+        return
+
+    def replay(self) -> None:
+        # Queue event to be processed again
+        self.next_attempt_at = datetime.now()
+        self.attempts = 0
+        self.last_error = None
+        return
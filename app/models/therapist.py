@@ -6,16 +6,21 @@ import sqlalchemy.orm as so
 from faker import Faker
 from flask_login import current_user
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.base import ExecutableOption
 
 from app import db
 from app.constants import COUNTRIES, EXAMPLE_THERAPIST_EMAIL
 from app.models import SeedableMixin
+from app.models.appointment import Appointment
+from app.models.client import Client
 from app.models.enums import UserRole
 from app.models.intervention import Intervention
 from app.models.issue import Issue
 from app.models.language import Language
 from app.models.title import Title
 from app.models.user import User
+from app.utils.caching import request_cached_property
 
 
 class Therapist(SeedableMixin, db.Model):
@@ -53,12 +58,16 @@ class Therapist(SeedableMixin, db.Model):
     treatment_plans: so.Mapped[List["TreatmentPlan"]] = so.relationship(
         back_populates="therapist",
     )
+    search: so.Mapped[Optional["TherapistSearch"]] = so.relationship(
+        back_populates="therapist", cascade="all, delete-orphan"
+    )
 
     @property
     def is_current_user(self) -> bool:
-        return current_user.id == self.user.id
+        # Compare foreign key to avoid loading user, unless profile is unsaved
+        return current_user.id == (self.user_id or self.user.id)
 
-    @property
+    @request_cached_property
     def onboarding_complete(self) -> bool:
         return (
             self and self.user.gender and self.titles and self.active_appointment_types
@@ -68,9 +77,56 @@ class Therapist(SeedableMixin, db.Model):
     def active_appointment_types(self) -> List["AppointmentType"]:
         return [at for at in self.appointment_types if at.active]
 
-    @property
-    def clients(self) -> List["Client"]:
-        return [appointment.client for appointment in self.appointments]
+    def client_ids(self) -> Select:
+        # Select IDs of clients with appointments with this therapist, which is
+        # answered from the composite index without reading appointment rows
+        return (
+            db.select(Appointment.client_id).filter_by(therapist_id=self.id).distinct()
+        )
+
+    def clients(self) -> Select:
+        return db.select(Client).where(Client.id.in_(self.client_ids()))
+
+    def has_client(self, client: Optional["Client"]) -> bool:
+        # Check whether therapist has any appointments with this client
+        if client is None:
+            return False
+        return db.session.execute(
+            db.select(
+                sa.exists().where(
+                    Appointment.therapist_id == self.id,
+                    Appointment.client_id == client.id,
+                )
+            )
+        ).scalar()
+
+    @classmethod
+    def lock_schedule(cls, therapist_id: int) -> None:
+        # Serialise changes to a therapist's appointments until the transaction
+        # ends, by locking their row where supported. SQLite only locks whole
+        # databases, so its write lock is taken up front instead of on first
+        # write, unless the transaction has already written.
+        connection = db.session.connection()
+        if connection.dialect.name == "sqlite":
+            if not connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            db.session.execute(
+                db.select(cls.id).filter_by(id=therapist_id).with_for_update()
+            )
+        return
+
+    @classmethod
+    def directory_loader(cls) -> List[ExecutableOption]:
+        # Eagerly load relationships rendered in therapist cards to avoid N+1 queries
+        return [
+            so.joinedload(cls.user),
+            so.selectinload(cls.titles),
+            so.selectinload(cls.languages),
+            so.selectinload(cls.specialisations),
+            so.selectinload(cls.interventions),
+            so.selectinload(cls.appointment_types),
+        ]
 
     @classmethod
     def seed(cls, db: SQLAlchemy, fake: Faker) -> None:
@@ -0,0 +1,134 @@
+from typing import Iterable, Optional
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask_sqlalchemy import SQLAlchemy
+
+from app import db
+from app.models import SeedableMixin
+from app.models.appointment_type import AppointmentType
+from app.models.enums import Gender
+from app.models.therapist import Therapist
+
+
+class TherapistSearch(SeedableMixin, db.Model):
+    therapist_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("therapist.id", ondelete="CASCADE"), primary_key=True
+    )
+    listed: so.Mapped[bool] = so.mapped_column(sa.Boolean, default=False, index=True)
+    name: so.Mapped[str] = so.mapped_column(sa.String(101))
+    gender: so.Mapped[Optional["Gender"]] = so.mapped_column(sa.Enum(Gender))
+    country: so.Mapped[Optional[str]] = so.mapped_column(sa.String(50))
+    years_of_experience: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer)
+
+    # Delimited arrays of values held by the therapist for each filterable facet
+    title_ids: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    language_ids: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    issue_ids: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    intervention_ids: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    therapy_types: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    therapy_modes: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+    durations: so.Mapped[str] = so.mapped_column(sa.Text, default="")
+
+    therapist: so.Mapped["Therapist"] = so.relationship(back_populates="search")
+
+    @staticmethod
+    def to_array(values: Iterable) -> str:
+        return "".join(f"|{value}" for value in sorted(set(map(str, values)))) + "|"
+
+    @classmethod
+    def sync(cls, therapist: Therapist) -> "TherapistSearch":
+        # Flush pending changes and read appointment types back from the database,
+        # as these may have been added via foreign key or hold unconverted enums
+        db.session.flush()
+        appointment_types = db.session.execute(
+            db.select(
+                AppointmentType.therapy_type,
+                AppointmentType.therapy_mode,
+                AppointmentType.duration,
+            ).filter_by(therapist_id=therapist.id, active=True)
+        ).all()
+
+        search = therapist.search or cls(therapist_id=therapist.id)
+        search.listed = bool(therapist.user.active and appointment_types)
+        search.name = therapist.user.search_name
+        search.gender = therapist.user.gender
+        search.country = therapist.country
+        search.years_of_experience = therapist.years_of_experience
+        search.title_ids = cls.to_array(title.id for title in therapist.titles)
+        search.language_ids = cls.to_array(
+            language.id for language in therapist.languages
+        )
+        search.issue_ids = cls.to_array(issue.id for issue in therapist.specialisations)
+        search.intervention_ids = cls.to_array(
+            intervention.id for intervention in therapist.interventions
+        )
+        search.therapy_types = cls.to_array(
+            at.therapy_type.name for at in appointment_types
+        )
+        search.therapy_modes = cls.to_array(
+            at.therapy_mode.name for at in appointment_types
+        )
+        search.durations = cls.to_array(at.duration for at in appointment_types)
+
+        therapist.search = search
+        TherapistSearchVersion.bump()
+        return search
+
+    @classmethod
+    def backfill(cls, batch_size: int = 500) -> int:
+        # Build search data for every therapist in database, committing in batches
+        # ordered by ID, e.g. for therapists created before it was maintained
+        count, last_id = 0, 0
+        while True:
+            therapists = (
+                db.session.execute(
+                    db.select(Therapist)
+                    .where(Therapist.id > last_id)
+                    .order_by(Therapist.id)
+                    .limit(batch_size)
+                )
+                .scalars()
+                .all()
+            )
+            if not therapists:
+                return count
+            for therapist in therapists:
+                cls.sync(therapist)
+            db.session.commit()
+            count += len(therapists)
+            last_id = therapists[-1].id
+
+    @classmethod
+    def seed(cls, db: SQLAlchemy) -> None:
+        cls.backfill()
+        return
+
+
+class TherapistSearchVersion(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    version: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
+
+    @classmethod
+    def current(cls) -> int:
+        return db.session.execute(db.select(cls.version)).scalar() or 0
+
+    @classmethod
+    def bump(cls) -> None:
+        # Increment atomically so concurrent writers each invalidate cached indexes
+        result = db.session.execute(sa.update(cls).values(version=cls.version + 1))
+        if not result.rowcount:
+            db.session.add(cls(id=1, version=1))
+            db.session.flush()
+        return
+
+
+# Deleted therapists must be dropped from cached indexes as well
+@sa.event.listens_for(TherapistSearch, "after_delete")
+def invalidate_deleted_search(mapper, connection, target: TherapistSearch) -> None:
+    connection.execute(
+        sa.update(TherapistSearchVersion).values(
+            version=TherapistSearchVersion.version + 1
+        )
+    )
+    return
@@ -10,6 +10,7 @@ from faker import Faker
 from flask import current_app
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.sql.base import ExecutableOption
 from werkzeug.security import generate_password_hash
 
 from app import db
@@ -17,6 +18,9 @@ from app.constants import (EXAMPLE_CLIENT_EMAIL, EXAMPLE_THERAPIST_EMAIL,
                            EXAMPLE_VALID_PASSWORD)
 from app.models import SeedableMixin
 from app.models.enums import Gender, UserRole
+from app.models.user_name_ngram import UserNameNgram
+from app.utils.caching import request_cached_property
+from app.utils.formatters import normalise_search_text
 
 
 class User(UserMixin, SeedableMixin, db.Model):
@@ -33,6 +37,9 @@ class User(UserMixin, SeedableMixin, db.Model):
     profile_picture: so.Mapped[Optional[str]] = so.mapped_column(
         sa.String(255), default="default.png"
     )
+    search_name: so.Mapped[Optional[str]] = so.mapped_column(sa.String(101), index=True)
+    # Maintained count of unread messages across all conversations
+    unread_message_count: so.Mapped[int] = so.mapped_column(sa.Integer, default=0)
 
     client: so.Mapped[Optional["Client"]] = so.relationship(
         back_populates="user", cascade="all, delete-orphan"
@@ -57,12 +64,118 @@ class User(UserMixin, SeedableMixin, db.Model):
     messages: so.Mapped[Optional["Message"]] = so.relationship(
         back_populates="author", cascade="all, delete-orphan"
     )
+    name_ngrams: so.Mapped[List["UserNameNgram"]] = so.relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
+
+    # Trigram index for substring search on Postgres
+    __table_args__ = (
+        sa.Index(
+            "ix_user_search_name_trgm",
+            "search_name",
+            postgresql_using="gin",
+            postgresql_ops={"search_name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     @property
     def full_name(self) -> str:
         return f"{self.first_name} {self.last_name}"
 
-    @property
+    @so.validates("first_name", "last_name")
+    def validate_name(self, key: str, value: str) -> str:
+        # Keep normalised name used for searching in sync with changes to names
+        first_name = value if key == "first_name" else self.first_name
+        last_name = value if key == "last_name" else self.last_name
+        self.set_search_name(first_name, last_name)
+        return value
+
+    def set_search_name(
+        self, first_name: Optional[str], last_name: Optional[str]
+    ) -> None:
+        self.search_name = normalise_search_text(
+            f"{first_name or ''} {last_name or ''}"
+        )
+        if UserNameNgram.enabled():
+            self.name_ngrams = [
+                UserNameNgram(ngram=ngram)
+                for ngram in UserNameNgram.ngrams(self.search_name)
+            ]
+        return
+
+    @classmethod
+    def backfill_search_names(cls, batch_size: int = 500) -> int:
+        # Derive search names of every user, committing in batches ordered by ID,
+        # e.g. for users created before they were maintained
+        count, last_id = 0, 0
+        while True:
+            users = (
+                db.session.execute(
+                    db.select(cls)
+                    .where(cls.id > last_id)
+                    .order_by(cls.id)
+                    .options(so.selectinload(cls.name_ngrams))
+                    .limit(batch_size)
+                )
+                .scalars()
+                .all()
+            )
+            if not users:
+                return count
+            for user in users:
+                user.set_search_name(user.first_name, user.last_name)
+            db.session.commit()
+            count += len(users)
+            last_id = users[-1].id
+
+    @classmethod
+    def get_with_profile(cls, user_id: int) -> Optional["User"]:
+        # Fetch user with their profile and data needed to check onboarding status
+        return (
+            db.session.execute(
+                db.select(cls).filter_by(id=user_id).options(*cls.profile_loader())
+            )
+            .unique()
+            .scalar_one_or_none()
+        )
+
+    @classmethod
+    def profile_loader(cls) -> List[ExecutableOption]:
+        from app.models.client import Client
+        from app.models.therapist import Therapist
+
+        return [
+            so.joinedload(cls.therapist).joinedload(Therapist.titles),
+            so.joinedload(cls.therapist).joinedload(Therapist.appointment_types),
+            so.joinedload(cls.client).joinedload(Client.issues),
+        ]
+
+    @classmethod
+    def name_matches(cls, term: str) -> sa.ColumnElement:
+        # Match users with names containing the search term
+        term = normalise_search_text(term)
+        condition = cls.search_name.contains(term, autoescape=True)
+        ngrams = UserNameNgram.ngrams(term)
+        if not UserNameNgram.enabled() or not ngrams:
+            return condition
+
+        # Look up users with the rarest trigram of the term, then check the others
+        frequencies = UserNameNgram.frequencies(sorted(ngrams))
+        rarest, *others = sorted(frequencies, key=frequencies.get)
+        if not frequencies[rarest]:
+            return sa.false()
+
+        candidates = db.select(UserNameNgram.user_id).filter_by(ngram=rarest)
+        for ngram in others:
+            other = so.aliased(UserNameNgram)
+            candidates = candidates.where(
+                sa.exists().where(
+                    other.ngram == ngram, other.user_id == UserNameNgram.user_id
+                )
+            )
+        return sa.and_(cls.id.in_(candidates), condition)
+
+    @request_cached_property
     def onboarding_complete(self) -> bool:
         if self.role == UserRole.THERAPIST:
             return self.therapist and self.therapist.onboarding_complete
@@ -170,3 +283,11 @@ class User(UserMixin, SeedableMixin, db.Model):
         db.session.add_all(fake_users)
         db.session.commit()
         return
+
+
+# Enable trigram operators required by search name index on Postgres
+sa.event.listen(
+    User.__table__,
+    "before_create",
+    sa.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
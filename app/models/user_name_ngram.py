@@ -0,0 +1,43 @@
+from typing import Dict, List, Set
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+
+NGRAM_LENGTH = 3
+
+
+class UserNameNgram(db.Model):
+    # Trigrams of each user's search name, allowing substring search to use an
+    # index on databases without native trigram support (i.e. SQLite)
+    ngram: so.Mapped[str] = so.mapped_column(sa.String(NGRAM_LENGTH), primary_key=True)
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+    user: so.Mapped["User"] = so.relationship(back_populates="name_ngrams")
+
+    @staticmethod
+    def enabled() -> bool:
+        # Postgres uses a trigram index on the search name column instead
+        return db.engine.dialect.name != "postgresql"
+
+    @staticmethod
+    def ngrams(text: str) -> Set[str]:
+        shifted = [text[i:] for i in range(NGRAM_LENGTH)]
+        return {"".join(chars) for chars in zip(*shifted)}
+
+    @classmethod
+    def frequencies(cls, ngrams: List[str], limit: int = 1000) -> Dict[str, int]:
+        # Count users with each trigram in one query, stopping at limit so that
+        # common trigrams are cheap to count
+        counts = [
+            db.select(sa.func.count())
+            .select_from(
+                db.select(cls.user_id).filter_by(ngram=ngram).limit(limit).subquery()
+            )
+            .scalar_subquery()
+            for ngram in ngrams
+        ]
+        return dict(zip(ngrams, db.session.execute(db.select(*counts)).one()))
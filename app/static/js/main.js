@@ -119,6 +119,7 @@ $(document).ready(function() {
 
         var messagesContainer = $(target).find('.messages-container');
         messagesContainer.scrollTop(messagesContainer.prop('scrollHeight'));
+        markConversationRead($(target));
 
         // Update the URL query string with the new section
         var newUrl = window.location.protocol + "//" + window.location.host + window.location.pathname + '?section=' + target.substring(1);
@@ -142,10 +143,11 @@ $(document).ready(function() {
     });
 
     
-    // Set scroll position to bottom for messages
+    // Set scroll position to bottom for messages, then load history on scroll
     $(window).on('load', function() {
         var messagesContainer = $('.messages-container');
         messagesContainer.scrollTop(messagesContainer.prop('scrollHeight'));
+        registerMessageHistory();
     });
     
 
@@ -212,6 +214,18 @@ $(document).ready(function() {
 
     // Register submission handlers for all forms using AJAX
     registerFormHandlers();
+
+
+    // Load further pages of paginated listings when scrolled into view
+    registerInfiniteScroll();
+
+
+    // Receive new messages in real time while on messages page
+    registerMessageStream();
+
+
+    // Suggest open slots when booking an appointment
+    registerAvailability();
  
     
     // Set the delete modal's hidden field with the correct appointment type id
@@ -345,6 +359,16 @@ function registerFormHandlers() {
                             $('#' + target).html(response.update_targets[target]);
                         }
                     }
+
+                    if (response.reset_form) { // Clear form for next submission
+                        form[0].reset();
+                    }
+
+                    if ('next_cursor' in response) { // Reset pagination for new filter results
+                        var sentinel = $('.infinite-scroll[data-form="' + formId + '"]');
+                        sentinel.data('form-data', form.serialize());
+                        updateNextCursor(sentinel, response.next_cursor);
+                    }
                 } else if (response.errors) { // Display form errors
                     var formPrefix = response.form_prefix ? response.form_prefix + "-" : "";
                     displayFormErrors(formId, formPrefix, response.errors);
@@ -365,6 +389,279 @@ function registerFormHandlers() {
     });
 }
 
+// Fetches the next page of a listing when its sentinel element becomes visible
+function registerInfiniteScroll() {
+
+    $('.infinite-scroll').each(function() {
+        var sentinel = $(this);
+        var form = $('#' + sentinel.data('form'));
+
+        // Store filters used for the current results to request further pages with
+        sentinel.data('form-data', form.serialize());
+
+        var observer = new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting) {
+                loadNextPage(sentinel);
+            }
+        });
+        sentinel.data('observer', observer);
+        observer.observe(this);
+    });
+}
+
+function loadNextPage(sentinel) {
+
+    var cursor = sentinel.attr('data-cursor');
+    var form = $('#' + sentinel.data('form'));
+
+    // Do nothing if there are no more pages or a page is already loading
+    if (!cursor || sentinel.data('loading')) {
+        return;
+    }
+    sentinel.data('loading', true);
+
+    $.ajax({
+        url: form.attr('action'),
+        type: 'POST',
+        data: sentinel.data('form-data') + '&' + $.param({submit: 'filter', cursor: cursor}),
+        success: function(response) {
+            if (response.success && response.append_targets) { // Append new HTML to elements
+                for (var target in response.append_targets) {
+                    $('#' + target).append(response.append_targets[target]);
+                }
+            }
+            sentinel.data('loading', false);
+            updateNextCursor(sentinel, response.next_cursor);
+        },
+        error: function() {
+            sentinel.data('loading', false);
+        }
+    });
+}
+
+function updateNextCursor(sentinel, cursor) {
+
+    sentinel.attr('data-cursor', cursor || '');
+
+    // Re-observe sentinel to load another page if it is still visible
+    var observer = sentinel.data('observer');
+    if (observer) {
+        observer.unobserve(sentinel[0]);
+        observer.observe(sentinel[0]);
+    }
+}
+
+// Fetches earlier messages of a conversation when the top of its history becomes
+// visible, or its latest messages when it is first displayed
+function registerMessageHistory() {
+
+    $('.message-history').each(function() {
+        var sentinel = $(this);
+
+        var observer = new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting) {
+                loadMessageHistory(sentinel);
+            }
+        });
+        sentinel.data('observer', observer);
+        observer.observe(this);
+    });
+}
+
+function loadMessageHistory(sentinel) {
+
+    var cursor = sentinel.attr('data-cursor');
+    var loaded = sentinel.attr('data-loaded') === 'true';
+
+    // Do nothing if there are no earlier messages or a page is already loading
+    if ((loaded && !cursor) || sentinel.data('loading')) {
+        return;
+    }
+    sentinel.data('loading', true);
+
+    var messagesContainer = sentinel.closest('.messages-container');
+
+    $.ajax({
+        url: sentinel.data('url'),
+        type: 'GET',
+        data: cursor ? {before: cursor} : {},
+        success: function(response) {
+            if (response.success && response.prepend_targets) { // Prepend new HTML to elements
+                var previousHeight = messagesContainer.prop('scrollHeight');
+                for (var target in response.prepend_targets) {
+                    $('#' + target).prepend(response.prepend_targets[target]);
+                    updateReadReceipt($('#' + target));
+                }
+
+                // Keep previously displayed messages in place, or scroll to latest message
+                if (loaded) {
+                    messagesContainer.scrollTop(
+                        messagesContainer.scrollTop() + messagesContainer.prop('scrollHeight') - previousHeight
+                    );
+                } else {
+                    messagesContainer.scrollTop(messagesContainer.prop('scrollHeight'));
+                }
+            }
+            sentinel.attr('data-loaded', 'true');
+            sentinel.data('loading', false);
+            updateNextCursor(sentinel, response.next_cursor);
+        },
+        error: function() {
+            sentinel.data('loading', false);
+        }
+    });
+}
+
+// Displays messages published to the current user as they are sent
+function registerMessageStream() {
+
+    var container = $('#conversation-container');
+    if (!container.length || !window.EventSource) {
+        return;
+    }
+
+    // Mark conversation displayed initially as read
+    markConversationRead($('.section:visible'));
+
+    var source = new EventSource(container.data('stream-url'));
+    source.addEventListener('read', function(event) {
+        var data = JSON.parse(event.data);
+        var messages = $('#messages-' + data.conversation_id);
+        messages.attr('data-other-last-read', data.message_id);
+        updateReadReceipt(messages);
+    });
+    source.addEventListener('message', function(event) {
+        var data = JSON.parse(event.data);
+        var item = $('#section-selector .list-group-item[data-target="#' + data.conversation_id + '"]');
+
+        // Reload to display conversations started since page was loaded
+        if (!item.length) {
+            window.location.reload();
+            return;
+        }
+
+        // Move conversation to top of selector with its latest message
+        item.find('.latest-message-content').text(
+            data.content.length > 25 ? data.content.substring(0, 22) + '...' : data.content
+        );
+        item.find('.time-since-latest-message').text(data.time_since);
+        item.parent().prepend(item);
+
+        // Mark message as read if its conversation is displayed, otherwise count it
+        var section = $('#' + data.conversation_id);
+        if (data.author_id != container.data('user-id')) {
+            if (section.is(':visible')) {
+                markConversationRead(section);
+            } else {
+                updateUnreadCounts(item, parseInt(item.find('.unread-count').text()) + 1, parseInt($('#unread-message-count').text()) + 1);
+            }
+        }
+
+        // Append message to conversation if its messages have been loaded
+        var sentinel = $('.message-history[data-target="messages-' + data.conversation_id + '"]');
+        var messages = $('#messages-' + data.conversation_id);
+        if (sentinel.attr('data-loaded') !== 'true' || messages.find('[data-message-id="' + data.message_id + '"]').length) {
+            return;
+        }
+        var message = $('<div class="message p-2 mb-1" data-bs-toggle="tooltip" data-bs-placement="bottom" data-bs-custom-class="my-tooltip"></div>')
+            .addClass(data.author_id == container.data('user-id') ? 'from_current_user' : 'from_other_user')
+            .attr('data-message-id', data.message_id)
+            .attr('data-bs-title', data.timestamp)
+            .text(data.content);
+        messages.append(message);
+        updateReadReceipt(messages);
+
+        var messagesContainer = messages.closest('.messages-container');
+        messagesContainer.scrollTop(messagesContainer.prop('scrollHeight'));
+    });
+}
+
+// Marks latest message of a displayed conversation as read
+function markConversationRead(section) {
+
+    var messages = section.find('[data-read-url]');
+    if (!messages.length) {
+        return;
+    }
+
+    $.ajax({
+        url: messages.data('read-url'),
+        type: 'POST',
+        success: function(response) {
+            if (response.success) {
+                var item = $('#section-selector .list-group-item[data-target="#' + section.attr('id') + '"]');
+                updateUnreadCounts(item, response.unread_count, response.unread_message_count);
+            }
+        }
+    });
+}
+
+function updateUnreadCounts(item, conversationCount, totalCount) {
+
+    // Hide badges when there are no unread messages
+    item.find('.unread-count').text(conversationCount).toggleClass('hidden', !conversationCount);
+    $('#unread-message-count').text(totalCount).toggleClass('hidden', !totalCount);
+}
+
+// Displays read receipt below latest message of current user read by other user
+function updateReadReceipt(messages) {
+
+    messages.find('.read-receipt').remove();
+
+    var lastRead = parseInt(messages.attr('data-other-last-read'));
+    var latest = messages.find('.from_current_user').last();
+    if (latest.length && latest.data('message-id') <= lastRead) {
+        latest.after('<div class="read-receipt my-muted text-s">Seen</div>');
+    }
+}
+
+// Fetches open slots for the selected appointment type, limiting the date field
+// to days from the first open slot and suggesting open times for the selected
+// date. Dates after the last day of offered slots are checked when booking.
+function registerAvailability() {
+
+    $('form[data-availability-url]').each(function() {
+        var form = $(this);
+        var slots = {};
+        var lastDate = '';
+
+        function showAvailableTimes() {
+            var date = form.find('[name="date"]').val();
+            var times = slots[date] || [];
+            $('#available-times').html(times.map(function(time) {
+                return $('<option>').val(time);
+            }));
+            $('#availability-hint').toggleClass('hidden', !date || date > lastDate || times.length > 0);
+        }
+
+        form.find('[name="appointment_type"]').change(function() {
+            slots = {};
+            lastDate = '';
+            showAvailableTimes();
+            if (!$(this).val()) {
+                return;
+            }
+
+            $.ajax({
+                url: form.data('availability-url'),
+                type: 'GET',
+                data: {appointment_type: $(this).val()},
+                success: function(response) {
+                    if (response.success) {
+                        slots = response.slots;
+                        var dates = Object.keys(slots);
+                        lastDate = dates[dates.length - 1] || '';
+                        form.find('[name="date"]').attr({min: dates[0]});
+                        showAvailableTimes();
+                    }
+                }
+            });
+        });
+
+        form.find('[name="date"]').change(showAvailableTimes);
+    });
+}
+
 function displayFormErrors(formId, formPrefix, errors) {
     
     var newErrorMessages = {};
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import List, Optional
+
+from flask import current_app
+
+from app import availability_index, db
+from app.models.appointment import Appointment
+from app.models.appointment_series import AppointmentSeries
+from app.models.enums import AppointmentStatus, EmailSubject, PaymentStatus
+from app.models.therapist import Therapist
+from app.utils.availability import BusyIntervals
+from app.utils.mail import (send_appointments_update_email,
+                            send_series_booked_email)
+
+
+# Store occurrences of series which are open as appointments, checking all of them
+# against therapist's appointments in one query and inserting them in one
+# statement. Callers must hold therapist's schedule lock.
+def book_occurrences(
+    series: AppointmentSeries, times: List[datetime]
+) -> List[Appointment]:
+    now = datetime.now()
+    if not times:
+        series.is_active = series.has_more_occurrences(now)
+        return []
+
+    duration = timedelta(minutes=series.appointment_type.duration)
+    availability = availability_index.get(series.therapist_id)
+    busy = BusyIntervals()
+    for interval in Appointment.busy_intervals(
+        series.therapist_id, times[0], times[-1] + duration
+    ):
+        busy.add(*interval)
+
+    open_times = [
+        time
+        for time in times
+        if availability.within_hours(time, time + duration)
+        and not busy.overlaps(time, time + duration, now)
+    ]
+    # Occurrences paid via Stripe are held until a deadline ahead of them, after
+    # which they are released if unpaid as appointments awaiting checkout are
+    hold_ttl = timedelta(seconds=current_app.config["APPOINTMENT_HOLD_TTL"])
+    notice = timedelta(seconds=current_app.config["APPOINTMENT_SERIES_PAYMENT_NOTICE"])
+
+    def hold_expires_at(time: datetime) -> Optional[datetime]:
+        if not series.therapist.stripe_account_id:
+            return None
+        return max(time - notice, now + hold_ttl)
+
+    booked = []
+    if open_times:
+        booked = db.session.scalars(
+            db.insert(Appointment).returning(Appointment),
+            [
+                {
+                    "therapist_id": series.therapist_id,
+                    "client_id": series.client_id,
+                    "appointment_type_id": series.appointment_type_id,
+                    "series_id": series.id,
+                    "time": time,
+                    "appointment_status": AppointmentStatus.SCHEDULED,
+                    "payment_status": PaymentStatus.PENDING,
+                    "hold_expires_at": hold_expires_at(time),
+                }
+                for time in open_times
+            ],
+        ).all()
+
+        # Bulk inserts bypass the session's record of changed appointments, so
+        # have therapist's availability reloaded once committed
+        db.session.info.setdefault("availability_therapist_ids", set()).add(
+            series.therapist_id
+        )
+
+    series.generated_until = times[-1]
+    series.is_active = series.has_more_occurrences(now)
+    return booked
+
+
+# Store the next occurrences of active series, committing each series while
+# holding its therapist's schedule lock. Clients are emailed about occurrences
+# booked, and any which could not be as their therapist was unavailable.
+def book_due_occurrences() -> int:
+    ahead = current_app.config["APPOINTMENT_SERIES_AHEAD"]
+
+    booked = 0
+    series_ids = (
+        db.session.execute(db.select(AppointmentSeries.id).filter_by(is_active=True))
+        .scalars()
+        .all()
+    )
+    for series_id in series_ids:
+        series = db.session.get(AppointmentSeries, series_id)
+        Therapist.lock_schedule(series.therapist_id)
+        times = series.due_occurrences(ahead, datetime.now())
+        appointments = book_occurrences(series, times)
+        booked_times = {appointment.time for appointment in appointments}
+        skipped_times = [time for time in times if time not in booked_times]
+        if appointments or skipped_times:
+            send_series_booked_email(series, appointments, skipped_times)
+        booked += len(appointments)
+        db.session.commit()
+    return booked
+
+
+# Cancel appointments whose hold expired before they were paid for, emailing
+# clients once for each series about its occurrences released
+def release_expired_holds() -> int:
+    released_ids = Appointment.release_expired_holds()
+    if not released_ids:
+        return 0
+
+    occurrences = (
+        db.session.execute(
+            db.select(Appointment)
+            .where(
+                Appointment.id.in_(released_ids),
+                Appointment.series_id.is_not(None),
+            )
+            .order_by(Appointment.series_id, Appointment.time)
+        )
+        .scalars()
+        .all()
+    )
+    for _, group in groupby(occurrences, key=lambda appointment: appointment.series_id):
+        appointments = list(group)
+        send_appointments_update_email(
+            appointments=appointments,
+            recipient=appointments[0].client.user,
+            subject=EmailSubject.SERIES_RELEASED_CLIENT,
+        )
+    return len(released_ids)
+
+
+# Stop booking occurrences of series and cancel its upcoming appointments in one
+# statement, returning those cancelled. Callers must hold therapist's schedule
+# lock.
+def end_series(series: AppointmentSeries) -> List[Appointment]:
+    now = datetime.now()
+    series.until = now
+    series.is_active = False
+
+    upcoming = (
+        db.session.execute(
+            db.select(Appointment).where(
+                Appointment.series_id == series.id,
+                Appointment.time > now,
+                Appointment.appointment_status.not_in(
+                    [
+                        AppointmentStatus.COMPLETED,
+                        AppointmentStatus.CANCELLED,
+                        AppointmentStatus.NO_SHOW,
+                    ]
+                ),
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if upcoming:
+        Appointment.bulk_update_status(
+            series.therapist_id,
+            [appointment.id for appointment in upcoming],
+            AppointmentStatus.CANCELLED,
+        )
+    return upcoming
@@ -0,0 +1,328 @@
+import time as timer
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import Flask, current_app, has_app_context
+
+from app import db
+
+Interval = Tuple[datetime, datetime]
+
+
+class BusyIntervals:
+    # Busy intervals of a therapist kept as parallel arrays sorted by start,
+    # along with when held intervals expire. Intervals may overlap, so the
+    # longest interval bounds how far before a query an overlapping interval can
+    # start.
+    def __init__(self) -> None:
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        self.expires: List[Optional[datetime]] = []
+        self.max_length = timedelta(0)
+
+    def add(
+        self, start: datetime, end: datetime, expires: Optional[datetime] = None
+    ) -> None:
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.expires.insert(i, expires)
+        self.max_length = max(self.max_length, end - start)
+        return
+
+    def remove(self, start: datetime, end: datetime) -> None:
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ends[i] == end:
+                del self.starts[i], self.ends[i], self.expires[i]
+                return
+            i += 1
+        return
+
+    def overlaps(
+        self,
+        start: datetime,
+        end: datetime,
+        now: datetime,
+        ignore: Optional[Interval] = None,
+    ) -> bool:
+        # Whether interval overlaps busy intervals other than expired holds
+        lo = bisect_right(self.starts, start - self.max_length)
+        hi = bisect_left(self.starts, end)
+        for i in range(lo, hi):
+            if self.ends[i] > start and (not self.expires[i] or self.expires[i] > now):
+                if ignore == (self.starts[i], self.ends[i]):
+                    ignore = None
+                    continue
+                return True
+        return False
+
+
+def subtract_interval(windows: List[Interval], start: datetime, end: datetime):
+    # Remove an interval from a list of disjoint windows
+    result = []
+    for window_start, window_end in windows:
+        if end <= window_start or start >= window_end:
+            result.append((window_start, window_end))
+            continue
+        if window_start < start:
+            result.append((window_start, start))
+        if end < window_end:
+            result.append((end, window_end))
+    return result
+
+
+class TherapistAvailability:
+    # Working hours, exceptions and busy intervals of one therapist, from which
+    # open slots are computed in memory
+    def __init__(
+        self,
+        working_hours: Dict[int, List[Tuple[time, time]]],
+        exceptions: List[Tuple[datetime, datetime, bool]],
+    ) -> None:
+        self.working_hours = working_hours
+        self.exceptions = exceptions
+        self.busy = BusyIntervals()
+        self.appointments: Dict[int, Interval] = {}
+        self.loaded_at = timer.monotonic()
+
+    @classmethod
+    def load(cls, therapist_id: int, since: datetime) -> "TherapistAvailability":
+        from app.models.appointment import Appointment
+        from app.models.appointment_type import AppointmentType
+        from app.models.availability import AvailabilityException, WorkingHours
+
+        working_hours = {}
+        for hours in db.session.execute(
+            db.select(WorkingHours).filter_by(therapist_id=therapist_id)
+        ).scalars():
+            working_hours.setdefault(hours.weekday, []).append(
+                (hours.start_time, hours.end_time)
+            )
+
+        exceptions = [
+            (exception.start, exception.end, exception.is_available)
+            for exception in db.session.execute(
+                db.select(AvailabilityException).where(
+                    AvailabilityException.therapist_id == therapist_id,
+                    AvailabilityException.end > since,
+                )
+            ).scalars()
+        ]
+        availability = cls(working_hours, exceptions)
+
+        # Load upcoming appointments with their durations in one query
+        for appointment_id, start, duration, expires in db.session.execute(
+            db.select(
+                Appointment.id,
+                Appointment.time,
+                AppointmentType.duration,
+                Appointment.hold_expires_at,
+            )
+            .join(Appointment.appointment_type)
+            .where(
+                Appointment.therapist_id == therapist_id,
+                Appointment.time > since - timedelta(days=1),
+                Appointment.is_busy,
+            )
+        ):
+            availability.set_appointment(
+                appointment_id, (start, start + timedelta(minutes=duration)), expires
+            )
+        return availability
+
+    def set_appointment(
+        self,
+        appointment_id: int,
+        interval: Optional[Interval],
+        expires: Optional[datetime] = None,
+    ) -> None:
+        # Replace appointment's busy interval, if any, removing it if no longer busy
+        previous = self.appointments.pop(appointment_id, None)
+        if previous:
+            self.busy.remove(*previous)
+        if interval:
+            self.appointments[appointment_id] = interval
+            self.busy.add(*interval, expires)
+        return
+
+    def windows(self, day: date) -> List[Interval]:
+        # Bookable windows on a day, from working hours adjusted by exceptions.
+        # Therapists who have not set working hours can be booked at any time.
+        day_start = datetime.combine(day, time())
+        day_end = day_start + timedelta(days=1)
+        if not self.working_hours:
+            windows = [(day_start, day_end)]
+        else:
+            windows = [
+                (datetime.combine(day, start), datetime.combine(day, end))
+                for start, end in sorted(self.working_hours.get(day.weekday(), []))
+            ]
+        for start, end, is_available in self.exceptions:
+            if end <= day_start or start >= day_end:
+                continue
+            start, end = max(start, day_start), min(end, day_end)
+            windows = subtract_interval(windows, start, end)
+            if is_available:
+                windows = sorted(windows + [(start, end)])
+        return windows
+
+    def within_hours(self, start: datetime, end: datetime) -> bool:
+        return any(
+            window_start <= start and end <= window_end
+            for window_start, window_end in self.windows(start.date())
+        )
+
+    def is_open(
+        self,
+        start: datetime,
+        duration: timedelta,
+        appointment_id: Optional[int] = None,
+    ) -> bool:
+        # Whether slot is within bookable hours and free, ignoring the existing
+        # interval of an appointment being moved
+        end = start + duration
+        if not self.within_hours(start, end):
+            return False
+        return not self.busy.overlaps(
+            start, end, datetime.now(), ignore=self.appointments.get(appointment_id)
+        )
+
+    def open_slots(
+        self, duration: timedelta, start: datetime, end: datetime, step: timedelta
+    ) -> List[datetime]:
+        # Slots starting between start and end
+        now = datetime.now()
+        slots = []
+        for offset in range((end.date() - start.date()).days + 1):
+            for window_start, window_end in self.windows(
+                start.date() + timedelta(offset)
+            ):
+                # Skip slots which have passed, keeping slots aligned to steps
+                # from start of window
+                slot = window_start
+                if slot < start:
+                    slot += -((slot - start) // step) * step
+                while slot + duration <= window_end and slot <= end:
+                    if not self.busy.overlaps(slot, slot + duration, now):
+                        slots.append(slot)
+                    slot += step
+        return slots
+
+
+class AvailabilityIndex:
+    # Per-process index of therapists' availability, loaded on first use and
+    # kept up to date incrementally as appointments committed in this process
+    # change. Entries are reloaded after a short time to pick up changes made by
+    # other processes.
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.entries: Dict[int, TherapistAvailability] = {}
+        self.lock = Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.ttl = app.config["AVAILABILITY_TTL"]
+        self.days = app.config["AVAILABILITY_DAYS"]
+        self.step = timedelta(minutes=app.config["AVAILABILITY_SLOT_STEP"])
+        app.extensions["availability"] = self
+        return
+
+    def get(self, therapist_id: int) -> TherapistAvailability:
+        with self.lock:
+            availability = self.entries.get(therapist_id)
+        if availability and timer.monotonic() - availability.loaded_at < self.ttl:
+            return availability
+
+        availability = TherapistAvailability.load(therapist_id, datetime.now())
+        with self.lock:
+            self.entries[therapist_id] = availability
+        return availability
+
+    def open_slots(self, therapist_id: int, duration: int) -> List[datetime]:
+        # Open slots from now until the end of the booking window
+        now = datetime.now().replace(second=0, microsecond=0)
+        return self.get(therapist_id).open_slots(
+            timedelta(minutes=duration), now, now + timedelta(self.days), self.step
+        )
+
+    def is_open(
+        self,
+        therapist_id: int,
+        start: datetime,
+        duration: int,
+        appointment_id: Optional[int] = None,
+    ) -> bool:
+        # Entries hold all upcoming appointments and exceptions, so times beyond
+        # the window of offered slots are checked the same way
+        if start < datetime.now():
+            return False
+        return self.get(therapist_id).is_open(
+            start, timedelta(minutes=duration), appointment_id
+        )
+
+    def update_appointments(
+        self,
+        changes: Dict[int, Tuple[int, Optional[Interval], Optional[datetime]]],
+    ) -> None:
+        with self.lock:
+            for appointment_id, (therapist_id, interval, expires) in changes.items():
+                if therapist_id in self.entries:
+                    self.entries[therapist_id].set_appointment(
+                        appointment_id, interval, expires
+                    )
+        return
+
+    def invalidate(self, therapist_id: int) -> None:
+        with self.lock:
+            self.entries.pop(therapist_id, None)
+        return
+
+
+# Record busy intervals of changed appointments, and therapists whose hours have
+# changed, which are applied to the index once changes are committed
+@sa.event.listens_for(so.Session, "after_flush")
+def collect_availability_changes(session: so.Session, flush_context) -> None:
+    from app.models.appointment import Appointment
+    from app.models.appointment_type import AppointmentType
+    from app.models.availability import AvailabilityException, WorkingHours
+
+    changes = session.info.setdefault("availability_changes", {})
+    therapist_ids = session.info.setdefault("availability_therapist_ids", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Appointment):
+            interval = None
+            if obj not in session.deleted and obj.is_busy:
+                with session.no_autoflush:
+                    duration = session.get(
+                        AppointmentType, obj.appointment_type_id
+                    ).duration
+                interval = (obj.time, obj.time + timedelta(minutes=duration))
+            changes[obj.id] = (obj.therapist_id, interval, obj.hold_expires_at)
+        elif isinstance(obj, (WorkingHours, AvailabilityException)):
+            therapist_ids.add(obj.therapist_id)
+    return
+
+
+@sa.event.listens_for(so.Session, "after_commit")
+def apply_availability_changes(session: so.Session) -> None:
+    changes = session.info.pop("availability_changes", {})
+    therapist_ids = session.info.pop("availability_therapist_ids", set())
+    if has_app_context() and "availability" in current_app.extensions:
+        index = current_app.extensions["availability"]
+        index.update_appointments(changes)
+        for therapist_id in therapist_ids:
+            index.invalidate(therapist_id)
+    return
+
+
+@sa.event.listens_for(so.Session, "after_rollback")
+def discard_availability_changes(session: so.Session) -> None:
+    session.info.pop("availability_changes", None)
+    session.info.pop("availability_therapist_ids", None)
+    return
@@ -0,0 +1,193 @@
+import pickle
+import time
+from collections import OrderedDict
+from functools import wraps
+from itertools import chain
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import (Flask, current_app, has_app_context, has_request_context,
+                   request)
+
+from app import db
+
+
+def request_cached_property(f: Callable[[Any], Any]) -> property:
+    # Property evaluated at most once per request for each persisted instance,
+    # stored on the request so values never outlive it
+    @wraps(f)
+    def wrapper(self) -> Any:
+        if not has_request_context() or self.id is None:
+            return f(self)
+
+        cache = getattr(request, "cached_properties", None)
+        if cache is None:
+            cache = request.cached_properties = {}
+
+        key = (type(self).__name__, self.id, f.__name__)
+        if key not in cache:
+            cache[key] = f(self)
+        return cache[key]
+
+    return property(wrapper)
+
+
+class MemoryBackend:
+    # In-process LRU cache with per-entry expiry, plus counters which are never
+    # evicted so that a version cannot silently reset to an earlier value
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.counters: Dict[str, int] = {}
+        self.lock = Lock()
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        values = []
+        with self.lock:
+            for key in keys:
+                if key in self.counters:
+                    values.append(self.counters[key])
+                    continue
+
+                value, expires_at = self.entries.get(key, (None, 0))
+                if expires_at < time.monotonic():
+                    self.entries.pop(key, None)
+                    value = None
+                else:
+                    self.entries.move_to_end(key)
+                values.append(value)
+        return values
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+
+class RedisBackend:
+    def __init__(self, url: str) -> None:
+        self.redis = redis.Redis.from_url(url)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return self.redis.mget(keys)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.redis.set(key, value, ex=ttl)
+        return
+
+    def incr(self, key: str) -> int:
+        return self.redis.incr(key)
+
+
+class UserCache:
+    # Optional cache of users loaded for each request, along with their eagerly
+    # loaded profiles. Entries are tagged with a per-user version which is bumped
+    # whenever the user or their profile changes, invalidating older entries.
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.backend = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        backend = app.config.get("USER_CACHE_BACKEND")
+        if backend == "memory":
+            self.backend = MemoryBackend(app.config["USER_CACHE_SIZE"])
+        elif backend == "redis":
+            self.backend = RedisBackend(app.config["CELERY"]["broker_url"])
+        else:
+            self.backend = None
+        self.ttl = app.config["USER_CACHE_TTL"]
+        app.extensions["user_cache"] = self
+        return
+
+    def load(
+        self, user_id: int, query: Callable[[int], Optional[Any]]
+    ) -> Optional[Any]:
+        if not self.backend:
+            return query(user_id)
+
+        # Read version before querying so that entries built from data changed
+        # concurrently are stored under an outdated version
+        version, data = self.backend.get_many(
+            [f"user:{user_id}:version", f"user:{user_id}:data"]
+        )
+        version = int(version or 0)
+        if data:
+            cached_version, user = pickle.loads(data)
+            if cached_version == version:
+                return db.session.merge(user, load=False)
+
+        user = query(user_id)
+        if user:
+            self.backend.set(
+                f"user:{user_id}:data", pickle.dumps((version, user)), self.ttl
+            )
+        return user
+
+    def invalidate(self, user_id: int) -> None:
+        if self.backend:
+            self.backend.incr(f"user:{user_id}:version")
+        return
+
+
+def get_cached_user_id(obj: Any) -> Optional[int]:
+    # Return ID of user whose cached data includes this object, if any
+    from app.models.appointment_type import AppointmentType
+    from app.models.client import Client
+    from app.models.therapist import Therapist
+    from app.models.user import User
+
+    if isinstance(obj, User):
+        return obj.id
+    elif isinstance(obj, (Therapist, Client)):
+        return obj.user_id
+    elif isinstance(obj, AppointmentType) and obj.therapist:
+        return obj.therapist.user_id
+    return None
+
+
+def mark_user_changed(user_id: int) -> None:
+    # Invalidate user's cached data once committed, for changes made outside the
+    # unit of work (e.g. with UPDATE statements)
+    db.session.info.setdefault("changed_user_ids", set()).add(user_id)
+    return
+
+
+# Record users with changed data, which are invalidated once changes are committed
+@sa.event.listens_for(so.Session, "after_flush")
+def collect_changed_users(session: so.Session, flush_context) -> None:
+    user_ids = session.info.setdefault("changed_user_ids", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        user_ids.add(get_cached_user_id(obj))
+    user_ids.discard(None)
+    return
+
+
+@sa.event.listens_for(so.Session, "after_commit")
+def invalidate_changed_users(session: so.Session) -> None:
+    # Discard cached properties as they may be outdated
+    if has_request_context():
+        request.cached_properties = {}
+
+    user_ids = session.info.pop("changed_user_ids", set())
+    if has_app_context() and "user_cache" in current_app.extensions:
+        for user_id in user_ids:
+            current_app.extensions["user_cache"].invalidate(user_id)
+    return
+
+
+@sa.event.listens_for(so.Session, "after_rollback")
+def discard_changed_users(session: so.Session) -> None:
+    session.info.pop("changed_user_ids", None)
+    return
@@ -1,9 +1,5 @@
-from typing import List
-
 from celery import Celery, Task, shared_task
-from flask import Flask, current_app
-
-from app import mail
+from flask import Flask
 
 
 def celery_init_app(app: Flask) -> Celery:
@@ -18,11 +14,33 @@ def celery_init_app(app: Flask) -> Celery:
     return celery_app
 
 
-@shared_task
-def send_async_email(subject: str, recipients: List[str], html: str) -> None:
-    with current_app.app_context():
-        from app.utils.mail import prepare_message
+@shared_task(ignore_result=True)
+def drain_email_outbox() -> int:
+    from app.utils.mail import drain_outbox
+
+    return drain_outbox()
+
+
+@shared_task(ignore_result=True)
+def process_stripe_events() -> int:
+    from app.utils.stripe_events import process_events
+
+    return process_events()
+
+
+@shared_task(ignore_result=True)
+def release_expired_holds() -> int:
+    from app import db
+    from app.utils.appointment_series import \
+        release_expired_holds as release_holds
+
+    released = release_holds()
+    db.session.commit()
+    return released
+
+
+@shared_task(ignore_result=True)
+def book_series_occurrences() -> int:
+    from app.utils.appointment_series import book_due_occurrences
 
-        message = prepare_message(subject, recipients, html)
-        mail.send(message)
-    return
+    return book_due_occurrences()
@@ -0,0 +1,115 @@
+import json
+import queue
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, Optional, Set
+
+import redis
+from flask import Flask
+
+
+class MemorySubscription:
+    def __init__(self, broker: "MemoryBroker", channel: str) -> None:
+        self.broker = broker
+        self.channel = channel
+        self.queue: "queue.Queue[str]" = queue.Queue()
+
+    def get(self, timeout: float) -> Optional[str]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+        return
+
+
+class MemoryBroker:
+    # In-process fan-out of events to subscribers, only reaching subscribers in
+    # the same process (e.g. in tests or with the development server)
+    def __init__(self) -> None:
+        self.subscriptions: Dict[str, Set[MemorySubscription]] = defaultdict(set)
+        self.lock = Lock()
+
+    def publish(self, channel: str, data: str) -> None:
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.queue.put(data)
+        return
+
+    def subscribe(self, channel: str) -> MemorySubscription:
+        subscription = MemorySubscription(self, channel)
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: MemorySubscription) -> None:
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+        return
+
+
+class RedisSubscription:
+    def __init__(self, pubsub: redis.client.PubSub) -> None:
+        self.pubsub = pubsub
+
+    def get(self, timeout: float) -> Optional[str]:
+        message = self.pubsub.get_message(
+            ignore_subscribe_messages=True, timeout=timeout
+        )
+        return message["data"].decode() if message else None
+
+    def close(self) -> None:
+        self.pubsub.close()
+        return
+
+
+class RedisBroker:
+    # Fan-out through Redis pub/sub, reaching subscribers in every process
+    def __init__(self, url: str) -> None:
+        self.redis = redis.Redis.from_url(url)
+
+    def publish(self, channel: str, data: str) -> None:
+        self.redis.publish(channel, data)
+        return
+
+    def subscribe(self, channel: str) -> RedisSubscription:
+        pubsub = self.redis.pubsub()
+        pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+
+class EventBroker:
+    # Publishes events to each user's channel, which are streamed to their open
+    # pages as server-sent events
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.backend = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        if app.config["EVENT_BROKER"] == "redis":
+            self.backend = RedisBroker(app.config["CELERY"]["broker_url"])
+        else:
+            self.backend = MemoryBroker()
+        self.heartbeat = app.config["EVENT_HEARTBEAT"]
+        app.extensions["event_broker"] = self
+        return
+
+    @staticmethod
+    def channel(user_id: int) -> str:
+        return f"user:{user_id}:events"
+
+    def publish(self, user_id: int, event: str, data: dict) -> None:
+        self.backend.publish(
+            self.channel(user_id), json.dumps({"event": event, "data": data})
+        )
+        return
+
+    def subscribe(self, user_id: int):
+        return self.backend.subscribe(self.channel(user_id))
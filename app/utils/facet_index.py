@@ -0,0 +1,180 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.forms.therapists import FilterTherapistsForm
+from app.models.enums import Gender, TherapyMode, TherapyType
+from app.models.therapist_search import TherapistSearch, TherapistSearchVersion
+from app.utils.formatters import normalise_search_text
+
+# Filter form fields with values held in therapist search data as delimited arrays
+ARRAY_FACETS = {
+    "therapy_type": "therapy_types",
+    "therapy_mode": "therapy_modes",
+    "duration": "durations",
+    "titles": "title_ids",
+    "language": "language_ids",
+    "specialisations": "issue_ids",
+    "interventions": "intervention_ids",
+}
+
+
+class FacetSnapshot:
+    # Bitmaps of listed therapists built from one version of therapist search
+    # data, where each facet value maps to a bitmap (an arbitrary-precision int)
+    # with bit n set for therapist ID n. Snapshots are never modified once built.
+    def __init__(
+        self,
+        version: Optional[int],
+        listed: int,
+        bitmaps: Dict[Tuple[str, str], int],
+        names: Dict[int, str],
+        years_of_experience: Dict[int, Optional[int]],
+    ) -> None:
+        self.version = version
+        self.listed = listed
+        self.bitmaps = bitmaps
+        self.names = names
+        self.years_of_experience = years_of_experience
+
+    @classmethod
+    def build(cls, version: int) -> "FacetSnapshot":
+        listed = 0
+        bitmaps = defaultdict(int)
+        names = {}
+        years_of_experience = {}
+
+        rows = db.session.execute(
+            db.select(TherapistSearch).filter_by(listed=True)
+        ).scalars()
+        for row in rows:
+            bit = 1 << row.therapist_id
+            listed |= bit
+            names[row.therapist_id] = row.name
+            years_of_experience[row.therapist_id] = row.years_of_experience
+            for facet, column in ARRAY_FACETS.items():
+                for value in getattr(row, column).strip("|").split("|"):
+                    if value:
+                        bitmaps[(facet, value)] |= bit
+            if row.gender:
+                bitmaps[("gender", row.gender.name)] |= bit
+            if row.country:
+                bitmaps[("country", row.country)] |= bit
+        return cls(version, listed, dict(bitmaps), names, years_of_experience)
+
+    def bitmap(self, facet: str, value) -> int:
+        return self.bitmaps.get((facet, str(value)), 0)
+
+    def all_of(self, facet: str, values: Iterable) -> int:
+        result = self.listed
+        for value in values:
+            result &= self.bitmap(facet, value)
+        return result
+
+    def match(self, form: FilterTherapistsForm) -> int:
+        result = self.listed
+
+        # Intersect bitmaps of each selected facet value
+        if form.therapy_type.data:
+            result &= self.bitmap(
+                "therapy_type", TherapyType[form.therapy_type.data].name
+            )
+        if form.therapy_mode.data:
+            result &= self.all_of(
+                "therapy_mode",
+                [TherapyMode[mode].name for mode in form.therapy_mode.data],
+            )
+        if form.duration.data:
+            result &= self.bitmap("duration", form.duration.data)
+        if form.titles.data:
+            result &= self.all_of("titles", form.titles.data)
+        if form.gender.data:
+            result &= self.bitmap("gender", Gender[form.gender.data].name)
+        if form.language.data:
+            result &= self.bitmap("language", form.language.data)
+        if form.country.data:
+            result &= self.bitmap("country", form.country.data)
+        if form.specialisations.data:
+            result &= self.all_of("specialisations", form.specialisations.data)
+        if form.interventions.data:
+            result &= self.all_of("interventions", form.interventions.data)
+
+        # Remaining filters are not categorical so are checked per therapist
+        if form.name.data:
+            name = normalise_search_text(form.name.data)
+            result &= TherapistFacetIndex.any_of_ids(
+                id for id in TherapistFacetIndex.ids(result) if name in self.names[id]
+            )
+        if form.years_of_experience.data:
+            result &= TherapistFacetIndex.any_of_ids(
+                id
+                for id in TherapistFacetIndex.ids(result)
+                if (self.years_of_experience[id] or 0) >= form.years_of_experience.data
+            )
+        return result
+
+    def facet_counts(self, form: FilterTherapistsForm) -> Dict[str, Dict[str, int]]:
+        # Count matching therapists for each facet value by intersecting bitmaps
+        matches = self.match(form)
+        counts = defaultdict(dict)
+        for (facet, value), bitmap in self.bitmaps.items():
+            count = (matches & bitmap).bit_count()
+            if count:
+                counts[facet][value] = count
+        return dict(counts)
+
+
+class TherapistFacetIndex:
+    # In-memory index of listed therapists, holding a snapshot of their facet
+    # bitmaps which is replaced as a whole when therapist data changes, so that
+    # readers using a snapshot never see parts of different versions
+    def __init__(self) -> None:
+        self.snapshot = FacetSnapshot(None, 0, {}, {}, {})
+        self.lock = Lock()
+
+    @classmethod
+    def get(cls) -> "TherapistFacetIndex":
+        # Index is loaded once per worker and rebuilt when therapist data changes
+        index = current_app.extensions.setdefault("therapist_facet_index", cls())
+        index.refresh()
+        return index
+
+    def refresh(self) -> None:
+        version = TherapistSearchVersion.current()
+        if version == self.snapshot.version:
+            return
+        with self.lock:
+            if version != self.snapshot.version:
+                self.snapshot = FacetSnapshot.build(version)
+        return
+
+    def match(self, form: FilterTherapistsForm) -> int:
+        return self.snapshot.match(form)
+
+    def facet_counts(self, form: FilterTherapistsForm) -> Dict[str, Dict[str, int]]:
+        return self.snapshot.facet_counts(form)
+
+    @staticmethod
+    def any_of_ids(ids: Iterable[int]) -> int:
+        result = 0
+        for id in ids:
+            result |= 1 << id
+        return result
+
+    @staticmethod
+    def ids(
+        bitmap: int, after: Optional[int] = None, limit: Optional[int] = None
+    ) -> List[int]:
+        # IDs set in bitmap in ascending order, optionally only those after an ID
+        # and up to a limit
+        if after is not None and after >= 0:
+            bitmap = bitmap >> (after + 1) << (after + 1)
+        ids = []
+        while bitmap and (limit is None or len(ids) < limit):
+            lowest = bitmap & -bitmap
+            ids.append(lowest.bit_length() - 1)
+            bitmap ^= lowest
+        return ids
@@ -1,3 +1,4 @@
+import unicodedata
 from datetime import date, datetime
 
 from flask import render_template_string
@@ -43,3 +44,10 @@ def convert_str_to_date(date_str: str) -> datetime:
 def age_to_date_of_birth(age: int) -> date:
     today = date.today()
     return today.replace(year=today.year - age)
+
+
+def normalise_search_text(text: str) -> str:
+    # Remove accents, case and repeated whitespace for consistent matching
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
@@ -1,17 +1,28 @@
+import smtplib
+from datetime import datetime
 from typing import List
+from urllib.parse import urlsplit
 
-from flask import current_app, render_template, url_for
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import (Response, after_this_request, current_app,
+                   has_request_context, render_template, request, url_for)
+from flask.ctx import AppContext
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer
 
-from app import mail
+from app import db, mail
 from app.models.appointment import Appointment
+from app.models.appointment_series import AppointmentSeries
+from app.models.email_outbox import EmailOutbox
 from app.models.enums import EmailSubject
 from app.models.user import User
-from app.utils.celery import send_async_email
+from app.utils.celery import drain_email_outbox
 
 
 class EmailMessage:
+    # Email described by its subject, recipient and related appointment, which is
+    # written to the outbox as is and only rendered when sent by a worker
     def __init__(
         self,
         recipient: User,
@@ -24,12 +35,64 @@ class EmailMessage:
         self.recipient = recipient
         self.subject = subject
         self.context = context
-        self.url_params = url_params
+        self.url_params = dict(url_params)
 
         self.body = None
         self.link = None
         self.link_text = None
         self.send_with_token = False
+        return
+
+    @classmethod
+    def from_outbox(cls, email: EmailOutbox) -> "EmailMessage":
+        if email.series:
+            return cls(
+                recipient=email.recipient,
+                subject=email.subject,
+                context={
+                    "series": email.series,
+                    "appointments": email.appointments,
+                    "skipped_times": [
+                        datetime.fromisoformat(time)
+                        for time in email.skipped_times or []
+                    ],
+                },
+            )
+        if email.appointments:
+            return cls(
+                recipient=email.recipient,
+                subject=email.subject,
+                context={"appointments": email.appointments},
+            )
+        if email.appointment:
+            return cls(
+                recipient=email.recipient,
+                subject=email.subject,
+                context={"appointment": email.appointment},
+                url_params={"appointment_id": email.appointment_id},
+            )
+        return cls(recipient=email.recipient, subject=email.subject)
+
+    def other_user(self, appointment: Appointment) -> User:
+        # Participant in appointment other than recipient, as emails are rendered
+        # outside of the request made by the current user
+        if self.recipient.id == appointment.therapist.user_id:
+            return appointment.client.user
+        return appointment.therapist.user
+
+    def format_times(self, appointments: List[Appointment]) -> str:
+        return self.format_datetimes([appointment.time for appointment in appointments])
+
+    def format_datetimes(self, datetimes: List[datetime]) -> str:
+        times = [
+            time.strftime("%A, %-d %B %Y at %I:%M %p") for time in sorted(datetimes)
+        ]
+        if len(times) == 1:
+            return times[0]
+        return "; ".join(times[:-1]) + " and " + times[-1]
+
+    def prepare(self) -> None:
+        recipient = self.recipient
 
         if self.subject == EmailSubject.EMAIL_VERIFICATION:
             self.body = f"Thanks for registering as a {recipient.role.value} with mindli! To continue setting up your account, please verify that this is your email address and follow the onboarding instructions in your profile."
@@ -73,7 +136,7 @@ class EmailMessage:
 
         elif self.subject == EmailSubject.APPOINTMENT_RESCHEDULED:
             appointment: Appointment = self.context["appointment"]
-            self.body = f"Your upcoming appointment with {appointment.other_user.full_name} has been rescheduled. Please note the new date and time are as follows: {appointment.time.strftime('%A, %-d %B %Y at %I:%M %p')}."
+            self.body = f"Your upcoming appointment with {self.other_user(appointment).full_name} has been rescheduled. Please note the new date and time are as follows: {appointment.time.strftime('%A, %-d %B %Y at %I:%M %p')}."
             self.link_text = "View Appointment"
             endpoint = "appointments.appointment"
             self.send_with_token = False
@@ -87,11 +150,72 @@ class EmailMessage:
 
         elif self.subject == EmailSubject.APPOINTMENT_NO_SHOW_CLIENT:
             appointment: Appointment = self.context["appointment"]
-            self.body = f"We noticed that you were unable to attend your appointment with {appointment.other_user.full_name} scheduled for {appointment.time.strftime('%A, %-d %B %Y at %I:%M %p')}. Please contact your therapist if this was an oversight or to schedule another appointment."
+            self.body = f"We noticed that you were unable to attend your appointment with {self.other_user(appointment).full_name} scheduled for {appointment.time.strftime('%A, %-d %B %Y at %I:%M %p')}. Please contact your therapist if this was an oversight or to schedule another appointment."
+            self.link_text = "View Appointment"
+            endpoint = "appointments.appointment"
+            self.send_with_token = False
+
+        elif self.subject == EmailSubject.PAYMENT_REFUND_CLIENT:
+            appointment: Appointment = self.context["appointment"]
+            self.body = f"Your payment for an appointment with {appointment.therapist.user.full_name} on {appointment.time.strftime('%A, %-d %B %Y at %I:%M %p')} was received after your booking expired, and the time has since been booked by someone else. Your payment will be refunded. Please book another time at your earliest convenience."
             self.link_text = "View Appointment"
             endpoint = "appointments.appointment"
             self.send_with_token = False
 
+        elif self.subject == EmailSubject.APPOINTMENTS_CONFIRMED_CLIENT:
+            appointments: List[Appointment] = self.context["appointments"]
+            self.body = f"Good news! Your appointments with {self.other_user(appointments[0]).full_name} on {self.format_times(appointments)} have been confirmed. Please review any preparation material in advance and reach out to your therapist if you have any questions before the appointments."
+            self.link_text = "View Appointments"
+            endpoint = "appointments.index"
+            self.send_with_token = False
+
+        elif self.subject == EmailSubject.APPOINTMENTS_CANCELLED:
+            appointments: List[Appointment] = self.context["appointments"]
+            self.body = f"We regret to inform you that your appointments with {self.other_user(appointments[0]).full_name} on {self.format_times(appointments)} have been cancelled. Please contact your therapist to schedule other appointments at your earliest convenience."
+            self.link_text = "View Appointments"
+            endpoint = "appointments.index"
+            self.send_with_token = False
+
+        elif self.subject == EmailSubject.APPOINTMENTS_NO_SHOW_CLIENT:
+            appointments: List[Appointment] = self.context["appointments"]
+            self.body = f"We noticed that you were unable to attend your appointments with {self.other_user(appointments[0]).full_name} on {self.format_times(appointments)}. Please contact your therapist if this was an oversight or to schedule other appointments."
+            self.link_text = "View Appointments"
+            endpoint = "appointments.index"
+            self.send_with_token = False
+
+        elif self.subject == EmailSubject.SERIES_BOOKED_CLIENT:
+            series: AppointmentSeries = self.context["series"]
+            appointments: List[Appointment] = self.context["appointments"]
+            skipped_times: List[datetime] = self.context["skipped_times"]
+            therapist_name = series.therapist.user.full_name
+            body = []
+            if appointments:
+                body.append(
+                    f"Recurring appointments with {therapist_name} have been booked for {self.format_times(appointments)}."
+                )
+                if any(appointment.hold_expires_at for appointment in appointments):
+                    hours = (
+                        current_app.config["APPOINTMENT_SERIES_PAYMENT_NOTICE"] // 3600
+                    )
+                    body.append(
+                        f"Please pay for each appointment at least {hours} hours before it takes place, as unpaid appointments are released after then."
+                    )
+            if skipped_times:
+                body.append(
+                    f"Recurring appointments with {therapist_name} could not be booked for {self.format_datetimes(skipped_times)}, as your therapist is unavailable then. Please contact your therapist to arrange other times."
+                )
+            self.body = " ".join(body)
+            self.link_text = "View Appointments"
+            endpoint = "appointments.index"
+            self.send_with_token = False
+
+        elif self.subject == EmailSubject.SERIES_RELEASED_CLIENT:
+            appointments: List[Appointment] = self.context["appointments"]
+            self.body = f"Recurring appointments with {self.other_user(appointments[0]).full_name} for {self.format_times(appointments)} were not paid for in time and have been released. Later appointments in the series are not affected. Please contact your therapist if you would still like to attend."
+            self.link_text = "View Appointments"
+            endpoint = "appointments.index"
+            self.send_with_token = False
+
         else:
             print(f"Unhandled email subject {self.subject}")
 
@@ -105,37 +229,155 @@ class EmailMessage:
         return
 
     def prepare_email(self) -> str:
+        self.prepare()
         html_body = render_template("email.html", message=self)
         return html_body
 
-    def send(self, asynchronous: bool = True):
-        with current_app.app_context():
-            subject = self.subject.value
-            recipients = [self.recipient.email]
-            html = render_template("email.html", message=self)
+    def send(self) -> None:
+        # Write email to outbox in the current transaction, so that it is only
+        # sent once the changes it describes are committed
+        appointment = self.context.get("appointment")
+        series = self.context.get("series")
+        skipped_times = self.context.get("skipped_times")
+        db.session.add(
+            EmailOutbox(
+                subject=self.subject,
+                recipient_id=self.recipient.id,
+                appointment_id=appointment.id if appointment else None,
+                appointments=list(self.context.get("appointments", [])),
+                series_id=series.id if series else None,
+                skipped_times=(
+                    [time.isoformat() for time in skipped_times]
+                    if skipped_times
+                    else None
+                ),
+                base_url=(
+                    request.host_url
+                    if has_request_context()
+                    else current_app.config["SITE_URL"]
+                ),
+                created_at=datetime.now(),
+                next_attempt_at=datetime.now(),
+            )
+        )
+        db.session.info["email_outbox_pending"] = True
+        return
+
+
+# Server name, root and scheme of site, which Flask uses to build external URLs
+# outside of a request
+def site_url_config(site_url: str) -> dict:
+    parts = urlsplit(site_url)
+    return {
+        "SERVER_NAME": parts.netloc,
+        "APPLICATION_ROOT": parts.path.rstrip("/") or "/",
+        "PREFERRED_URL_SCHEME": parts.scheme or "http",
+    }
+
+
+# App context building URLs for site as its config would. Setting SERVER_NAME
+# for the app itself would make Flask reject requests to other hosts, so the
+# context's URL adapter is bound to site instead.
+def site_app_context(site_url: str) -> AppContext:
+    config = site_url_config(site_url)
+    context = current_app.app_context()
+    context.url_adapter = current_app.url_map.bind(
+        config["SERVER_NAME"],
+        script_name=config["APPLICATION_ROOT"],
+        url_scheme=config["PREFERRED_URL_SCHEME"],
+    )
+    return context
+
+
+def prepare_message(subject: str, recipients: List[str], html: str) -> Message:
+    return Message(subject, recipients=recipients, html=html)
 
-            try:
-                # Send email synchronously
-                if asynchronous and current_app.config["CELERY_ENABLED"]:
+
+# Render and send emails due in outbox in batches, using one connection for each
+# batch
+def drain_outbox() -> int:
+    max_attempts = current_app.config["MAIL_MAX_ATTEMPTS"]
+    backoff = current_app.config["MAIL_RETRY_BACKOFF"]
+
+    sent = 0
+    while True:
+        emails = EmailOutbox.claim_batch(
+            current_app.config["MAIL_BATCH_SIZE"],
+            current_app.config["MAIL_CLAIM_LEASE"],
+        )
+        if not emails:
+            return sent
+
+        remaining = list(emails)
+        try:
+            with mail.connect() as connection:
+                while remaining:
+                    email = remaining[0]
                     try:
-                        send_async_email.delay(subject, recipients, html)
-                        return
+                        with site_app_context(
+                            email.base_url or current_app.config["SITE_URL"]
+                        ):
+                            html = EmailMessage.from_outbox(email).prepare_email()
+                        connection.send(
+                            prepare_message(
+                                email.subject.value, [email.recipient.email], html
+                            )
+                        )
+                        email.mark_sent()
+                        sent += 1
+
+                    # Stop using connection once server disconnects
+                    except smtplib.SMTPServerDisconnected:
+                        raise
                     except Exception as e:
-                        print(f"Failed to send email asynchronously: {e}")
-                        pass
+                        email.mark_failed(e, max_attempts, backoff)
+                    remaining.pop(0)
+
+        # Defer remaining emails in batch if connection could not be used
+        except Exception as e:
+            print(f"Failed to send emails: {e}")
+            for email in remaining:
+                email.mark_failed(e, max_attempts, backoff)
+            db.session.commit()
+            return sent
+
+        db.session.commit()
+
+
+def drain_outbox_after_request(response: Response) -> Response:
+    try:
+        drain_outbox()
+    except Exception as e:
+        print(f"Failed to drain email outbox: {e}")
+    return response
 
-                # Try sending email synchronously if failed
-                message = prepare_message(subject, recipients, html)
-                self.mail.send(message)
 
-            # Failed to send email
-            except Exception as e:
-                print(f"Failed to send email synchronously: {e}")
+# Once emails are committed, ask a worker to drain the outbox without waiting for
+# it. Emails stay in the outbox for the periodic relay if the broker is down, so
+# each is sent at least once.
+@sa.event.listens_for(so.Session, "after_commit")
+def relay_committed_emails(session: so.Session) -> None:
+    if not session.info.pop("email_outbox_pending", False):
         return
 
+    if current_app.config["CELERY_ENABLED"]:
+        try:
+            drain_email_outbox.apply_async(retry=False)
+        except Exception as e:
+            print(f"Failed to drain email outbox asynchronously: {e}")
 
-def prepare_message(subject: str, recipients: List[str], html: str) -> Message:
-    return Message(subject, recipients=recipients, html=html)
+    # Without a worker, drain once the response is ready as the session cannot
+    # be used while committing
+    elif has_request_context() and not getattr(request, "draining_email_outbox", False):
+        request.draining_email_outbox = True
+        after_this_request(drain_outbox_after_request)
+    return
+
+
+@sa.event.listens_for(so.Session, "after_rollback")
+def discard_rolled_back_emails(session: so.Session) -> None:
+    session.info.pop("email_outbox_pending", None)
+    return
 
 
 def send_appointment_update_email(
@@ -149,3 +391,33 @@ def send_appointment_update_email(
     )
     email.send()
     return
+
+
+def send_appointments_update_email(
+    appointments: List[Appointment], recipient: User, subject: EmailSubject
+) -> None:
+    email = EmailMessage(
+        recipient=recipient,
+        subject=subject,
+        context={"appointments": appointments},
+    )
+    email.send()
+    return
+
+
+def send_series_booked_email(
+    series: AppointmentSeries,
+    appointments: List[Appointment],
+    skipped_times: List[datetime],
+) -> None:
+    email = EmailMessage(
+        recipient=series.client.user,
+        subject=EmailSubject.SERIES_BOOKED_CLIENT,
+        context={
+            "series": series,
+            "appointments": appointments,
+            "skipped_times": skipped_times,
+        },
+    )
+    email.send()
+    return
@@ -0,0 +1,78 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+import sqlalchemy as sa
+from flask import abort, current_app
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql import Select
+
+from app import db
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # Serialise values of the last row on a page into an opaque URL-safe string
+    serialised = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(serialised).encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: List[InstrumentedAttribute]) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Cursor does not match keyset columns")
+
+        # Restore datetimes serialised as ISO 8601 strings
+        return [
+            datetime.fromisoformat(value)
+            if column.type.python_type is datetime
+            else value
+            for column, value in zip(columns, values)
+        ]
+
+    # Malformed or tampered cursor
+    except (ValueError, TypeError, binascii.Error):
+        abort(400)
+
+
+# Fetch a page of rows with keyset pagination, returning a cursor for the next page
+def paginate(
+    query: Select,
+    columns: List[InstrumentedAttribute],
+    cursor: Optional[str] = None,
+    descending: bool = False,
+    per_page: Optional[int] = None,
+) -> Tuple[list, Optional[str]]:
+    per_page = per_page or current_app.config["PAGE_SIZE"]
+
+    # Only include rows positioned after the last row of the previous page
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        conditions = []
+        for i, (column, value) in enumerate(zip(columns, values)):
+            preceding = [col == val for col, val in zip(columns[:i], values[:i])]
+            after = column < value if descending else column > value
+            conditions.append(sa.and_(*preceding, after))
+        query = query.where(sa.or_(*conditions))
+
+    # Fetch an additional row to determine whether another page exists
+    query = query.order_by(
+        *[column.desc() if descending else column.asc() for column in columns]
+    ).limit(per_page + 1)
+    rows = db.session.execute(query).scalars().all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], col.key) for col in columns])
+    return rows, next_cursor
+
+
+def count_rows(query: Select) -> int:
+    return db.session.execute(
+        db.select(sa.func.count()).select_from(query.order_by(None).subquery())
+    ).scalar()
@@ -0,0 +1,128 @@
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+import requests
+import stripe
+from flask import Flask
+from requests.adapters import HTTPAdapter
+
+
+class LatencyStats:
+    # Running totals of call latencies for one Stripe operation
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        self.count += 1
+        self.errors += int(failed)
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        return
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class StripeClient:
+    # Makes Stripe API calls over one pooled HTTP session, so that connections
+    # are kept alive between calls, with bounded timeouts so that a slow API
+    # cannot hold requests open. Failed calls which are safe to retry are retried
+    # by the Stripe library, and the latency of each operation is recorded and
+    # logged periodically.
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.http_client = None
+        self.latencies: Dict[str, LatencyStats] = {}
+        self.lock = Lock()
+        self.stats_reported_at = time.monotonic()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=app.config["STRIPE_POOL_SIZE"])
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.http_client = stripe.http_client.RequestsClient(
+            timeout=(
+                app.config["STRIPE_CONNECT_TIMEOUT"],
+                app.config["STRIPE_READ_TIMEOUT"],
+            ),
+            session=session,
+        )
+        self.slow_call_threshold = app.config["STRIPE_SLOW_CALL_THRESHOLD"]
+        self.stats_interval = app.config["STRIPE_STATS_INTERVAL"]
+
+        stripe.api_key = app.config["STRIPE_SECRET_KEY"]
+        stripe.api_version = "2023-10-16"
+        stripe.api_base = app.config["STRIPE_API_BASE"]
+        stripe.max_network_retries = app.config["STRIPE_MAX_NETWORK_RETRIES"]
+        stripe.default_http_client = self.http_client
+        app.extensions["stripe_client"] = self
+        return
+
+    def call(self, operation: str, f: Callable[..., Any], **params) -> Any:
+        # Time call, including any retries, and report slow calls
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = f(**params)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.latencies.setdefault(operation, LatencyStats()).record(
+                    elapsed, failed
+                )
+            if elapsed > self.slow_call_threshold:
+                print(f"Slow Stripe call {operation}: {elapsed:.2f}s")
+            self.report_stats()
+
+    def report_stats(self) -> None:
+        # Log latencies recorded by this process once interval has passed since
+        # they were last logged, then start recording afresh
+        with self.lock:
+            if time.monotonic() - self.stats_reported_at < self.stats_interval:
+                return
+            self.stats_reported_at = time.monotonic()
+            latencies, self.latencies = self.latencies, {}
+
+        summaries = []
+        for operation, latency in sorted(latencies.items()):
+            stats = latency.as_dict()
+            summaries.append(
+                f"{operation} count={stats['count']} errors={stats['errors']} "
+                f"mean={stats['mean']:.2f}s max={stats['max']:.2f}s"
+            )
+        print(f"Stripe call latencies: {'; '.join(summaries)}")
+        return
+
+    def stats(self) -> Dict[str, dict]:
+        with self.lock:
+            return {
+                operation: latency.as_dict()
+                for operation, latency in self.latencies.items()
+            }
+
+    def create_account(self, **params) -> stripe.Account:
+        return self.call("Account.create", stripe.Account.create, **params)
+
+    def retrieve_account(self, account_id: str) -> stripe.Account:
+        return self.call("Account.retrieve", stripe.Account.retrieve, id=account_id)
+
+    def create_account_link(self, **params) -> stripe.AccountLink:
+        return self.call("AccountLink.create", stripe.AccountLink.create, **params)
+
+    def create_checkout_session(self, **params) -> stripe.checkout.Session:
+        return self.call(
+            "checkout.Session.create", stripe.checkout.Session.create, **params
+        )
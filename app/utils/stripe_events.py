@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+import stripe
+from flask import Response, current_app, json
+
+from app import db
+from app.models.appointment import Appointment
+from app.models.enums import AppointmentStatus, EmailSubject, PaymentStatus
+from app.models.stripe_event import StripeEvent
+from app.models.therapist import Therapist
+from app.utils.mail import send_appointment_update_email
+
+
+def handle_payment_succeeded(session: stripe.checkout.Session):
+    # Fetch the appointment using the ID included in the session metadata
+    appointment_id = session.get("metadata").get("appointment_id")
+    appointment = db.session.execute(
+        db.select(Appointment).filter_by(id=appointment_id)
+    ).scalar_one()
+
+    # Return if appointment has already been updated
+    if appointment.payment_status in (
+        PaymentStatus.SUCCEEDED,
+        PaymentStatus.REFUND_DUE,
+    ):
+        return
+
+    # Payment arrived after appointment's hold was released, so reinstate it if
+    # its slot is still free, or otherwise have the payment refunded
+    if appointment.appointment_status == AppointmentStatus.CANCELLED:
+        Therapist.lock_schedule(appointment.therapist_id)
+        end = appointment.time + timedelta(
+            minutes=appointment.appointment_type.duration
+        )
+        if Appointment.has_conflict(
+            appointment.therapist_id, appointment.time, end, appointment.id
+        ):
+            appointment.payment_status = PaymentStatus.REFUND_DUE
+            appointment.hold_expires_at = None
+            send_appointment_update_email(
+                appointment=appointment,
+                recipient=appointment.client.user,
+                subject=EmailSubject.PAYMENT_REFUND_CLIENT,
+            )
+            return
+        appointment.appointment_status = AppointmentStatus.SCHEDULED
+
+    # Update the appointment's payment status in the database, along with emails
+    # to be sent once committed
+    appointment.payment_status = PaymentStatus.SUCCEEDED
+    appointment.hold_expires_at = None
+
+    # Send email to client
+    send_appointment_update_email(
+        appointment=appointment,
+        recipient=appointment.client.user,
+        subject=EmailSubject.APPOINTMENT_CANCELLED,
+    )
+
+    # Send email to therapist
+    send_appointment_update_email(
+        appointment=appointment,
+        recipient=appointment.therapist.user,
+        subject=EmailSubject.APPOINTMENT_CANCELLED,
+    )
+    return
+
+
+def handle_payment_failed(session: stripe.checkout.Session):
+    # Fetch the appointment using the ID included in the session metadata
+    appointment_id = session.get("metadata").get("appointment_id")
+    appointment = db.session.execute(
+        db.select(Appointment).filter_by(id=appointment_id)
+    ).scalar_one()
+
+    # Return if appointment has already been updated
+    if appointment.payment_status in (
+        PaymentStatus.SUCCEEDED,
+        PaymentStatus.REFUND_DUE,
+    ):
+        return
+
+    # Update the appointment's payment status in the database, along with email
+    # to be sent once committed
+    appointment.payment_status = PaymentStatus.FAILED
+
+    # Discard completed checkout session so that a new one is created if the
+    # client pays again
+    appointment.checkout_session_id = None
+    appointment.checkout_session_url = None
+    appointment.checkout_session_expires_at = None
+
+    # Send email to client
+    send_appointment_update_email(
+        appointment=appointment,
+        recipient=appointment.client.user,
+        subject=EmailSubject.PAYMENT_FAILED_CLIENT,
+    )
+    return
+
+
+def handle_event(event: stripe.Event) -> None:
+    if event["type"] == "checkout.session.completed":
+        session = event["data"]["object"]
+        if session.payment_status == "paid":
+            handle_payment_succeeded(session)
+    elif event["type"] == "checkout.session.async_payment_succeeded":
+        handle_payment_succeeded(event["data"]["object"])
+    elif event["type"] == "checkout.session.async_payment_failed":
+        handle_payment_failed(event["data"]["object"])
+    else:
+        print(f"Unhandled event type {event['type']}")
+    return
+
+
+# Process stored events in batches, committing each event's changes along with
+# it being marked as processed so that no event is applied twice
+def process_events() -> int:
+    max_attempts = current_app.config["STRIPE_EVENT_MAX_ATTEMPTS"]
+    backoff = current_app.config["STRIPE_EVENT_RETRY_BACKOFF"]
+
+    processed = 0
+    while True:
+        events = StripeEvent.claim_batch(
+            current_app.config["STRIPE_EVENT_BATCH_SIZE"],
+            current_app.config["STRIPE_EVENT_CLAIM_LEASE"],
+        )
+        if not events:
+            return processed
+
+        for event in events:
+            try:
+                with db.session.begin_nested():
+                    handle_event(
+                        stripe.Event.construct_from(
+                            json.loads(event.payload), stripe.api_key
+                        )
+                    )
+                event.mark_processed()
+                processed += 1
+            except Exception as e:
+                print(f"Failed to process Stripe event {event.id}: {e}")
+                event.mark_failed(e, max_attempts, backoff)
+
+        db.session.commit()
+
+
+def process_events_after_request(response: Response) -> Response:
+    try:
+        process_events()
+    except Exception as e:
+        print(f"Failed to process Stripe events: {e}")
+    return response
@@ -88,3 +88,14 @@ class MinimumStripeFee:
             raise ValidationError(
                 "Fee amount must be at least $0.50 USD or equivalent in charge currency"
             )
+
+
+class AfterField:
+    def __init__(self, field_name: str) -> None:
+        self.field_name = field_name
+
+    def __call__(self, form, field) -> None:
+        other = form[self.field_name]
+        if field.data and other.data and field.data <= other.data:
+            raise ValidationError(f"Must be after {other.label.text.lower()}.")
+        return
@@ -5,6 +5,7 @@ from app import db
 from app.forms.appointment_types import (AppointmentTypeForm,
                                          DeleteAppointmentTypeForm)
 from app.models.appointment_type import AppointmentType
+from app.models.therapist_search import TherapistSearch
 from app.utils.decorators import therapist_required
 
 bp = Blueprint("appointment_types", __name__, url_prefix="/appointment-types")
@@ -31,6 +32,7 @@ def create():
         active=True,
     )
     db.session.add(new_appointment_type)
+    TherapistSearch.sync(current_user.therapist)
     db.session.commit()
 
     flash("Appointment type created", "success")
@@ -83,6 +85,7 @@ def update(appointment_type_id):
         active=True,
     )
     db.session.add(new_appointment_type)
+    TherapistSearch.sync(current_user.therapist)
     db.session.commit()
 
     flash("Appointment type updated", "success")
@@ -119,6 +122,7 @@ def delete():
 
     # Soft delete appointment to maintain historical integrity
     appointment_type.active = False
+    TherapistSearch.sync(current_user.therapist)
     db.session.commit()
 
     # Redirect to appointment types page
@@ -1,17 +1,25 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from flask import (Blueprint, Response, abort, flash, jsonify, redirect,
-                   render_template, render_template_string, request, session,
-                   url_for)
+import click
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify,
+                   redirect, render_template, render_template_string, request,
+                   session, url_for)
 from flask_login import current_user, login_required
-from sqlalchemy import func, or_
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql import Select
 
-from app import db
+from app import availability_index, db
 from app.forms.appointments import (AppointmentNotesForm, BookAppointmentForm,
+                                    BookAppointmentSeriesForm,
+                                    BulkUpdateAppointmentsForm,
                                     FilterAppointmentsForm,
                                     TherapyExerciseForm, UpdateAppointmentForm)
 from app.models.appointment import Appointment
 from app.models.appointment_notes import AppointmentNotes
+from app.models.appointment_search import AppointmentSearch
+from app.models.appointment_series import AppointmentSeries
+from app.models.appointment_type import AppointmentType
 from app.models.client import Client
 from app.models.enums import (AppointmentStatus, EmailSubject, PaymentStatus,
                               TherapyMode, TherapyType, UserRole)
@@ -20,10 +28,13 @@ from app.models.issue import Issue
 from app.models.therapist import Therapist
 from app.models.therapy_exercise import TherapyExercise
 from app.models.user import User
+from app.utils.appointment_series import book_occurrences, end_series
 from app.utils.decorators import client_required, therapist_required
 from app.utils.formatters import convert_str_to_date, get_flashed_message_html
-from app.utils.mail import send_appointment_update_email
-from app.views.stripe import create_checkout_session
+from app.utils.mail import (send_appointment_update_email,
+                            send_appointments_update_email)
+from app.utils.pagination import count_rows, paginate
+from app.views.stripe import get_checkout_session_url
 
 bp = Blueprint("appointments", __name__, url_prefix="/appointments")
 FILTERS_SESSION_KEY = "appointment_filters"
@@ -32,23 +43,6 @@ FILTERS_SESSION_KEY = "appointment_filters"
 @bp.route("/", methods=["GET"])
 @login_required
 def index():
-    # Dynamically choose the criteria to filter appointments depending on user's role
-    if current_user.role == UserRole.THERAPIST:
-        filter_criteria = Appointment.therapist_id == current_user.therapist.id
-    elif current_user.role == UserRole.CLIENT:
-        filter_criteria = Appointment.client_id == current_user.client.id
-
-    # Fetch all of the the current user's appointments ordered by the most recent
-    appointments = (
-        db.session.execute(
-            db.select(Appointment)
-            .filter(filter_criteria)
-            .order_by(Appointment.time.desc())
-        )
-        .scalars()
-        .all()
-    )
-
     # Convert dates stored as str in session to initialise filter form
     filters = session.get(FILTERS_SESSION_KEY, {})
     if "start_date" in filters and filters["start_date"]:
@@ -63,11 +57,19 @@ def index():
         data=filters,
     )
 
+    # Fetch first page of appointments matching filters stored in session
+    query = build_filter_query(filter_form)
+    appointments, next_cursor = paginate(
+        query, [Appointment.time, Appointment.id], descending=True
+    )
+
     # Render the page with the appointment forms
     return render_template(
         "appointments.html",
         active_page="appointments",
         appointments=appointments,
+        appointment_count=count_rows(query),
+        next_cursor=next_cursor,
         filter_form=filter_form,
     )
 
@@ -122,6 +124,27 @@ def appointment(appointment_id: int) -> Response:
     )
 
 
+@bp.route("/availability/<int:therapist_id>", methods=["GET"])
+@login_required
+def availability(therapist_id: int) -> Response:
+    # Fetch active appointment type of this therapist to find slots long enough
+    appointment_type = db.session.execute(
+        db.select(AppointmentType).filter_by(
+            id=request.args.get("appointment_type", type=int),
+            therapist_id=therapist_id,
+            active=True,
+        )
+    ).scalar_one_or_none()
+    if appointment_type is None:
+        abort(404)
+
+    # Group open slots by date for the booking form
+    slots = {}
+    for slot in availability_index.open_slots(therapist_id, appointment_type.duration):
+        slots.setdefault(slot.date().isoformat(), []).append(slot.strftime("%H:%M"))
+    return jsonify({"success": True, "slots": slots})
+
+
 @bp.route("/create/<int:therapist_id>", methods=["POST"])
 @login_required
 @client_required
@@ -142,14 +165,36 @@ def create(therapist_id: int) -> Response:
     if not form.validate_on_submit():
         return jsonify({"success": False, "errors": form.errors})
 
-    # Add new appointment with pending payment in database
+    # Reject times outside therapist's hours or overlapping other appointments,
+    # checking committed appointments while holding therapist's schedule lock
+    time = datetime.combine(form.date.data, form.time.data)
+    appointment_type = db.session.get(AppointmentType, form.appointment_type.data)
+    is_open = availability_index.is_open(therapist_id, time, appointment_type.duration)
+    if is_open:
+        Therapist.lock_schedule(therapist_id)
+        is_open = not Appointment.has_conflict(
+            therapist_id, time, time + timedelta(minutes=appointment_type.duration)
+        )
+    if not is_open:
+        db.session.rollback()
+        errors = {"time": ["This time is not available, please choose another."]}
+        return jsonify({"success": False, "errors": errors})
+
+    # Add new appointment with pending payment in database, holding slot only
+    # until checkout expires if paying via Stripe
+    hold_expires_at = None
+    if therapist.stripe_account_id:
+        hold_expires_at = datetime.now() + timedelta(
+            seconds=current_app.config["APPOINTMENT_HOLD_TTL"]
+        )
     appointment = Appointment(
         therapist_id=therapist_id,
         client_id=current_user.client.id,
         appointment_type_id=form.appointment_type.data,
-        time=datetime.combine(form.date.data, form.time.data),
+        time=time,
         appointment_status=AppointmentStatus.SCHEDULED,
         payment_status=PaymentStatus.PENDING,
+        hold_expires_at=hold_expires_at,
     )
     db.session.add(appointment)
     db.session.commit()
@@ -169,7 +214,7 @@ def create(therapist_id: int) -> Response:
             }
         )
 
-    checkout_session_url = create_checkout_session(appointment)
+    checkout_session_url = get_checkout_session_url(appointment)
 
     if not checkout_session_url:
         return jsonify(
@@ -190,6 +235,131 @@ def create(therapist_id: int) -> Response:
         )
 
 
+@bp.route("/series/create/<int:therapist_id>", methods=["POST"])
+@login_required
+@client_required
+def create_series(therapist_id: int) -> Response:
+    # Ensure client has completed onboarding
+    if not current_user.onboarding_complete:
+        flash(
+            "Please complete your onboarding before booking an appointment", "warning"
+        )
+        return redirect(url_for("profile.profile", user_id=current_user.id))
+
+    # Fetch therapist with this ID to initialise form correctly
+    therapist = db.get_or_404(Therapist, therapist_id)
+
+    form = BookAppointmentSeriesForm(obj=therapist)
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify({"success": False, "errors": form.errors})
+
+    if form.end_date.data and form.end_date.data < form.date.data:
+        errors = {"end_date": ["End date must not be before the first appointment."]}
+        return jsonify({"success": False, "errors": errors})
+
+    # Reject series whose first appointment is not open
+    start = datetime.combine(form.date.data, form.time.data)
+    appointment_type = db.session.get(AppointmentType, form.appointment_type.data)
+    errors = {"time": ["This time is not available, please choose another."]}
+    if not availability_index.is_open(therapist_id, start, appointment_type.duration):
+        return jsonify({"success": False, "errors": errors})
+
+    # Add series and book its first appointments, skipping any later ones which
+    # are not open, while holding therapist's schedule lock
+    series = AppointmentSeries(
+        therapist_id=therapist_id,
+        client_id=current_user.client.id,
+        appointment_type_id=appointment_type.id,
+        start=start,
+        interval_weeks=form.interval_weeks.data,
+        count=form.count.data,
+        until=(
+            datetime.combine(form.end_date.data, form.time.data)
+            if form.end_date.data
+            else None
+        ),
+    )
+    Therapist.lock_schedule(therapist_id)
+    db.session.add(series)
+    db.session.flush()
+    booked = book_occurrences(
+        series,
+        series.due_occurrences(
+            current_app.config["APPOINTMENT_SERIES_AHEAD"], datetime.now()
+        ),
+    )
+    if start not in {appointment.time for appointment in booked}:
+        db.session.rollback()
+        return jsonify({"success": False, "errors": errors})
+    db.session.commit()
+
+    return jsonify(
+        {
+            "success": True,
+            "url": url_for("appointments.index"),
+            "flashed_message_html": get_flashed_message_html(
+                f"{len(booked)} appointments scheduled, awaiting payment and confirmation",
+                "info",
+            ),
+        }
+    )
+
+
+@bp.route("/series/<int:series_id>/cancel", methods=["POST"])
+@login_required
+def cancel_series(series_id: int) -> Response:
+    series = db.get_or_404(AppointmentSeries, series_id)
+
+    # Current user is not in this series
+    if (
+        current_user.role == UserRole.THERAPIST
+        and series.therapist.user_id != current_user.id
+    ) or (
+        current_user.role == UserRole.CLIENT
+        and series.client.user_id != current_user.id
+    ):
+        abort(403)
+
+    # End series and cancel its upcoming appointments while holding therapist's
+    # schedule lock
+    Therapist.lock_schedule(series.therapist_id)
+    cancelled = end_series(series)
+
+    # Notify other participant once about all cancelled appointments
+    if cancelled:
+        recipient = (
+            series.client.user
+            if current_user.role == UserRole.THERAPIST
+            else series.therapist.user
+        )
+        if len(cancelled) == 1:
+            send_appointment_update_email(
+                appointment=cancelled[0],
+                recipient=recipient,
+                subject=EmailSubject.APPOINTMENT_CANCELLED,
+            )
+        else:
+            send_appointments_update_email(
+                appointments=cancelled,
+                recipient=recipient,
+                subject=EmailSubject.APPOINTMENTS_CANCELLED,
+            )
+    db.session.commit()
+
+    return jsonify(
+        {
+            "success": True,
+            "url": url_for("appointments.index"),
+            "flashed_message_html": get_flashed_message_html(
+                f"Series ended, {len(cancelled)} upcoming appointment(s) cancelled",
+                "warning",
+            ),
+        }
+    )
+
+
 @bp.route("/update/<int:appointment_id>", methods=["POST"])
 @login_required
 def update(appointment_id: int) -> Response:
@@ -223,6 +393,28 @@ def update(appointment_id: int) -> Response:
         if datetime_errors:
             return jsonify({"success": False, "errors": datetime_errors})
 
+        # Reject times outside therapist's hours or overlapping other appointments,
+        # checking committed appointments while holding therapist's schedule lock
+        new_time = datetime.combine(form.new_date.data, form.new_time.data)
+        duration = appointment.appointment_type.duration
+        is_open = availability_index.is_open(
+            appointment.therapist_id, new_time, duration, appointment_id=appointment.id
+        )
+        if is_open:
+            Therapist.lock_schedule(appointment.therapist_id)
+            is_open = not Appointment.has_conflict(
+                appointment.therapist_id,
+                new_time,
+                new_time + timedelta(minutes=duration),
+                appointment_id=appointment.id,
+            )
+        if not is_open:
+            db.session.rollback()
+            errors = {
+                "new_time": ["This time is not available, please choose another."]
+            }
+            return jsonify({"success": False, "errors": errors})
+
     flashed_message_text = None
     flashed_message_category = None
 
@@ -240,12 +432,12 @@ def update(appointment_id: int) -> Response:
 
         # RESCHEDULED - notify client and update appointment time
         elif new_status == AppointmentStatus.RESCHEDULED:
+            appointment.time = new_time
             send_appointment_update_email(
                 appointment=appointment,
                 recipient=appointment.client.user,
                 subject=EmailSubject.APPOINTMENT_RESCHEDULED,
             )
-            appointment.time = datetime.combine(form.new_date.data, form.new_time.data)
             flashed_message_text = "Appointment rescheduled, client notified"
             flashed_message_category = "success"
 
@@ -282,12 +474,12 @@ def update(appointment_id: int) -> Response:
     elif current_user.role == UserRole.CLIENT:
         # RESCHEDULED - notify therapist and update appointment time
         if new_status == AppointmentStatus.RESCHEDULED:
+            appointment.time = new_time
             send_appointment_update_email(
                 appointment=appointment,
                 recipient=appointment.therapist.user,
                 subject=EmailSubject.APPOINTMENT_RESCHEDULED,
             )
-            appointment.time = datetime.combine(form.new_date.data, form.new_time.data)
             flashed_message_text = "Appointment rescheduled, therapist notified"
             flashed_message_category = "success"
 
@@ -332,6 +524,118 @@ def update(appointment_id: int) -> Response:
     )
 
 
+# Client emails for each status set in bulk, for one or several appointments
+BULK_UPDATE_EMAIL_SUBJECTS = {
+    AppointmentStatus.CONFIRMED: (
+        EmailSubject.APPOINTMENT_CONFIRMED_CLIENT,
+        EmailSubject.APPOINTMENTS_CONFIRMED_CLIENT,
+    ),
+    AppointmentStatus.CANCELLED: (
+        EmailSubject.APPOINTMENT_CANCELLED,
+        EmailSubject.APPOINTMENTS_CANCELLED,
+    ),
+    AppointmentStatus.NO_SHOW: (
+        EmailSubject.APPOINTMENT_NO_SHOW_CLIENT,
+        EmailSubject.APPOINTMENTS_NO_SHOW_CLIENT,
+    ),
+}
+
+
+@bp.route("/update", methods=["POST"])
+@login_required
+@therapist_required
+def bulk_update() -> Response:
+    form = BulkUpdateAppointmentsForm()
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify({"success": False, "errors": form.errors})
+
+    new_status = AppointmentStatus[form.action.data]
+    therapist_id = current_user.therapist.id
+    appointment_ids = list(dict.fromkeys(form.appointment_ids.data))
+
+    # Fetch therapist's selected appointments in one query while holding their
+    # schedule lock, so that they cannot change before being updated
+    Therapist.lock_schedule(therapist_id)
+    appointments = {
+        appointment.id: appointment
+        for appointment in db.session.execute(
+            db.select(Appointment)
+            .where(
+                Appointment.id.in_(appointment_ids),
+                Appointment.therapist_id == therapist_id,
+            )
+            .options(joinedload(Appointment.client).joinedload(Client.user))
+        ).scalars()
+    }
+
+    # Validate each appointment, updating those which are valid
+    results = {}
+    updated_appointments = []
+    for appointment_id in appointment_ids:
+        appointment = appointments.get(appointment_id)
+        if not appointment:
+            error = "Appointment not found."
+        elif appointment.appointment_status == new_status:
+            error = f"Appointment is already {new_status.value.lower()}."
+        elif appointment.appointment_status == AppointmentStatus.CANCELLED:
+            error = "Cancelled appointments cannot be updated."
+        else:
+            error = None
+            updated_appointments.append(appointment)
+        results[appointment_id] = {
+            "success": error is None,
+            "errors": [error] if error else [],
+        }
+
+    if not updated_appointments:
+        db.session.rollback()
+        return jsonify({"success": False, "results": results})
+
+    Appointment.bulk_update_status(
+        therapist_id,
+        [appointment.id for appointment in updated_appointments],
+        new_status,
+    )
+
+    # Notify each client once about all of their updated appointments
+    subjects = BULK_UPDATE_EMAIL_SUBJECTS.get(new_status)
+    if subjects:
+        appointments_by_client = {}
+        for appointment in updated_appointments:
+            appointments_by_client.setdefault(appointment.client_id, []).append(
+                appointment
+            )
+        for client_appointments in appointments_by_client.values():
+            if len(client_appointments) == 1:
+                send_appointment_update_email(
+                    appointment=client_appointments[0],
+                    recipient=client_appointments[0].client.user,
+                    subject=subjects[0],
+                )
+            else:
+                send_appointments_update_email(
+                    appointments=client_appointments,
+                    recipient=client_appointments[0].client.user,
+                    subject=subjects[1],
+                )
+    db.session.commit()
+
+    flashed_message_text = f"{len(updated_appointments)} appointment(s) updated"
+    if subjects:
+        flashed_message_text += ", clients notified"
+    return jsonify(
+        {
+            "success": True,
+            "results": results,
+            "flashed_message_html": get_flashed_message_html(
+                flashed_message_text, "success"
+            ),
+        }
+    )
+
+
 @bp.route("/<int:appointment_id>/notes", methods=["POST"])
 @login_required
 @therapist_required
@@ -367,6 +671,7 @@ def notes(appointment_id: int) -> Response:
     form.interventions.update_association_data(
         parent=appointment.notes, child=Intervention, children="interventions"
     )
+    AppointmentSearch.index(appointment)
     db.session.commit()
 
     # Flash message using AJAX
@@ -424,6 +729,9 @@ def exercise(appointment_id: int) -> Response:
             appointment.exercise.client_response = form.client_response.data
         appointment.exercise.completed = form.completed.data
 
+    # Update full-text index with exercise set by therapist
+    if current_user.role == UserRole.THERAPIST:
+        AppointmentSearch.index(appointment)
     db.session.commit()
 
     # Construct template strings to updated completion status via AJAX
@@ -474,99 +782,11 @@ def filter():
     if submit_action == "filter":
         form.store_data_in_session(FILTERS_SESSION_KEY)
 
-        # Begin building the base query
-        query = db.select(Appointment)
-
-        # Apply filters by extending the query with conditions for each filter
-        if form.name.data:
-            search_term = f"%{form.name.data.lower()}%"
-            query = (
-                query.join(Client)
-                .join(User)
-                .where(
-                    func.lower(User.first_name + " " + User.last_name).like(search_term)
-                )
-            )
-
-        if form.start_date.data:
-            query = query.where(Appointment.time >= form.start_date.data)
-
-        if form.end_date.data:
-            query = query.where(Appointment.time <= form.end_date.data)
-
-        if form.appointment_status.data:
-            appointment_status = AppointmentStatus[form.appointment_status.data]
-            query = query.where(Appointment.appointment_status == appointment_status)
-
-        if form.payment_status.data:
-            payment_status = PaymentStatus[form.payment_status.data]
-            query = query.where(Appointment.payment_status == payment_status)
-
-        if form.therapy_type.data:
-            types = [TherapyType[t] for t in form.therapy_type.data]
-            type_conditions = [
-                Appointment.appointment_type.has(therapy_type=t) for t in types
-            ]
-            query = query.filter(or_(*type_conditions))
-
-        if form.therapy_mode.data:
-            modes = [TherapyMode[mode] for mode in form.therapy_mode.data]
-            mode_conditions = [
-                Appointment.appointment_type.has(therapy_mode=mode) for mode in modes
-            ]
-            query = query.filter(or_(*mode_conditions))
-
-        if form.duration.data:
-            query = query.where(
-                Appointment.appointment_type.has(duration=form.duration.data)
-            )
-
-        if form.fee_currency.data:
-            query = query.where(
-                Appointment.appointment_type.has(fee_currency=form.fee_currency.data)
-            )
-
-        if form.notes.data:
-            search_term = f"%{form.notes.data.lower()}%"
-            query = query.join(AppointmentNotes).where(
-                func.lower(AppointmentNotes.text).like(search_term)
-            )
-
-        if form.issues.data:
-            query = (
-                query.join(Appointment.notes)
-                .join(AppointmentNotes.issues)
-                .where(Issue.id.in_(form.issues.data))
-            )
-
-        if form.interventions.data:
-            query = (
-                query.join(Appointment.notes)
-                .join(AppointmentNotes.interventions)
-                .where(Intervention.id.in_(form.interventions.data))
-            )
-
-        if form.exercise_title.data:
-            search_term = f"%{form.exercise_title.data.lower()}%"
-            query = query.join(TherapyExercise).where(
-                func.lower(TherapyExercise.title).like(search_term)
-            )
-
-        if form.exercise_description.data:
-            search_term = f"%{form.exercise_description.data.lower()}%"
-            query = query.join(TherapyExercise).where(
-                func.lower(TherapyExercise.description).like(search_term)
-            )
-
-        if form.exercise_completed.data:
-            completed_status = form.exercise_completed.data == "True"
-            query = query.join(TherapyExercise).where(
-                TherapyExercise.completed == completed_status
-            )
-
-        # Execute query to filter appointments
-        filtered_appointments = (
-            db.session.execute(query.order_by(Appointment.time.desc())).scalars().all()
+        # Fetch page of appointments after cursor if provided
+        query = build_filter_query(form)
+        cursor = request.form.get("cursor")
+        filtered_appointments, next_cursor = paginate(
+            query, [Appointment.time, Appointment.id], cursor, descending=True
         )
 
         # Construct template string to insert updated appointments via AJAX
@@ -580,9 +800,19 @@ def filter():
             appointments=filtered_appointments,
         )
 
+        # Append next page of appointments to those already displayed
+        if cursor:
+            return jsonify(
+                {
+                    "success": True,
+                    "append_targets": {"appointment-rows": appointments_html},
+                    "next_cursor": next_cursor,
+                }
+            )
+
         filter_count_html = render_template_string(
-            "{{ appointments|length if appointments else 0}} appointments found",
-            appointments=filtered_appointments,
+            "{{ appointment_count }} appointments found",
+            appointment_count=count_rows(query),
         )
 
         return jsonify(
@@ -592,6 +822,7 @@ def filter():
                     "appointment-rows": appointments_html,
                     "filter-count": filter_count_html,
                 },
+                "next_cursor": next_cursor,
             }
         )
 
@@ -599,3 +830,110 @@ def filter():
     elif submit_action == "reset_filters":
         session.pop(FILTERS_SESSION_KEY, None)
         return jsonify({"success": True, "url": url_for("appointments.index")})
+
+
+def build_filter_query(form: FilterAppointmentsForm) -> Select:
+    # Dynamically choose the criteria to filter appointments depending on user's role
+    if current_user.role == UserRole.THERAPIST:
+        filter_criteria = Appointment.therapist_id == current_user.therapist.id
+    elif current_user.role == UserRole.CLIENT:
+        filter_criteria = Appointment.client_id == current_user.client.id
+
+    # Begin building the base query with the current user's appointments
+    query = db.select(Appointment).where(filter_criteria)
+
+    # Apply filters by extending the query with conditions for each filter
+    if form.name.data:
+        query = query.join(Client).join(User).where(User.name_matches(form.name.data))
+
+    if form.start_date.data:
+        query = query.where(Appointment.time >= form.start_date.data)
+
+    if form.end_date.data:
+        query = query.where(Appointment.time <= form.end_date.data)
+
+    if form.appointment_status.data:
+        appointment_status = AppointmentStatus[form.appointment_status.data]
+        query = query.where(Appointment.appointment_status == appointment_status)
+
+    if form.payment_status.data:
+        payment_status = PaymentStatus[form.payment_status.data]
+        query = query.where(Appointment.payment_status == payment_status)
+
+    if any(form.therapy_type.data or []):
+        types = [TherapyType[t] for t in form.therapy_type.data if t]
+        type_conditions = [
+            Appointment.appointment_type.has(therapy_type=t) for t in types
+        ]
+        query = query.filter(or_(*type_conditions))
+
+    if any(form.therapy_mode.data or []):
+        modes = [TherapyMode[mode] for mode in form.therapy_mode.data if mode]
+        mode_conditions = [
+            Appointment.appointment_type.has(therapy_mode=mode) for mode in modes
+        ]
+        query = query.filter(or_(*mode_conditions))
+
+    if form.duration.data:
+        query = query.where(
+            Appointment.appointment_type.has(duration=form.duration.data)
+        )
+
+    if form.fee_currency.data:
+        query = query.where(
+            Appointment.appointment_type.has(fee_currency=form.fee_currency.data)
+        )
+
+    if form.notes.data:
+        query = query.where(
+            Appointment.id.in_(AppointmentSearch.match("notes", form.notes.data))
+        )
+
+    # Match notes with any selected issues or interventions using EXISTS, so that
+    # notes matching several are counted and paginated once
+    if form.issues.data:
+        query = query.where(
+            Appointment.notes.has(
+                AppointmentNotes.issues.any(Issue.id.in_(form.issues.data))
+            )
+        )
+
+    if form.interventions.data:
+        query = query.where(
+            Appointment.notes.has(
+                AppointmentNotes.interventions.any(
+                    Intervention.id.in_(form.interventions.data)
+                )
+            )
+        )
+
+    if form.exercise_title.data:
+        query = query.where(
+            Appointment.id.in_(
+                AppointmentSearch.match("exercise_title", form.exercise_title.data)
+            )
+        )
+
+    if form.exercise_description.data:
+        query = query.where(
+            Appointment.id.in_(
+                AppointmentSearch.match(
+                    "exercise_description", form.exercise_description.data
+                )
+            )
+        )
+
+    if form.exercise_completed.data:
+        completed_status = form.exercise_completed.data == "True"
+        query = query.join(TherapyExercise).where(
+            TherapyExercise.completed == completed_status
+        )
+
+    return query
+
+
+@bp.cli.command("backfill-search")
+def backfill_search() -> None:
+    # Build full-text index for appointments created before it was maintained
+    click.echo(f"Indexed notes of {AppointmentSearch.backfill()} appointments")
+    return
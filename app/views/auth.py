@@ -47,19 +47,20 @@ def register() -> Response:
     # Insert user into database
     try:
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
 
     except IntegrityError:
         db.session.rollback()
         errors = {"email": ["Email address is already in use."]}
         return jsonify({"success": False, "errors": errors})
 
-    # Send verification email
+    # Send verification email once user is committed
     email_message = EmailMessage(
         recipient=user,
         subject=EmailSubject.EMAIL_VERIFICATION,
     )
     email_message.send()
+    db.session.commit()
 
     # Store email in session for email verification
     session["email"] = user.email
@@ -132,6 +133,7 @@ def verify_email() -> Response:
         subject=EmailSubject.EMAIL_VERIFICATION,
     )
     email_message.send()
+    db.session.commit()
 
     flash(f"Email verification instructions sent to {user.email}", "info")
     return jsonify({"success": True, "url": url_for("auth.verify_email")})
@@ -198,6 +200,7 @@ def request_password_reset() -> Response:
         subject=EmailSubject.PASSWORD_RESET,
     )
     email_message.send()
+    db.session.commit()
 
     flash(f"Password reset instructions sent to {form.email.data.lower()}", "info")
     return jsonify({"success": True, "url": url_for("main.index")})
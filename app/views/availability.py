@@ -0,0 +1,159 @@
+from flask import Blueprint, Response, abort, flash, jsonify, url_for
+from flask_login import current_user, login_required
+
+from app import db
+from app.forms.availability import (AvailabilityExceptionForm,
+                                    DeleteAvailabilityExceptionForm,
+                                    DeleteWorkingHoursForm, WorkingHoursForm)
+from app.models.availability import AvailabilityException, WorkingHours
+from app.utils.decorators import therapist_required
+
+bp = Blueprint("availability", __name__, url_prefix="/availability")
+
+
+def availability_section_response(message: str, category: str) -> Response:
+    flash(message, category)
+    return jsonify(
+        {
+            "success": True,
+            "url": url_for(
+                "therapists.therapist",
+                therapist_id=current_user.therapist.id,
+                section="availability",
+            ),
+        }
+    )
+
+
+@bp.route("/working-hours/create", methods=["POST"])
+@login_required
+@therapist_required
+def create_working_hours():
+    form = WorkingHoursForm(prefix="new")
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify({"success": False, "errors": form.errors, "form_prefix": "new"})
+
+    db.session.add(
+        WorkingHours(
+            therapist_id=current_user.therapist.id,
+            weekday=int(form.weekday.data),
+            start_time=form.start_time.data,
+            end_time=form.end_time.data,
+        )
+    )
+    db.session.commit()
+    return availability_section_response("Working hours added", "success")
+
+
+@bp.route("/working-hours/update/<int:working_hours_id>", methods=["POST"])
+@login_required
+@therapist_required
+def update_working_hours(working_hours_id: int):
+    working_hours = db.get_or_404(WorkingHours, working_hours_id)
+
+    # Working hours do not belong to this therapist
+    if working_hours.therapist_id != current_user.therapist.id:
+        abort(403)
+
+    form = WorkingHoursForm(prefix=f"hours-{working_hours_id}")
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify(
+            {
+                "success": False,
+                "errors": form.errors,
+                "form_prefix": f"hours-{working_hours_id}",
+            }
+        )
+
+    working_hours.weekday = int(form.weekday.data)
+    working_hours.start_time = form.start_time.data
+    working_hours.end_time = form.end_time.data
+    db.session.commit()
+    return availability_section_response("Working hours updated", "success")
+
+
+@bp.route("/working-hours/delete", methods=["POST"])
+@login_required
+@therapist_required
+def delete_working_hours():
+    form = DeleteWorkingHoursForm()
+    working_hours = db.get_or_404(WorkingHours, form.working_hours_id.data)
+
+    # Working hours do not belong to this therapist
+    if working_hours.therapist_id != current_user.therapist.id:
+        abort(403)
+
+    db.session.delete(working_hours)
+    db.session.commit()
+    return availability_section_response("Working hours deleted", "warning")
+
+
+@bp.route("/exceptions/create", methods=["POST"])
+@login_required
+@therapist_required
+def create_exception():
+    form = AvailabilityExceptionForm(prefix="new")
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify({"success": False, "errors": form.errors, "form_prefix": "new"})
+
+    db.session.add(
+        AvailabilityException(
+            therapist_id=current_user.therapist.id,
+            start=form.start.data,
+            end=form.end.data,
+            is_available=form.is_available.data,
+        )
+    )
+    db.session.commit()
+    return availability_section_response("Exception added", "success")
+
+
+@bp.route("/exceptions/update/<int:exception_id>", methods=["POST"])
+@login_required
+@therapist_required
+def update_exception(exception_id: int):
+    exception = db.get_or_404(AvailabilityException, exception_id)
+
+    # Exception does not belong to this therapist
+    if exception.therapist_id != current_user.therapist.id:
+        abort(403)
+
+    form = AvailabilityExceptionForm(prefix=f"exception-{exception_id}")
+
+    # Invalid form submission - return errors
+    if not form.validate_on_submit():
+        return jsonify(
+            {
+                "success": False,
+                "errors": form.errors,
+                "form_prefix": f"exception-{exception_id}",
+            }
+        )
+
+    exception.start = form.start.data
+    exception.end = form.end.data
+    exception.is_available = form.is_available.data
+    db.session.commit()
+    return availability_section_response("Exception updated", "success")
+
+
+@bp.route("/exceptions/delete", methods=["POST"])
+@login_required
+@therapist_required
+def delete_exception():
+    form = DeleteAvailabilityExceptionForm()
+    exception = db.get_or_404(AvailabilityException, form.exception_id.data)
+
+    # Exception does not belong to this therapist
+    if exception.therapist_id != current_user.therapist.id:
+        abort(403)
+
+    db.session.delete(exception)
+    db.session.commit()
+    return availability_section_response("Exception deleted", "warning")
@@ -1,15 +1,18 @@
+from collections import defaultdict
 from datetime import timedelta
+from typing import Dict
 
 from flask import (Blueprint, Response, abort, flash, jsonify, render_template,
                    render_template_string, request, session, url_for)
 from flask_login import current_user, login_required
-from sqlalchemy import func
+from sqlalchemy import String, cast, func, literal, union_all
+from sqlalchemy.sql import Select
 
 from app import db
 from app.forms.clients import ClientProfileForm, FilterClientsForm
 from app.forms.treatment_plans import TreatmentPlanForm
 from app.forms.users import UserProfileForm
-from app.models.appointment import Appointment
+from app.models.associations import client_issue
 from app.models.client import Client
 from app.models.enums import UserRole
 from app.models.issue import Issue
@@ -17,6 +20,7 @@ from app.models.treatment_plan import TreatmentPlan
 from app.models.user import User
 from app.utils.decorators import client_required, therapist_required
 from app.utils.formatters import age_to_date_of_birth
+from app.utils.pagination import count_rows, paginate
 
 bp = Blueprint("clients", __name__, url_prefix="/clients")
 FILTERS_SESSION_KEY = "client_filters"
@@ -34,26 +38,13 @@ def index() -> Response:
     )
 
     if current_user.therapist:
-        # Retrieve client IDs through appointments with the current therapist
-        client_ids_query = (
-            db.select(Appointment.client_id)
-            .where(Appointment.therapist_id == current_user.therapist.id)
-            .distinct()
-        ).subquery()
-
-        # Fetch clients the therapist has seen
-        clients = (
-            db.session.execute(
-                db.select(Client).where(
-                    Client.id.in_(db.select(client_ids_query.c.client_id))
-                )
-            )
-            .scalars()
-            .all()
-        )
+        # Fetch first page of the therapist's clients matching filters stored in session
+        query = build_filter_query(filter_form)
+        clients, next_cursor = paginate(query, [Client.id])
+        client_count = count_rows(query)
 
     else:
-        clients = None
+        clients, next_cursor, client_count = None, None, 0
 
     # Render template
     return render_template(
@@ -61,6 +52,8 @@ def index() -> Response:
         active_page="clients",
         filter_form=filter_form,
         clients=clients,
+        client_count=client_count,
+        next_cursor=next_cursor,
     )
 
 
@@ -111,7 +104,7 @@ def client(client_id: int) -> Response:
     # Current user is a therapist with no appointments with this client
     elif (
         current_user.role == UserRole.THERAPIST
-        and client not in current_user.therapist.clients
+        and not current_user.therapist.has_client(client)
     ):
         abort(403)
 
@@ -279,50 +272,10 @@ def filter() -> Response:
         # Store filter settings in the session
         form.store_data_in_session(FILTERS_SESSION_KEY)
 
-        # Retrieve client IDs through appointments with the current therapist
-        client_ids_query = (
-            db.select(Appointment.client_id)
-            .where(Appointment.therapist_id == current_user.therapist.id)
-            .distinct()
-        ).subquery()
-
-        # Begin building the base query, including only clients the therapist has seen
-        query = db.select(Client).where(
-            Client.id.in_(db.select(client_ids_query.c.client_id))
-        )
-
-        # Apply filters by extending the query with conditions for each filter
-        if form.name.data:
-            search_term = f"%{form.name.data.lower()}%"
-            query = query.join(User).where(
-                func.lower(User.first_name + " " + User.last_name).like(search_term)
-            )
-
-        if form.gender.data:
-            query = query.where(Client.user.has(gender=form.gender.data))
-
-        if form.min_age.data:
-            min_age_dob = age_to_date_of_birth(form.min_age.data + 1) - timedelta(
-                days=1
-            )
-            query = query.filter(Client.date_of_birth <= min_age_dob)
-
-        if form.max_age.data:
-            max_age_dob = age_to_date_of_birth(form.max_age.data)
-            query = query.filter(Client.date_of_birth >= max_age_dob)
-
-        if form.occupation.data:
-            query = query.where(Client.occupation == form.occupation.data)
-
-        if form.issues.data:
-            for issue_id in form.issues.data:
-                query = query.where(Client.issues.any(Issue.id == issue_id))
-
-        if form.referral_source.data:
-            query = query.where(Client.referral_source == form.referral_source.data)
-
-        # Execute query to filter clients
-        filtered_clients = db.session.execute(query).scalars().all()
+        # Fetch page of clients after cursor if provided
+        query = build_filter_query(form)
+        cursor = request.form.get("cursor")
+        filtered_clients, next_cursor = paginate(query, [Client.id], cursor)
 
         # Construct template strings to insert updated clients via AJAX
         clients_html = render_template_string(
@@ -333,9 +286,19 @@ def filter() -> Response:
             clients=filtered_clients,
         )
 
+        # Append next page of clients to those already displayed
+        if cursor:
+            return jsonify(
+                {
+                    "success": True,
+                    "append_targets": {"client-cards": clients_html},
+                    "next_cursor": next_cursor,
+                }
+            )
+
         filter_count_html = render_template_string(
-            "{{ clients|length if clients else 0}} clients found",
-            clients=filtered_clients,
+            "{{ client_count }} clients found",
+            client_count=count_rows(query),
         )
 
         return jsonify(
@@ -345,6 +308,8 @@ def filter() -> Response:
                     "client-cards": clients_html,
                     "filter-count": filter_count_html,
                 },
+                "facet_counts": build_facet_counts(query),
+                "next_cursor": next_cursor,
             }
         )
 
@@ -352,3 +317,74 @@ def filter() -> Response:
     elif submit_action == "reset_filters":
         session.pop(FILTERS_SESSION_KEY, None)
         return jsonify({"success": True, "url": url_for("clients.index")})
+
+
+def build_filter_query(form: FilterClientsForm) -> Select:
+    # Begin building the base query, including only clients the therapist has seen
+    query = current_user.therapist.clients()
+
+    # Apply filters by extending the query with conditions for each filter
+    if form.name.data:
+        query = query.join(User).where(User.name_matches(form.name.data))
+
+    if form.gender.data:
+        query = query.where(Client.user.has(gender=form.gender.data))
+
+    if form.min_age.data:
+        min_age_dob = age_to_date_of_birth(form.min_age.data + 1) - timedelta(days=1)
+        query = query.filter(Client.date_of_birth <= min_age_dob)
+
+    if form.max_age.data:
+        max_age_dob = age_to_date_of_birth(form.max_age.data)
+        query = query.filter(Client.date_of_birth >= max_age_dob)
+
+    if form.occupation.data:
+        query = query.where(Client.occupation == form.occupation.data)
+
+    if form.issues.data:
+        for issue_id in form.issues.data:
+            query = query.where(Client.issues.any(Issue.id == issue_id))
+
+    if form.referral_source.data:
+        query = query.where(Client.referral_source == form.referral_source.data)
+
+    return query
+
+
+def build_facet_counts(query: Select) -> Dict[str, Dict[str, int]]:
+    # Count filtered clients per option of each facet in a single grouped query
+    clients = query.subquery()
+    facets = [
+        db.select(
+            literal("gender").label("facet"),
+            cast(User.gender, String).label("value"),
+            func.count().label("count"),
+        )
+        .select_from(clients)
+        .join(User, User.id == clients.c.user_id)
+        .group_by(User.gender),
+        db.select(
+            literal("occupation"),
+            cast(clients.c.occupation, String),
+            func.count(),
+        ).group_by(clients.c.occupation),
+        db.select(
+            literal("referral_source"),
+            cast(clients.c.referral_source, String),
+            func.count(),
+        ).group_by(clients.c.referral_source),
+        db.select(
+            literal("issues"),
+            cast(client_issue.c.issue_id, String),
+            func.count(),
+        )
+        .select_from(clients)
+        .join(client_issue, client_issue.c.client_id == clients.c.id)
+        .group_by(client_issue.c.issue_id),
+    ]
+
+    counts = defaultdict(dict)
+    for facet, value, count in db.session.execute(union_all(*facets)):
+        if value is not None:
+            counts[facet][value] = count
+    return dict(counts)
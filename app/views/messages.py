@@ -1,15 +1,19 @@
+import json
 from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
+import click
 from flask import (Blueprint, Response, abort, jsonify, redirect,
-                   render_template, request, url_for)
+                   render_template, render_template_string, request, url_for)
 from flask_login import current_user, login_required
 
-from app import db
+from app import db, event_broker
 from app.forms.messages import SendMessageForm
 from app.models.conversation import Conversation
 from app.models.enums import UserRole
 from app.models.message import Message
 from app.utils.formatters import format_time_since
+from app.utils.pagination import encode_cursor, paginate
 
 bp = Blueprint("messages", __name__, url_prefix="/messages")
 
@@ -17,48 +21,17 @@ bp = Blueprint("messages", __name__, url_prefix="/messages")
 @bp.route("/", methods=["GET"])
 @login_required
 def index():
-    # Dynamically choose the criteria to filter conversations depending on user's role
-    if current_user.role == UserRole.THERAPIST:
-        filter_criteria = Conversation.therapist_user_id == current_user.id
-    elif current_user.role == UserRole.CLIENT:
-        filter_criteria = Conversation.client_user_id == current_user.id
-
-    # Fetch conversations that have messages
-    conversations_with_messages = (
-        db.session.execute(
-            db.select(Conversation)
-            .join(Message)
-            .where(filter_criteria)
-            .group_by(Conversation.id)
-            .order_by(db.func.max(Message.timestamp).desc())
-        )
-        .scalars()
-        .all()
-    )
-
-    # Fetch conversations without messages
-    conversations_without_messages = (
-        db.session.execute(
-            db.select(Conversation)
-            .where(filter_criteria)
-            .outerjoin(Message)
-            .having(db.func.count(Message.id) == 0)
-            .group_by(Conversation.id)
-        )
-        .scalars()
-        .all()
+    # Fetch conversations with their latest messages in a single query
+    conversations = (
+        db.session.execute(Conversation.inbox(current_user)).scalars().unique().all()
     )
 
-    # Combine lists, inserting new conversations first
-    conversations = conversations_without_messages + conversations_with_messages
-
     for conversation in conversations:
         # Store latest message and time for menu bar
-        if conversation.messages:
-            latest_message = conversation.messages[-1]
-            conversation.latest_message_content = latest_message.content
+        if conversation.last_message:
+            conversation.latest_message_content = conversation.last_message.content
             conversation.time_since_latest_message = format_time_since(
-                latest_message.timestamp
+                conversation.last_message_at
             )
 
         # Handle new conversations with no messages
@@ -66,19 +39,25 @@ def index():
             conversation.latest_message_content = "Start a new conversation"
             conversation.time_since_latest_message = ""
 
-        # Initialise form to send messages to this conversation
-        conversation.form = SendMessageForm(
-            prefix=str(conversation.id),
-            id=f"send-message-{conversation.id}",
-            endpoint=url_for("messages.send", conversation_id=conversation.id),
-        )
+    # Render latest messages of conversation from request, or first conversation
+    section = request.args.get("section")
+    selected = next(
+        (c for c in conversations if str(c.id) == section),
+        conversations[0] if conversations else None,
+    )
+    messages, history_cursor = fetch_message_page(selected) if selected else ([], None)
 
     # Render template with conversation from request selected as default
     return render_template(
         "messages.html",
         active_page="messages",
-        default_section=request.args.get("section"),
+        default_section=section,
         conversations=conversations,
+        selected_conversation_id=selected.id if selected else None,
+        messages=messages,
+        history_cursor=history_cursor,
+        # Form to send messages, rendered for each conversation
+        form=SendMessageForm(),
     )
 
 
@@ -110,29 +89,176 @@ def conversation(therapist_user_id: int, client_user_id: int) -> Response:
     return redirect(url_for("messages.index", section=conversation.id))
 
 
+@bp.route("/<int:conversation_id>/history", methods=["GET"])
+@login_required
+def history(conversation_id: int) -> Response:
+    conversation = db.get_or_404(Conversation, conversation_id)
+
+    # Current user is not a participant in this conversation
+    if not conversation.has_participant(current_user.id):
+        abort(403)
+
+    # Fetch page of messages sent before message from request, or latest messages
+    messages, next_cursor = fetch_message_page(
+        conversation, request.args.get("before", type=int)
+    )
+
+    # Construct template string to insert older messages via AJAX
+    messages_html = render_template_string(
+        """
+        {% from "_macros.html" import message_bubbles with context %}
+        {{ message_bubbles(messages) }}
+        """,
+        messages=messages,
+    )
+
+    return jsonify(
+        {
+            "success": True,
+            "prepend_targets": {f"messages-{conversation.id}": messages_html},
+            "next_cursor": next_cursor,
+        }
+    )
+
+
 @bp.route("/<int:conversation_id>/update", methods=["POST"])
+@login_required
 def send(conversation_id: int) -> Response:
-    form = SendMessageForm(prefix=str(conversation_id))
+    conversation = db.get_or_404(Conversation, conversation_id)
+
+    # Current user is not a participant in this conversation
+    if not conversation.has_participant(current_user.id):
+        abort(403)
+
+    form = SendMessageForm()
 
     # Do nothing if form is submitted without any text
     if not form.validate_on_submit():
         return jsonify({"success": True})
 
     message = Message(
-        conversation_id=conversation_id,
         author_id=current_user.id,
         content=form.message.data,
         timestamp=datetime.now(),
     )
-    db.session.add(message)
+    conversation.add_message(message)
     db.session.commit()
+
+    # Deliver message to open pages of both participants, including the author's
+    publish_message(conversation, message)
+    return jsonify({"success": True, "reset_form": True})
+
+
+@bp.route("/<int:conversation_id>/read", methods=["POST"])
+@login_required
+def read(conversation_id: int) -> Response:
+    conversation = db.get_or_404(Conversation, conversation_id)
+
+    # Current user is not a participant in this conversation
+    if not conversation.has_participant(current_user.id):
+        abort(403)
+
+    # Mark messages as read up to message from request, or latest message
+    message_id = request.form.get("message_id", type=int)
+    if message_id:
+        message = db.get_or_404(Message, message_id)
+        if message.conversation_id != conversation.id:
+            abort(404)
+    else:
+        message_id = conversation.last_message_id
+
+    if message_id and conversation.mark_read(current_user.id, message_id):
+        db.session.commit()
+
+        # Show read receipt on other participant's open pages
+        other_user_id = (
+            conversation.client_user_id
+            if current_user.id == conversation.therapist_user_id
+            else conversation.therapist_user_id
+        )
+        event_broker.publish(
+            other_user_id,
+            "read",
+            {"conversation_id": conversation.id, "message_id": message_id},
+        )
+
     return jsonify(
         {
             "success": True,
-            "url": url_for(
-                "messages.index",
-                conversation_id=conversation_id,
-                section=conversation_id,
-            ),
+            "unread_count": conversation.unread_count,
+            "unread_message_count": current_user.unread_message_count,
         }
     )
+
+
+@bp.route("/stream", methods=["GET"])
+@login_required
+def stream() -> Response:
+    # Stream events published to current user as server-sent events
+    subscription = event_broker.subscribe(current_user.id)
+
+    def generate() -> Iterator[str]:
+        try:
+            yield ": connected\n\n"
+            while True:
+                data = subscription.get(timeout=event_broker.heartbeat)
+
+                # Send comment periodically to keep idle connection open
+                if data is None:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                event = json.loads(data)
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def publish_message(conversation: Conversation, message: Message) -> None:
+    data = {
+        "conversation_id": conversation.id,
+        "message_id": message.id,
+        "author_id": message.author_id,
+        "content": message.content,
+        "timestamp": message.timestamp.strftime("%a %-d %b %Y, %I:%M %p"),
+        "time_since": format_time_since(message.timestamp),
+    }
+    for user_id in [conversation.therapist_user_id, conversation.client_user_id]:
+        event_broker.publish(user_id, "message", data)
+    return
+
+
+# Fetch a page of messages in chronological order, ending before the message with
+# this ID, along with the ID to request the preceding page with
+def fetch_message_page(
+    conversation: Conversation, before: Optional[int] = None
+) -> Tuple[List[Message], Optional[int]]:
+    cursor = None
+    if before:
+        message = db.session.get(Message, before)
+        if not message or message.conversation_id != conversation.id:
+            abort(404)
+        cursor = encode_cursor([message.timestamp, message.id])
+
+    messages, next_cursor = paginate(
+        db.select(Message).filter_by(conversation_id=conversation.id),
+        [Message.timestamp, Message.id],
+        cursor,
+        descending=True,
+    )
+    return messages[::-1], messages[-1].id if next_cursor else None
+
+
+@bp.cli.command("backfill-last-messages")
+def backfill_last_messages() -> None:
+    # Record latest message of conversations created before it was maintained
+    count = Conversation.refresh_last_messages()
+    db.session.commit()
+    click.echo(f"Backfilled latest message of {count} conversations")
+    return
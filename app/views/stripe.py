@@ -1,18 +1,27 @@
 import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
 
+import click
 import stripe
-from flask import (Blueprint, abort, current_app, flash, json, jsonify,
-                   redirect, request, session, url_for)
+from flask import (Blueprint, abort, after_this_request, current_app, flash,
+                   json, jsonify, redirect, request, session, url_for)
 from flask_login import current_user, login_required
 
-from app import csrf, db
+from app import csrf, db, stripe_client
 from app.models.appointment import Appointment
-from app.models.enums import EmailSubject, PaymentStatus
-from app.utils.decorators import therapist_required
-from app.utils.mail import send_appointment_update_email
+from app.models.enums import AppointmentStatus, PaymentStatus
+from app.models.stripe_event import StripeEvent
+from app.utils.celery import process_stripe_events
+from app.utils.decorators import client_required, therapist_required
+from app.utils.stripe_events import (process_events,
+                                     process_events_after_request)
 
 bp = Blueprint("stripe", __name__, url_prefix="/stripe")
 
+# Shortest time Stripe allows a checkout session to stay open for
+STRIPE_MIN_CHECKOUT_DURATION = timedelta(minutes=30)
+
 
 @bp.route("/create-account", methods=["POST"])
 @login_required
@@ -20,7 +29,7 @@ bp = Blueprint("stripe", __name__, url_prefix="/stripe")
 def create_account():
     # Call Stripe APIs to create and link account
     try:
-        account = stripe.Account.create(
+        account = stripe_client.create_account(
             type="standard",
             business_type="individual",
             email=current_user.email,
@@ -34,7 +43,7 @@ def create_account():
         # Store state in session for verification in /return endpoint
         session["stripe_onboarding_state"] = secrets.token_urlsafe()
 
-        account_link = stripe.AccountLink.create(
+        account_link = stripe_client.create_account_link(
             account=account.id,
             type="account_onboarding",
             refresh_url=url_for("stripe.stripe_refresh", _external=True),
@@ -95,7 +104,7 @@ def stripe_return():
 
     # Retrieve account via Stripe API
     account_id = request.args.get("account_id")
-    account = stripe.Account.retrieve(account_id)
+    account = stripe_client.retrieve_account(account_id)
 
     # Stripe onboarding incomplete - redirect
     if not account.details_submitted or not account.charges_enabled:
@@ -130,6 +139,57 @@ def stripe_return():
     )
 
 
+@bp.route("/checkout/<int:appointment_id>", methods=["GET"])
+@login_required
+@client_required
+def checkout(appointment_id: int):
+    # Fetch appointment with this ID
+    appointment = db.get_or_404(Appointment, appointment_id)
+
+    # Current user is not the client in this appointment
+    if appointment.client.user_id != current_user.id:
+        abort(403)
+
+    # Redirect to appointment if payment is not required
+    if (
+        appointment.payment_status == PaymentStatus.SUCCEEDED
+        or not appointment.therapist.stripe_account_id
+    ):
+        return redirect(
+            url_for("appointments.appointment", appointment_id=appointment.id)
+        )
+
+    # Slot is no longer held for appointment, or its hold can no longer be
+    # extended to keep a new checkout session open
+    if (
+        appointment.appointment_status == AppointmentStatus.CANCELLED
+        or (
+            appointment.hold_expires_at
+            and appointment.hold_expires_at <= datetime.now()
+        )
+        or (
+            appointment.hold_expires_at
+            and not reusable_checkout_session(appointment)
+            and not checkout_session_expiry(appointment)
+        )
+    ):
+        flash("Booking expired before payment, please book again", "warning")
+        return redirect(
+            url_for("appointments.appointment", appointment_id=appointment.id)
+        )
+
+    # Redirect the client to Stripe Checkout
+    checkout_session_url = get_checkout_session_url(appointment)
+    if not checkout_session_url:
+        flash(
+            "Failed to initiate payment via Stripe, please contact therapist", "error"
+        )
+        return redirect(
+            url_for("appointments.appointment", appointment_id=appointment.id)
+        )
+    return redirect(checkout_session_url)
+
+
 @bp.route("/webhook", methods=["POST"])
 @csrf.exempt
 def webhook():
@@ -163,83 +223,82 @@ def webhook():
             print("Webhook error while parsing basic request." + str(e))
             return jsonify(success=False), 400
 
-    # Handle the event
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        if session.payment_status == "paid":
-            handle_payment_succeeded(session)
-    elif event["type"] == "checkout.session.async_payment_succeeded":
-        handle_payment_succeeded(event["data"]["object"])
-    elif event["type"] == "checkout.session.async_payment_failed":
-        handle_payment_failed(event["data"]["object"])
-    else:
-        print(f"Unhandled event type {event['type']}")
+    # Store event and acknowledge it, leaving it to be processed by a worker, or
+    # once the response is sent without one. Redelivered events are ignored.
+    try:
+        is_new = StripeEvent.record(event, payload.decode())
+    except (KeyError, TypeError, ValueError) as e:
+        print("Webhook error while storing event", str(e))
+        return jsonify(success=False), 400
+
+    if is_new:
+        if current_app.config["CELERY_ENABLED"]:
+            try:
+                process_stripe_events.apply_async(retry=False)
+            except Exception as e:
+                print(f"Failed to process Stripe events asynchronously: {e}")
+        else:
+            after_this_request(process_events_after_request)
 
     return jsonify(success=True), 200
 
 
-def handle_payment_succeeded(session: stripe.checkout.Session):
-    # Fetch the appointment using the ID included in the session metadata
-    appointment_id = session.get("metadata").get("appointment_id")
-    appointment = db.session.execute(
-        db.select(Appointment).filter_by(id=appointment_id)
-    ).scalar_one()
-
-    # Return if appointment has already been updated
-    if appointment.payment_status == PaymentStatus.SUCCEEDED:
-        return
+def reusable_checkout_session(appointment: Appointment) -> bool:
+    # Whether appointment's checkout session is open beyond the expiry margin
+    margin = timedelta(seconds=current_app.config["STRIPE_CHECKOUT_EXPIRY_MARGIN"])
+    return bool(
+        appointment.checkout_session_url
+        and appointment.checkout_session_expires_at > datetime.now() + margin
+    )
 
-    # Update the appointment's payment status in the database
-    appointment.payment_status = PaymentStatus.SUCCEEDED
-    db.session.commit()
 
-    # Send email to client
-    send_appointment_update_email(
-        appointment=appointment,
-        recipient=appointment.client.user,
-        subject=EmailSubject.APPOINTMENT_CANCELLED,
+def checkout_session_expiry(
+    appointment: Appointment,
+) -> Optional[Tuple[datetime, datetime]]:
+    # Hold to keep and expiry of a new checkout session for held appointment, or
+    # None if its hold cannot be kept long enough for Stripe's minimum session
+    # length. Holds are extended for each new session, but never beyond a limit
+    # after booking, so that a slot cannot be held indefinitely by reopening
+    # checkout. Checkout closes a margin before hold expires so that late
+    # payments arrive while slot is still held, and after at most a day.
+    config = current_app.config
+    now = datetime.now()
+    hold_expires_at = max(
+        appointment.hold_expires_at,
+        min(
+            now + timedelta(seconds=config["APPOINTMENT_HOLD_TTL"]),
+            appointment.created_at + timedelta(seconds=config["APPOINTMENT_HOLD_MAX"]),
+        ),
     )
-
-    # Send email to therapist
-    send_appointment_update_email(
-        appointment=appointment,
-        recipient=appointment.therapist.user,
-        subject=EmailSubject.APPOINTMENT_CANCELLED,
+    expires_at = min(
+        hold_expires_at - timedelta(seconds=config["STRIPE_CHECKOUT_EXPIRY_MARGIN"]),
+        now + timedelta(days=1),
     )
-    return
-
-
-def handle_payment_failed(session: stripe.checkout.Session):
-    # Fetch the appointment using the ID included in the session metadata
-    appointment_id = session.get("metadata").get("appointment_id")
-    appointment = db.session.execute(
-        db.select(Appointment).filter_by(id=appointment_id)
-    ).scalar_one()
-
-    # Return if appointment has already been updated
-    if appointment.payment_status == PaymentStatus.SUCCEEDED:
-        return
+    if expires_at < now + STRIPE_MIN_CHECKOUT_DURATION:
+        return None
+    return hold_expires_at, expires_at
 
-    # Update the appointment's payment status in the database
-    appointment.payment_status = PaymentStatus.FAILED
-    db.session.commit()
 
-    # Send email to client
-    send_appointment_update_email(
-        appointment=appointment,
-        recipient=appointment.client.user,
-        subject=EmailSubject.PAYMENT_FAILED_CLIENT,
-    )
-    return
+def get_checkout_session_url(appointment: Appointment) -> Optional[str]:
+    # Reuse appointment's checkout session unless it is about to expire
+    if reusable_checkout_session(appointment):
+        return appointment.checkout_session_url
 
+    # Extend appointment's hold, if any, for as long as checkout is open
+    params = {}
+    if appointment.hold_expires_at:
+        expiry = checkout_session_expiry(appointment)
+        if not expiry:
+            return None
+        appointment.hold_expires_at, expires_at = expiry
+        params["expires_at"] = int(expires_at.timestamp())
 
-def create_checkout_session(appointment: Appointment) -> str:
     try:
         # Convert fee amount to cents for Stripe
         unit_amount = int(appointment.appointment_type.fee_amount * 100)
 
         # Create checkout session via Stripe API
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = stripe_client.create_checkout_session(
             payment_method_types=["card"],  # You can specify more methods if needed
             mode="payment",
             line_items=[
@@ -267,9 +326,42 @@ def create_checkout_session(appointment: Appointment) -> str:
                 _external=True,
             ),
             metadata={"appointment_id": appointment.id},
+            **params,
         )
-        return checkout_session.url
 
     except Exception as e:
         print(f"Stripe error: {e}")
         return None
+
+    # Store checkout session for later payment attempts
+    appointment.checkout_session_id = checkout_session.id
+    appointment.checkout_session_url = checkout_session.url
+    appointment.checkout_session_expires_at = datetime.fromtimestamp(
+        checkout_session.expires_at
+    )
+    db.session.commit()
+    return checkout_session.url
+
+
+@bp.cli.command("replay-events")
+@click.argument("event_ids", nargs=-1)
+@click.option("--failed", is_flag=True, help="Replay events which were given up on.")
+def replay_events(event_ids: Tuple[str], failed: bool) -> None:
+    # Queue stored events to be processed again, then process them
+    query = db.select(StripeEvent)
+    if event_ids:
+        query = query.where(StripeEvent.id.in_(event_ids))
+    elif failed:
+        query = query.where(
+            StripeEvent.processed_at.is_(None), StripeEvent.next_attempt_at.is_(None)
+        )
+    else:
+        raise click.UsageError("Provide event IDs or --failed")
+
+    events = db.session.execute(query).scalars().all()
+    for event in events:
+        event.replay()
+    db.session.commit()
+
+    click.echo(f"Replaying {len(events)} events, {process_events()} processed")
+    return
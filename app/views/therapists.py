@@ -1,25 +1,34 @@
-from flask import (Blueprint, Response, abort, flash, jsonify, render_template,
-                   render_template_string, request, session, url_for)
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import click
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify,
+                   render_template, render_template_string, request, session,
+                   url_for)
 from flask_login import current_user, login_required
-from sqlalchemy import func
 
 from app import db
 from app.forms.appointment_types import (AppointmentTypeForm,
                                          DeleteAppointmentTypeForm)
 from app.forms.appointments import BookAppointmentForm
+from app.forms.availability import (AvailabilityExceptionForm,
+                                    DeleteAvailabilityExceptionForm,
+                                    DeleteWorkingHoursForm, WorkingHoursForm)
 from app.forms.therapists import (CreateStripeAccountForm,
                                   FilterTherapistsForm, TherapistProfileForm)
 from app.forms.users import UserProfileForm
-from app.models.appointment_type import AppointmentType
+from app.models.availability import AvailabilityException, WorkingHours
 from app.models.enums import TherapyMode, TherapyType, UserRole
 from app.models.intervention import Intervention
 from app.models.issue import Issue
 from app.models.language import Language
 from app.models.therapist import Therapist
+from app.models.therapist_search import TherapistSearch
 from app.models.title import Title
 from app.models.treatment_plan import TreatmentPlan
-from app.models.user import User
 from app.utils.decorators import therapist_required
+from app.utils.facet_index import TherapistFacetIndex
+from app.utils.pagination import decode_cursor, encode_cursor
 
 bp = Blueprint("therapists", __name__, url_prefix="/therapists")
 FILTERS_SESSION_KEY = "therapist_filters"
@@ -34,17 +43,8 @@ def index() -> Response:
         data=session.get(FILTERS_SESSION_KEY, {}),
     )
 
-    # Fetch all active therapists
-    therapists = (
-        db.session.execute(
-            db.select(Therapist)
-            .join(User)
-            .where(User.active)
-            .where(Therapist.appointment_types.any(AppointmentType.active == True))
-        )
-        .scalars()
-        .all()
-    )
+    # Fetch first page of active therapists matching filters stored in session
+    therapists, next_cursor, therapist_count = filter_therapists(filter_form)
 
     # Render template
     return render_template(
@@ -52,6 +52,8 @@ def index() -> Response:
         active_page="therapists",
         filter_form=filter_form,
         therapists=therapists,
+        therapist_count=therapist_count,
+        next_cursor=next_cursor,
     )
 
 
@@ -111,11 +113,18 @@ def therapist(therapist_id: int) -> Response:
         "create_appt_type_form": None,
         "delete_appt_type_form": None,
         "update_appt_type_forms": [],
+        "create_working_hours_form": None,
+        "update_working_hours_forms": [],
+        "delete_working_hours_form": None,
+        "create_exception_form": None,
+        "update_exception_forms": [],
+        "delete_exception_form": None,
         "stripe_onboarding_form": None,
         "book_appointment_form": None,
     }
 
     treatment_plan = None
+    is_client = False
 
     if therapist.is_current_user:
         active_page = "profile"
@@ -157,6 +166,65 @@ def therapist(therapist_id: int) -> Response:
             for appointment_type in therapist.active_appointment_types
         ]
 
+        # Initialise forms to manage working hours and upcoming exceptions
+        forms["create_working_hours_form"] = WorkingHoursForm(
+            prefix="new",
+            id="working_hours_new",
+            endpoint=url_for("availability.create_working_hours"),
+        )
+
+        forms["update_working_hours_forms"] = [
+            WorkingHoursForm(
+                obj=working_hours,
+                prefix=f"hours-{working_hours.id}",
+                id=f"working_hours_{working_hours.id}",
+                endpoint=url_for(
+                    "availability.update_working_hours",
+                    working_hours_id=working_hours.id,
+                ),
+            )
+            for working_hours in db.session.execute(
+                db.select(WorkingHours)
+                .filter_by(therapist_id=therapist_id)
+                .order_by(WorkingHours.weekday, WorkingHours.start_time)
+            ).scalars()
+        ]
+
+        forms["delete_working_hours_form"] = DeleteWorkingHoursForm(
+            id="delete_working_hours",
+            endpoint=url_for("availability.delete_working_hours"),
+        )
+
+        forms["create_exception_form"] = AvailabilityExceptionForm(
+            prefix="new",
+            id="exception_new",
+            endpoint=url_for("availability.create_exception"),
+        )
+
+        forms["update_exception_forms"] = [
+            AvailabilityExceptionForm(
+                obj=exception,
+                prefix=f"exception-{exception.id}",
+                id=f"exception_{exception.id}",
+                endpoint=url_for(
+                    "availability.update_exception", exception_id=exception.id
+                ),
+            )
+            for exception in db.session.execute(
+                db.select(AvailabilityException)
+                .where(
+                    AvailabilityException.therapist_id == therapist_id,
+                    AvailabilityException.end > datetime.now(),
+                )
+                .order_by(AvailabilityException.start)
+            ).scalars()
+        ]
+
+        forms["delete_exception_form"] = DeleteAvailabilityExceptionForm(
+            id="delete_exception",
+            endpoint=url_for("availability.delete_exception"),
+        )
+
         forms["stripe_onboarding_form"] = CreateStripeAccountForm(
             id="stripe-onboarding-form",
             endpoint=url_for("stripe.create_account"),
@@ -177,7 +245,8 @@ def therapist(therapist_id: int) -> Response:
         )
 
         # Display treatment plan with this therapist
-        if current_user.client in therapist.clients:
+        is_client = therapist.has_client(current_user.client)
+        if is_client:
             treatment_plan = db.session.execute(
                 db.select(TreatmentPlan).filter_by(
                     therapist_id=therapist.id, client_id=current_user.client.id
@@ -193,6 +262,7 @@ def therapist(therapist_id: int) -> Response:
         TherapyType=TherapyType,
         TherapyMode=TherapyMode,
         forms=forms,
+        is_client=is_client,
         treatment_plan=treatment_plan,
     )
 
@@ -234,6 +304,9 @@ def create() -> Response:
     form.interventions.update_association_data(
         parent=therapist, child=Intervention, children="interventions"
     )
+
+    # Update denormalised search data for therapist directory
+    TherapistSearch.sync(therapist)
     db.session.commit()
 
     # Flash message via AJAX
@@ -287,6 +360,9 @@ def update(therapist_id: int) -> Response:
     form.interventions.update_association_data(
         parent=therapist, child=Intervention, children="interventions"
     )
+
+    # Update denormalised search data for therapist directory
+    TherapistSearch.sync(therapist)
     db.session.commit()
 
     # Flash message and reload page to propagate changes
@@ -321,83 +397,12 @@ def filter() -> Response:
         # Store filter settings in the session
         form.store_data_in_session(FILTERS_SESSION_KEY)
 
-        # Build base query for active therapists with active appointment types
-        query = (
-            db.select(Therapist)
-            .join(User)
-            .where(User.active)
-            .where(Therapist.appointment_types.any(AppointmentType.active == True))
+        # Fetch page of therapists after cursor if provided
+        cursor = request.form.get("cursor")
+        filtered_therapists, next_cursor, therapist_count = filter_therapists(
+            form, cursor
         )
 
-        # Apply filters by extending the query with conditions for each filter
-        if form.name.data:
-            search_term = f"%{form.name.data.lower()}%"
-            query = query.where(
-                func.lower(User.first_name + " " + User.last_name).like(search_term)
-            )
-
-        if form.therapy_type.data:
-            therapy_type = TherapyType[form.therapy_type.data]
-            query = query.where(
-                Therapist.appointment_types.any(
-                    (AppointmentType.therapy_type == therapy_type)
-                    & (AppointmentType.active == True)
-                )
-            )
-
-        if form.therapy_mode.data:
-            modes = [TherapyMode[mode] for mode in form.therapy_mode.data]
-            for mode in modes:
-                query = query.where(
-                    Therapist.appointment_types.any(
-                        (AppointmentType.therapy_mode == mode)
-                        & (AppointmentType.active == True)
-                    )
-                )
-
-        if form.duration.data:
-            query = query.where(
-                Therapist.appointment_types.any(
-                    (AppointmentType.duration == form.duration.data)
-                    & (AppointmentType.active == True)
-                )
-            )
-
-        if form.titles.data:
-            for title_id in form.titles.data:
-                query = query.where(Therapist.titles.any(Title.id == title_id))
-
-        if form.years_of_experience.data:
-            query = query.where(
-                Therapist.years_of_experience >= form.years_of_experience.data
-            )
-
-        if form.gender.data:
-            query = query.where(Therapist.user.has(gender=form.gender.data))
-
-        if form.language.data:
-            query = query.where(
-                Therapist.languages.any(Language.id == form.language.data)
-            )
-
-        if form.country.data:
-            query = query.where(Therapist.country == form.country.data)
-
-        if form.specialisations.data:
-            for specialisation_id in form.specialisations.data:
-                query = query.where(
-                    Therapist.specialisations.any(Issue.id == specialisation_id)
-                )
-
-        if form.interventions.data:
-            for intervention_id in form.interventions.data:
-                query = query.where(
-                    Therapist.interventions.any(Intervention.id == intervention_id)
-                )
-
-        # Execute query to filter therapists
-        filtered_therapists = db.session.execute(query).scalars().all()
-
         # Construct template strings to insert updated therapists via AJAX
         therapists_html = render_template_string(
             """
@@ -407,9 +412,19 @@ def filter() -> Response:
             therapists=filtered_therapists,
         )
 
+        # Append next page of therapists to those already displayed
+        if cursor:
+            return jsonify(
+                {
+                    "success": True,
+                    "append_targets": {"therapist-cards": therapists_html},
+                    "next_cursor": next_cursor,
+                }
+            )
+
         filter_count_html = render_template_string(
-            "{{ therapists|length if therapists else 0}} therapists found",
-            therapists=filtered_therapists,
+            "{{ therapist_count }} therapists found",
+            therapist_count=therapist_count,
         )
 
         return jsonify(
@@ -419,6 +434,8 @@ def filter() -> Response:
                     "therapist-cards": therapists_html,
                     "filter-count": filter_count_html,
                 },
+                "facet_counts": TherapistFacetIndex.get().facet_counts(form),
+                "next_cursor": next_cursor,
             }
         )
 
@@ -426,3 +443,45 @@ def filter() -> Response:
     elif submit_action == "reset_filters":
         session.pop(FILTERS_SESSION_KEY, None)
         return jsonify({"success": True, "url": url_for("therapists.index")})
+
+
+def filter_therapists(
+    form: FilterTherapistsForm, cursor: Optional[str] = None
+) -> Tuple[List[Therapist], Optional[str], int]:
+    # Match therapists against in-memory facet bitmaps rather than in SQL, so
+    # that only the page of therapists after cursor is fetched, along with the
+    # count of all matches
+    index = TherapistFacetIndex.get()
+    matches = index.match(form)
+    per_page = current_app.config["PAGE_SIZE"]
+    after = decode_cursor(cursor, [Therapist.id])[0] if cursor else None
+    if after is not None and not isinstance(after, int):
+        abort(400)
+
+    # Fetch an additional ID to determine whether another page exists
+    therapist_ids = index.ids(matches, after=after, limit=per_page + 1)
+    therapists = (
+        db.session.execute(
+            db.select(Therapist)
+            .where(Therapist.id.in_(therapist_ids[:per_page]))
+            .order_by(Therapist.id)
+            .options(*Therapist.directory_loader())
+        )
+        .scalars()
+        .all()
+    )
+
+    next_cursor = None
+    if len(therapist_ids) > per_page:
+        next_cursor = encode_cursor([therapist_ids[per_page - 1]])
+    return therapists, next_cursor, matches.bit_count()
+
+
+@bp.cli.command("backfill-search")
+@click.option("--batch-size", default=500, help="Therapists to commit at a time.")
+def backfill_search(batch_size: int) -> None:
+    # Build search data for therapists created before it was maintained on write
+    click.echo(
+        f"Backfilled search data for {TherapistSearch.backfill(batch_size)} therapists"
+    )
+    return
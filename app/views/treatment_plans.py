@@ -25,7 +25,7 @@ def create(therapist_id: int, client_id: int):
     client = db.get_or_404(Client, client_id)
 
     # Prevent unauthorised access
-    if therapist_id != current_user.id or client not in therapist.clients:
+    if not therapist.is_current_user or not therapist.has_client(client):
         abort(403)
 
     form = TreatmentPlanForm()
@@ -1,5 +1,6 @@
 import os
 
+import click
 from flask import (Blueprint, Response, abort, current_app, flash, jsonify,
                    request, url_for)
 from flask_login import current_user, login_required
@@ -7,6 +8,8 @@ from werkzeug.utils import secure_filename
 
 from app import db
 from app.forms.users import UserProfileForm
+from app.models.therapist_search import TherapistSearch
+from app.models.user import User
 from app.utils.files import get_file_extension
 
 bp = Blueprint("user", __name__, url_prefix="/user")
@@ -41,6 +44,10 @@ def update(user_id: int) -> Response:
     current_user.first_name = form.first_name.data
     current_user.last_name = form.last_name.data
     current_user.gender = form.gender.data
+
+    # Name and gender are denormalised into therapist search data
+    if current_user.therapist:
+        TherapistSearch.sync(current_user.therapist)
     db.session.commit()
 
     flash("Personal information updated", "success")
@@ -50,3 +57,13 @@ def update(user_id: int) -> Response:
             "url": url_for("profile.profile", user_id=current_user.id),
         }
     )
+
+
+@bp.cli.command("backfill-search-names")
+@click.option("--batch-size", default=500, help="Users to commit at a time.")
+def backfill_search_names(batch_size: int) -> None:
+    # Derive search names for users created before they were maintained on write
+    click.echo(
+        f"Backfilled search names of {User.backfill_search_names(batch_size)} users"
+    )
+    return
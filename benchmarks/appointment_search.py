@@ -0,0 +1,98 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import create_app, db
+from app.config import TestConfig
+from app.models.appointment import Appointment
+from app.models.appointment_notes import AppointmentNotes
+from app.models.appointment_search import AppointmentSearch
+
+WORDS = (
+    "anxiety sleep breathing grounding relapse boundaries exposure journaling "
+    "rumination motivation conflict grief panic avoidance mindfulness relationship "
+    "workload trauma progress homework schema thoughts feelings behaviour"
+).split()
+
+
+# Compare pattern matching against the full-text index on synthetic notes
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite")
+
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI: str = "sqlite:///" + path
+        FAKE_DATA: bool = False
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        print(f"Inserting {args.notes} notes into {path}")
+        for start in range(1, args.notes + 1, args.batch_size):
+            ids = range(start, min(start + args.batch_size, args.notes + 1))
+            db.session.execute(
+                sa.insert(Appointment),
+                [
+                    {
+                        "id": id,
+                        "therapist_id": 1,
+                        "client_id": 1,
+                        "appointment_type_id": 1,
+                        "time": datetime.now(),
+                    }
+                    for id in ids
+                ],
+            )
+            db.session.execute(
+                sa.insert(AppointmentNotes),
+                [
+                    {
+                        "appointment_id": id,
+                        "text": " ".join(random.choices(WORDS, k=30)),
+                    }
+                    for id in ids
+                ],
+            )
+        db.session.commit()
+
+        started = time.perf_counter()
+        AppointmentSearch.seed(db)
+        print(f"Built full-text index in {time.perf_counter() - started:.2f}s")
+
+        # Time each search path with a rare term matching few notes
+        db.session.execute(
+            sa.update(AppointmentNotes)
+            .where(AppointmentNotes.id % 10_000 == 0)
+            .values(text=AppointmentNotes.text + " xylophone")
+        )
+        AppointmentSearch.seed(db)
+
+        for fulltext in [False, True]:
+            app.extensions["appointment_search"] = fulltext
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                count = len(
+                    db.session.execute(AppointmentSearch.match("notes", "xylophone"))
+                    .scalars()
+                    .all()
+                )
+                timings.append(time.perf_counter() - started)
+            label = "full-text" if fulltext else "pattern"
+            print(
+                f"{label:>9}: {count} matches, best of {args.repeat}: {min(timings):.4f}s"
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import sqlalchemy as sa
+from faker import Faker
+
+from app import create_app, db
+from app.config import TestConfig
+from app.models.enums import UserRole
+from app.models.user import User
+from app.models.user_name_ngram import UserNameNgram
+from app.utils.formatters import normalise_search_text
+
+
+# Compare pattern matching on full names against the indexed search name
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite")
+
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI: str = "sqlite:///" + path
+        FAKE_DATA: bool = False
+
+    fake = Faker()
+    first_names = [fake.first_name() for _ in range(2_000)]
+    last_names = [fake.last_name() for _ in range(2_000)]
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        print(f"Inserting {args.users} users into {path}")
+        for start in range(1, args.users + 1, args.batch_size):
+            users = []
+            for id in range(start, min(start + args.batch_size, args.users + 1)):
+                first_name = random.choice(first_names)
+                last_name = random.choice(last_names)
+                users.append(
+                    {
+                        "id": id,
+                        "email": f"user{id}@example.com",
+                        "password_hash": "",
+                        "first_name": first_name,
+                        "last_name": last_name,
+                        "role": UserRole.CLIENT,
+                        "search_name": normalise_search_text(
+                            f"{first_name} {last_name}"
+                        ),
+                    }
+                )
+            db.session.execute(sa.insert(User), users)
+            db.session.execute(
+                sa.insert(UserNameNgram),
+                [
+                    {"user_id": user["id"], "ngram": ngram}
+                    for user in users
+                    for ngram in UserNameNgram.ngrams(user["search_name"])
+                ],
+            )
+        db.session.commit()
+
+        # Time each search path with a full name matching few users
+        term = f"{first_names[0][1:]} {last_names[0][:3]}"
+        conditions = {
+            "pattern": sa.func.lower(User.first_name + " " + User.last_name).like(
+                f"%{term.lower()}%"
+            ),
+            "indexed": User.name_matches(term),
+        }
+        for label, condition in conditions.items():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                count = len(
+                    db.session.execute(db.select(User.id).where(condition))
+                    .scalars()
+                    .all()
+                )
+                timings.append(time.perf_counter() - started)
+            print(
+                f"{label:>7}: {count} matches, best of {args.repeat}: {min(timings):.4f}s"
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
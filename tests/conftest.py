@@ -1,16 +1,22 @@
 import random
 from datetime import date
+from pathlib import Path
 from typing import Any, Generator
 
 import pytest
+import sqlalchemy as sa
+import stripe
 from faker import Faker
 from flask import Flask
 from flask.testing import FlaskClient
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 
-from app import create_app, db
+from app import (availability_index, create_app, db, event_broker,
+                 stripe_client, user_cache)
 from app.config import TestConfig
+from app.constants import (EXAMPLE_CLIENT_EMAIL, EXAMPLE_THERAPIST_EMAIL,
+                           EXAMPLE_VALID_PASSWORD)
 from app.models import SeedableMixin
 from app.models.client import Client
 from app.models.enums import Gender, Occupation, ReferralSource, UserRole
@@ -20,6 +26,7 @@ from app.models.language import Language
 from app.models.therapist import Therapist
 from app.models.title import Title
 from app.models.user import User
+from tests.fake_stripe import FakeStripe
 
 
 @pytest.fixture(scope="session")
@@ -35,6 +42,50 @@ def client(app: Flask) -> FlaskClient:
     return app.test_client()
 
 
+@pytest.fixture
+def file_app(app: Flask, tmp_path: Path) -> Generator[Flask, Any, None]:
+    # App using a database file, so that concurrent requests use separate
+    # connections as they would in production
+    config = type(
+        "FileTestConfig",
+        (TestConfig,),
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'mindli.sqlite'}",
+            "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}},
+        },
+    )
+    availability_index.entries.clear()
+    yield create_app(config=config)
+
+    # Teardown - restore extensions shared with test app
+    availability_index.entries.clear()
+    for extension in [user_cache, event_broker, stripe_client, availability_index]:
+        extension.init_app(app)
+    app.celery.set_default()
+    return
+
+
+@pytest.fixture(scope="session")
+def fake_stripe() -> Generator[FakeStripe, Any, None]:
+    server = FakeStripe()
+    server.start()
+    yield server
+    server.stop()
+    return
+
+
+@pytest.fixture(scope="function")
+def stripe_api(
+    fake_stripe: FakeStripe, monkeypatch: pytest.MonkeyPatch
+) -> Generator[FakeStripe, Any, None]:
+    # Direct Stripe API calls to fake server, with requests recorded per test
+    monkeypatch.setattr(stripe, "api_base", fake_stripe.url)
+    fake_stripe.requests.clear()
+    fake_stripe.failures = 0
+    yield fake_stripe
+    return
+
+
 @pytest.fixture(scope="session")
 def fake() -> Generator[Faker, Any, None]:
     fake = Faker()
@@ -50,6 +101,20 @@ def seeded_data():
     return seeded_data_dict
 
 
+@pytest.fixture(scope="function")
+def executed_queries(app: Flask) -> Generator[list, Any, None]:
+    # Record SQL statements executed against the database during a test
+    queries = []
+
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    sa.event.listen(db.engine, "before_cursor_execute", record_query)
+    yield queries
+    sa.event.remove(db.engine, "before_cursor_execute", record_query)
+    return
+
+
 @pytest.fixture(scope="module")
 def FAKE_PASSWORD() -> str:
     return "ValidPassword1"
@@ -147,6 +212,46 @@ def logged_in_therapist(
     return
 
 
+@pytest.fixture(scope="function")
+def logged_in_example_therapist(client: FlaskClient) -> Generator[User, Any, None]:
+    with client:
+        response = client.post(
+            "/login",
+            data={
+                "email": EXAMPLE_THERAPIST_EMAIL,
+                "password": EXAMPLE_VALID_PASSWORD,
+            },
+        )
+
+        assert response.status_code == 200
+        assert current_user.is_authenticated
+
+        yield current_user._get_current_object()
+
+        client.get("/logout")
+    return
+
+
+@pytest.fixture(scope="function")
+def logged_in_example_client(client: FlaskClient) -> Generator[User, Any, None]:
+    with client:
+        response = client.post(
+            "/login",
+            data={
+                "email": EXAMPLE_CLIENT_EMAIL,
+                "password": EXAMPLE_VALID_PASSWORD,
+            },
+        )
+
+        assert response.status_code == 200
+        assert current_user.is_authenticated
+
+        yield current_user._get_current_object()
+
+        client.get("/logout")
+    return
+
+
 @pytest.fixture(scope="module")
 def fake_registration_data(fake_user_client: User, FAKE_PASSWORD: str) -> dict:
     return {
@@ -0,0 +1,96 @@
+import time
+from threading import Thread
+from typing import List
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+class FakeStripe:
+    # Local stand-in for the Stripe API, serving the endpoints used by the app
+    # over HTTP so that calls go through the real Stripe client
+    def __init__(self) -> None:
+        self.requests: List[dict] = []
+        self.failures = 0
+        self.app = Flask(__name__)
+        self.app.before_request(self.fail_request)
+        self.app.add_url_rule(
+            "/v1/accounts", view_func=self.create_account, methods=["POST"]
+        )
+        self.app.add_url_rule(
+            "/v1/accounts/<account_id>", view_func=self.retrieve_account
+        )
+        self.app.add_url_rule(
+            "/v1/account_links", view_func=self.create_account_link, methods=["POST"]
+        )
+        self.app.add_url_rule(
+            "/v1/checkout/sessions",
+            view_func=self.create_checkout_session,
+            methods=["POST"],
+        )
+        self.server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> None:
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        return
+
+    def record_request(self) -> dict:
+        params = request.form.to_dict()
+        self.requests.append({"path": request.path, "params": params})
+        return params
+
+    def fail_request(self):
+        # Respond with a retryable error while failures are requested
+        if self.failures:
+            self.failures -= 1
+            self.record_request()
+            response = jsonify({"error": {"type": "api_error"}})
+            response.status_code = 500
+            response.headers["Stripe-Should-Retry"] = "true"
+            return response
+        return None
+
+    def create_account(self):
+        self.record_request()
+        return jsonify({"id": "acct_test", "object": "account"})
+
+    def retrieve_account(self, account_id: str):
+        self.record_request()
+        return jsonify(
+            {
+                "id": account_id,
+                "object": "account",
+                "details_submitted": True,
+                "charges_enabled": True,
+            }
+        )
+
+    def create_account_link(self):
+        params = self.record_request()
+        return jsonify(
+            {
+                "object": "account_link",
+                "url": f"https://connect.stripe.test/setup/{params['account']}",
+            }
+        )
+
+    def create_checkout_session(self):
+        params = self.record_request()
+        session_id = f"cs_test_{len(self.requests)}"
+        return jsonify(
+            {
+                "id": session_id,
+                "object": "checkout.session",
+                "url": f"https://checkout.stripe.test/c/pay/{session_id}",
+                "expires_at": int(time.time()) + 24 * 60 * 60,
+                "payment_status": "unpaid",
+                "metadata": {
+                    "appointment_id": params.get("metadata[appointment_id]"),
+                },
+            }
+        )
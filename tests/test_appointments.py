@@ -0,0 +1,690 @@
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import List
+from unittest.mock import Mock, patch
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from flask.testing import FlaskClient
+from flask_mail import Connection
+
+from app import availability_index, db
+from app.constants import (EXAMPLE_CLIENT_EMAIL, EXAMPLE_THERAPIST_EMAIL,
+                           EXAMPLE_VALID_PASSWORD)
+from app.models import User
+from app.models.appointment import Appointment
+from app.models.appointment_search import AppointmentSearch
+from app.models.appointment_series import AppointmentSeries
+from app.models.availability import AvailabilityException, WorkingHours
+from app.models.client import Client
+from app.models.enums import AppointmentStatus, EmailSubject
+from app.models.issue import Issue
+from app.models.therapist import Therapist
+from app.utils.appointment_series import (book_due_occurrences,
+                                          release_expired_holds)
+from app.utils.availability import TherapistAvailability
+from app.utils.mail import drain_outbox
+from tests.fake_stripe import FakeStripe
+
+
+@pytest.mark.parametrize("fulltext", [True, False])
+def test_filter_appointments_by_notes(
+    app: Flask,
+    client: FlaskClient,
+    logged_in_example_therapist: User,
+    monkeypatch: pytest.MonkeyPatch,
+    fulltext: bool,
+):
+    monkeypatch.setitem(app.extensions, "appointment_search", fulltext)
+    appointment = logged_in_example_therapist.therapist.appointments[0]
+
+    response = client.post(
+        f"/appointments/{appointment.id}/notes",
+        data={"text": "Discussed xylophonist breathing techniques", "efficacy": 4},
+    )
+    assert response.get_json()["success"] is True
+
+    # Search by word prefix finds only the updated appointment
+    response = client.post(
+        "/appointments/filter", data={"submit": "filter", "notes": "xylophon"}
+    )
+    data = response.get_json()
+    assert data["success"] is True
+    assert data["update_targets"]["filter-count"].strip() == "1 appointments found"
+    assert (
+        f"/appointments/{appointment.id}" in data["update_targets"]["appointment-rows"]
+    )
+    return
+
+
+def test_filter_appointments_by_issues_lists_each_once(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    appointment = logged_in_example_therapist.therapist.appointments[0]
+    issue_ids = [issue.id for issue in db.session.execute(db.select(Issue)).scalars()]
+    response = client.post(
+        f"/appointments/{appointment.id}/notes",
+        data={"text": "Discussed both issues", "efficacy": 3, "issues": issue_ids[:2]},
+    )
+    assert response.get_json()["success"] is True
+
+    # Appointment whose notes match two selected issues is counted and listed once
+    data = {"submit": "filter", "issues": issue_ids[:2]}
+    response = client.post("/appointments/filter", data=data).get_json()
+    count = int(response["update_targets"]["filter-count"].split()[0])
+    listed = []
+    while True:
+        listed += map(
+            int,
+            re.findall(
+                r'href="/appointments/(\d+)"',
+                response["update_targets"]["appointment-rows"],
+            ),
+        )
+        if not response["next_cursor"]:
+            break
+        response = client.post(
+            "/appointments/filter", data={**data, "cursor": response["next_cursor"]}
+        ).get_json()
+    assert appointment.id in listed
+    assert len(listed) == len(set(listed)) == count
+    return
+
+
+def test_appointment_search_falls_back_to_pattern_matching(
+    app: Flask, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setitem(app.extensions, "appointment_search", False)
+    query = str(AppointmentSearch.match("exercise_title", "breathing"))
+    assert "appointment_search" not in query and "LIKE" in query
+    return
+
+
+def test_backfill_appointment_search(app: Flask):
+    db.session.execute(sa.text("DROP TABLE appointment_search"))
+    db.session.commit()
+    app.extensions.pop("appointment_search")
+
+    result = app.test_cli_runner().invoke(args=["appointments", "backfill-search"])
+    appointment_count = db.session.execute(sa.func.count(Appointment.id)).scalar()
+    assert f"of {appointment_count} appointments" in result.output
+    assert app.extensions["appointment_search"] is True
+    assert (
+        db.session.execute(
+            db.select(sa.func.count()).select_from(AppointmentSearch.table)
+        ).scalar()
+        == appointment_count
+    )
+    return
+
+
+def test_availability_excludes_busy_and_off_hours():
+    start = datetime(2030, 1, 7, 9)  # Monday
+    availability = TherapistAvailability(
+        working_hours={0: [(time(9), time(12))]},
+        exceptions=[(datetime(2030, 1, 7, 11), datetime(2030, 1, 7, 12), False)],
+    )
+    availability.set_appointment(1, (start, start + timedelta(minutes=60)))
+
+    slots = availability.open_slots(
+        timedelta(minutes=30), start, start + timedelta(days=6), timedelta(minutes=15)
+    )
+    assert [slot.strftime("%H:%M") for slot in slots] == ["10:00", "10:15", "10:30"]
+
+    # Appointment being moved does not conflict with itself
+    assert not availability.is_open(start, timedelta(minutes=30))
+    assert availability.is_open(start, timedelta(minutes=30), appointment_id=1)
+
+    # Cancelled appointment frees its slot
+    availability.set_appointment(1, None)
+    assert availability.is_open(start, timedelta(minutes=30))
+    return
+
+
+def test_availability_without_working_hours_is_open_except_time_off():
+    start = datetime(2030, 1, 5, 22)  # Saturday
+    availability = TherapistAvailability(
+        working_hours={},
+        exceptions=[(datetime(2030, 1, 6, 9), datetime(2030, 1, 6, 17), False)],
+    )
+    assert availability.is_open(start, timedelta(minutes=60))
+    assert not availability.is_open(datetime(2030, 1, 6, 12), timedelta(minutes=30))
+    return
+
+
+def test_manage_working_hours_and_exceptions(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    therapist_id = logged_in_example_therapist.therapist.id
+    start = datetime.combine(date.today() + timedelta(days=90), time(20))
+    while start.weekday() != 0:
+        start += timedelta(days=1)
+    assert not availability_index.is_open(therapist_id, start, 30)
+
+    # End of working hours must be after their start
+    response = client.post(
+        "/availability/working-hours/create",
+        data={"new-weekday": "0", "new-start_time": "19:00", "new-end_time": "18:00"},
+    )
+    assert response.get_json()["errors"] == {"end_time": ["Must be after start."]}
+
+    # Added evening hours on Mondays open slot
+    response = client.post(
+        "/availability/working-hours/create",
+        data={"new-weekday": "0", "new-start_time": "19:00", "new-end_time": "21:00"},
+    )
+    assert response.get_json()["success"] is True
+    working_hours = db.session.execute(
+        db.select(WorkingHours).filter_by(
+            therapist_id=therapist_id, start_time=time(19)
+        )
+    ).scalar_one()
+    assert availability_index.is_open(therapist_id, start, 30)
+
+    # Updated hours no longer cover slot
+    prefix = f"hours-{working_hours.id}"
+    response = client.post(
+        f"/availability/working-hours/update/{working_hours.id}",
+        data={
+            f"{prefix}-weekday": "0",
+            f"{prefix}-start_time": "19:00",
+            f"{prefix}-end_time": "20:00",
+        },
+    )
+    assert response.get_json()["success"] is True
+    assert not availability_index.is_open(therapist_id, start, 30)
+
+    # Extra hours reopen slot on one day only, until deleted
+    response = client.post(
+        "/availability/exceptions/create",
+        data={
+            "new-start": start.strftime("%Y-%m-%dT%H:%M"),
+            "new-end": (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+            "new-is_available": "y",
+        },
+    )
+    assert response.get_json()["success"] is True
+    exception = db.session.execute(
+        db.select(AvailabilityException).filter_by(therapist_id=therapist_id)
+    ).scalar_one()
+    assert availability_index.is_open(therapist_id, start, 30)
+    assert not availability_index.is_open(therapist_id, start + timedelta(7), 30)
+
+    response = client.post(
+        "/availability/exceptions/delete", data={"exception_id": exception.id}
+    )
+    assert response.get_json()["success"] is True
+    assert not availability_index.is_open(therapist_id, start, 30)
+
+    # Other therapists' hours cannot be changed
+    other_hours = db.session.execute(
+        db.select(WorkingHours).where(WorkingHours.therapist_id != therapist_id)
+    ).scalar()
+    response = client.post(
+        "/availability/working-hours/delete",
+        data={"working_hours_id": other_hours.id},
+    )
+    assert response.status_code == 403
+
+    # Hours are listed on therapist's page
+    response = client.get(f"/therapists/{therapist_id}")
+    assert f'id="working_hours_{working_hours.id}"' in response.text
+
+    response = client.post(
+        "/availability/working-hours/delete",
+        data={"working_hours_id": working_hours.id},
+    )
+    assert response.get_json()["success"] is True
+    assert db.session.get(WorkingHours, working_hours.id) is None
+    return
+
+
+def test_book_beyond_offered_slots(
+    client: FlaskClient, logged_in_example_client: User, stripe_api: FakeStripe
+):
+    example_therapist = db.session.execute(
+        db.select(Therapist)
+        .join(Therapist.user)
+        .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+    ).scalar_one()
+    appointment_type = example_therapist.active_appointment_types[0]
+    start = datetime.combine(date.today() + timedelta(days=60), time(10))
+    while start.weekday() != 0:
+        start += timedelta(days=1)
+    assert (
+        start.date().isoformat()
+        not in client.get(
+            f"/appointments/availability/{example_therapist.id}",
+            query_string={"appointment_type": appointment_type.id},
+        ).get_json()["slots"]
+    )
+
+    response = client.post(
+        f"/appointments/create/{example_therapist.id}",
+        data={
+            "appointment_type": appointment_type.id,
+            "date": start.date().isoformat(),
+            "time": start.strftime("%H:%M"),
+        },
+    )
+    assert "url" in response.get_json()
+    appointment = db.session.execute(
+        db.select(Appointment).filter_by(
+            client_id=logged_in_example_client.client.id, time=start
+        )
+    ).scalar_one()
+    assert not availability_index.is_open(
+        example_therapist.id, start, appointment_type.duration
+    )
+
+    # Teardown - remove booked appointment
+    db.session.delete(appointment)
+    db.session.commit()
+    return
+
+
+def test_book_only_open_slots(
+    client: FlaskClient, logged_in_example_client: User, stripe_api: FakeStripe
+):
+    example_therapist = db.session.execute(
+        db.select(Therapist)
+        .join(Therapist.user)
+        .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+    ).scalar_one()
+    appointment_type = example_therapist.active_appointment_types[0]
+    url = f"/appointments/availability/{example_therapist.id}"
+    slots = client.get(url, query_string={"appointment_type": appointment_type.id})
+    day, times = next(iter(slots.get_json()["slots"].items()))
+    data = {"appointment_type": appointment_type.id, "date": day, "time": times[0]}
+
+    response = client.post(f"/appointments/create/{example_therapist.id}", data=data)
+    assert "url" in response.get_json()
+    appointment = db.session.execute(
+        db.select(Appointment).filter_by(
+            client_id=logged_in_example_client.client.id,
+            time=datetime.fromisoformat(f"{day}T{times[0]}"),
+        )
+    ).scalar_one()
+
+    # Booked slot is no longer offered or bookable
+    slots = client.get(url, query_string={"appointment_type": appointment_type.id})
+    assert times[0] not in slots.get_json()["slots"].get(day, [])
+    response = client.post(f"/appointments/create/{example_therapist.id}", data=data)
+    assert response.get_json()["errors"] == {
+        "time": ["This time is not available, please choose another."]
+    }
+
+    # Teardown - remove booked appointment
+    db.session.delete(appointment)
+    db.session.commit()
+    return
+
+
+def test_expired_holds_release_slots(
+    client: FlaskClient, logged_in_example_client: User, stripe_api: FakeStripe
+):
+    example_therapist = db.session.execute(
+        db.select(Therapist)
+        .join(Therapist.user)
+        .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+    ).scalar_one()
+    appointment_type = example_therapist.active_appointment_types[0]
+    duration = timedelta(minutes=appointment_type.duration)
+    slots = availability_index.open_slots(
+        example_therapist.id, appointment_type.duration
+    )
+    held, expired = slots[0], slots[-1]
+    appointments = [
+        Appointment(
+            therapist_id=example_therapist.id,
+            client_id=logged_in_example_client.client.id,
+            appointment_type_id=appointment_type.id,
+            time=start,
+            hold_expires_at=datetime.now() + hold,
+        )
+        for start, hold in [(held, timedelta(hours=1)), (expired, timedelta(0))]
+    ]
+    db.session.add_all(appointments)
+    db.session.commit()
+
+    # Slots of expired holds are bookable before the sweeper runs
+    assert Appointment.has_conflict(example_therapist.id, held, held + duration)
+    assert not Appointment.has_conflict(
+        example_therapist.id, expired, expired + duration
+    )
+    slots = availability_index.open_slots(
+        example_therapist.id, appointment_type.duration
+    )
+    assert held not in slots and expired in slots
+
+    # Sweeper cancels only expired holds
+    assert len(Appointment.release_expired_holds()) == 1
+    db.session.commit()
+    for appointment in appointments:
+        db.session.refresh(appointment)
+    assert appointments[0].appointment_status == AppointmentStatus.SCHEDULED
+    assert appointments[1].appointment_status == AppointmentStatus.CANCELLED
+
+    # Checkout is refused once hold has expired
+    response = client.get(f"/stripe/checkout/{appointments[1].id}")
+    assert response.status_code == 302
+    assert not stripe_api.requests
+
+    # Teardown - remove held appointments
+    for appointment in appointments:
+        db.session.delete(appointment)
+    db.session.commit()
+    return
+
+
+@patch.object(Connection, "send")
+def test_bulk_update_notifies_each_client_once(
+    mock_send_email: Mock,
+    client: FlaskClient,
+    logged_in_example_therapist: User,
+    executed_queries: List[str],
+):
+    example_client = db.session.execute(
+        db.select(Client).join(Client.user).filter_by(email=EXAMPLE_CLIENT_EMAIL)
+    ).scalar_one()
+    therapist = logged_in_example_therapist.therapist
+    start = datetime.combine(datetime.now().date() + timedelta(days=60), time(9))
+    appointments = [
+        Appointment(
+            therapist_id=therapist.id,
+            client_id=example_client.id,
+            appointment_type_id=therapist.active_appointment_types[0].id,
+            time=start + timedelta(days=day),
+            appointment_status=status,
+        )
+        for day, status in enumerate(
+            [AppointmentStatus.SCHEDULED] * 3 + [AppointmentStatus.CANCELLED]
+        )
+    ]
+    db.session.add_all(appointments)
+    db.session.commit()
+    appointment_ids = [appointment.id for appointment in appointments]
+
+    executed_queries.clear()
+    response = client.post(
+        "/appointments/update",
+        data={"appointment_ids": appointment_ids + [0], "action": "CANCELLED"},
+    )
+    json = response.get_json()
+    assert json["success"] is True
+
+    # Each appointment is validated separately
+    results = json["results"]
+    assert all(results[str(id)]["success"] for id in appointment_ids[:3])
+    assert results[str(appointment_ids[3])]["errors"] == [
+        "Appointment is already cancelled."
+    ]
+    assert results["0"]["errors"] == ["Appointment not found."]
+
+    # Appointments are updated in one statement and client is sent one email
+    updates = [
+        query for query in executed_queries if query.startswith("UPDATE appointment")
+    ]
+    assert len(updates) == 1
+    for appointment in appointments:
+        db.session.refresh(appointment)
+        assert appointment.appointment_status == AppointmentStatus.CANCELLED
+    mock_send_email.assert_called_once()
+    message = mock_send_email.call_args.args[0]
+    assert message.subject == EmailSubject.APPOINTMENTS_CANCELLED.value
+    assert message.recipients == [EXAMPLE_CLIENT_EMAIL]
+    assert all(
+        appointment.time.strftime("%A, %-d %B %Y") in message.html
+        for appointment in appointments[:3]
+    )
+
+    # Teardown - remove appointments
+    for appointment in appointments:
+        db.session.delete(appointment)
+    db.session.commit()
+    return
+
+
+def test_series_expands_occurrences_lazily():
+    start = datetime(2024, 1, 1, 10)
+    series = AppointmentSeries(start=start, interval_weeks=2, count=None)
+
+    # Occurrences are computed from any point without expanding earlier ones
+    occurrences = series.occurrences(after=start + timedelta(weeks=1000))
+    assert next(occurrences) == start + timedelta(weeks=1002)
+
+    series.count = 3
+    assert list(series.occurrences()) == [
+        start + timedelta(weeks=week) for week in [0, 2, 4]
+    ]
+    series.count, series.until = None, start + timedelta(weeks=3)
+    assert list(series.occurrences()) == [start, start + timedelta(weeks=2)]
+
+    # Only occurrences not yet stored are due
+    series.until, series.generated_until = None, start + timedelta(weeks=2)
+    assert series.due_occurrences(3, start - timedelta(days=1)) == [
+        start + timedelta(weeks=4)
+    ]
+    return
+
+
+@patch.object(Connection, "send")
+def test_book_due_occurrences_in_batches(
+    mock_send_email: Mock,
+    app: Flask,
+    logged_in_example_client: User,
+    executed_queries: List[str],
+):
+    example_therapist = db.session.execute(
+        db.select(Therapist)
+        .join(Therapist.user)
+        .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+    ).scalar_one()
+    appointment_type = example_therapist.active_appointment_types[0]
+    today = datetime.now().date()
+    start = datetime.combine(today + timedelta(days=42 - today.weekday()), time(10))
+
+    # Weekly series after seeded appointments, with an appointment clashing with
+    # its third occurrence
+    series = AppointmentSeries(
+        therapist_id=example_therapist.id,
+        client_id=logged_in_example_client.client.id,
+        appointment_type_id=appointment_type.id,
+        start=start,
+        interval_weeks=1,
+        count=6,
+    )
+    clash = Appointment(
+        therapist_id=example_therapist.id,
+        client_id=logged_in_example_client.client.id,
+        appointment_type_id=appointment_type.id,
+        time=start + timedelta(weeks=2),
+    )
+    db.session.add_all([series, clash])
+    db.session.commit()
+
+    # Open occurrences ahead are checked in one query and inserted in one statement
+    executed_queries.clear()
+    assert book_due_occurrences() == 3
+    inserts = [
+        query
+        for query in executed_queries
+        if query.startswith("INSERT INTO appointment ")
+    ]
+    assert len(inserts) == 1
+    booked = sorted(appointment.time for appointment in series.appointments)
+    assert booked == [start + timedelta(weeks=week) for week in [0, 1, 3]]
+    assert series.generated_until == start + timedelta(weeks=3)
+    assert series.is_active
+
+    # Client is emailed once about occurrences booked and skipped
+    drain_outbox()
+    message = mock_send_email.call_args.args[0]
+    assert message.subject == EmailSubject.SERIES_BOOKED_CLIENT.value
+    assert message.recipients == [EXAMPLE_CLIENT_EMAIL]
+    assert (
+        "could not be booked for "
+        + (start + timedelta(weeks=2)).strftime("%A, %-d %B %Y")
+        in message.html
+    )
+
+    # Client is emailed about occurrences released once their hold expires
+    released = min(series.appointments, key=lambda appointment: appointment.time)
+    released.hold_expires_at = datetime.now()
+    db.session.commit()
+    assert release_expired_holds() == 1
+    db.session.commit()
+    drain_outbox()
+    message = mock_send_email.call_args.args[0]
+    assert message.subject == EmailSubject.SERIES_RELEASED_CLIENT.value
+    assert released.time.strftime("%A, %-d %B %Y") in message.html
+
+    # Later occurrences are only booked once they are due, ending the series
+    assert book_due_occurrences() == 0
+    app.config["APPOINTMENT_SERIES_AHEAD"] = 6
+    assert book_due_occurrences() == 2
+    app.config["APPOINTMENT_SERIES_AHEAD"] = 4
+    assert not series.is_active
+
+    # Teardown - remove series and its appointments
+    for appointment in series.appointments + [clash]:
+        db.session.delete(appointment)
+    db.session.delete(series)
+    db.session.commit()
+    return
+
+
+def test_create_and_cancel_series(client: FlaskClient, logged_in_example_client: User):
+    example_therapist = db.session.execute(
+        db.select(Therapist)
+        .join(Therapist.user)
+        .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+    ).scalar_one()
+    appointment_type = example_therapist.active_appointment_types[0]
+    start = availability_index.open_slots(
+        example_therapist.id, appointment_type.duration
+    )[-1]
+    url = f"/appointments/series/create/{example_therapist.id}"
+    data = {
+        "appointment_type": appointment_type.id,
+        "date": start.date().isoformat(),
+        "time": start.strftime("%H:%M"),
+        "interval_weeks": 1,
+        "count": 3,
+    }
+
+    # Series cannot end before it starts
+    response = client.post(
+        url, data={**data, "end_date": (start - timedelta(days=1)).date().isoformat()}
+    )
+    assert "end_date" in response.get_json()["errors"]
+
+    # Booking series stores its first occurrences, held until payment is due
+    response = client.post(url, data=data)
+    assert response.get_json()["success"] is True
+    series = (
+        db.session.execute(
+            db.select(AppointmentSeries)
+            .filter_by(client_id=logged_in_example_client.client.id)
+            .order_by(AppointmentSeries.id.desc())
+        )
+        .scalars()
+        .first()
+    )
+    appointments = sorted(series.appointments, key=lambda a: a.time)
+    assert appointments[0].time == start
+    assert all(
+        appointment.hold_expires_at and appointment.hold_expires_at < appointment.time
+        for appointment in appointments
+    )
+
+    # Cancelling series ends it along with its upcoming appointments
+    response = client.post(f"/appointments/series/{series.id}/cancel")
+    assert response.get_json()["success"] is True
+    for appointment in appointments:
+        db.session.refresh(appointment)
+        assert appointment.appointment_status == AppointmentStatus.CANCELLED
+    assert not series.is_active
+    assert book_due_occurrences() == 0
+    assert len(series.appointments) == len(appointments)
+
+    # Teardown - remove series and its appointments
+    for appointment in appointments:
+        db.session.delete(appointment)
+    db.session.delete(series)
+    db.session.commit()
+    return
+
+
+def test_concurrent_bookings_never_overlap(file_app: Flask):
+    with file_app.app_context():
+        therapist = db.session.execute(
+            db.select(Therapist)
+            .join(Therapist.user)
+            .filter_by(email=EXAMPLE_THERAPIST_EMAIL)
+        ).scalar_one()
+        therapist.stripe_account_id = None
+        db.session.commit()
+        therapist_id = therapist.id
+        appointment_type = therapist.active_appointment_types[0]
+        duration = timedelta(minutes=appointment_type.duration)
+        existing_count = db.session.execute(
+            db.select(db.func.count(Appointment.id)).filter_by(
+                therapist_id=therapist_id
+            )
+        ).scalar_one()
+
+        # Pick open slots which would not overlap each other
+        slots = []
+        for slot in availability_index.open_slots(
+            therapist_id, appointment_type.duration
+        ):
+            if not slots or slot >= slots[-1] + duration:
+                slots.append(slot)
+        slots = slots[:10]
+        data = [
+            {
+                "appointment_type": appointment_type.id,
+                "date": slot.date().isoformat(),
+                "time": slot.strftime("%H:%M"),
+            }
+            for slot in slots
+        ]
+
+    # Many clients book the same slots at once, in different orders
+    def book_slots(seed: int) -> List[dict]:
+        client = file_app.test_client()
+        client.post(
+            "/login",
+            data={"email": EXAMPLE_CLIENT_EMAIL, "password": EXAMPLE_VALID_PASSWORD},
+        )
+        results = []
+        for slot_data in random.Random(seed).sample(data, len(data)):
+            response = client.post(
+                f"/appointments/create/{therapist_id}", data=slot_data
+            )
+            results.append(response.get_json())
+        return results
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = [r for rs in executor.map(book_slots, range(20)) for r in rs]
+
+    # Each slot is booked exactly once
+    assert len(results) == 200
+    assert sum(result["success"] for result in results) == len(slots)
+    with file_app.app_context():
+        booked = (
+            db.session.execute(
+                db.select(Appointment.time)
+                .filter_by(therapist_id=therapist_id)
+                .order_by(Appointment.id)
+                .offset(existing_count)
+            )
+            .scalars()
+            .all()
+        )
+    assert sorted(booked) == slots
+    return
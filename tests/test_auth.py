@@ -1,14 +1,16 @@
 from unittest.mock import Mock, patch
 
+from flask import Flask
 from flask.testing import FlaskClient
 from flask_login import current_user
-from flask_mail import Mail
+from flask_mail import Connection
 
-from app import db
+from app import db, load_user, user_cache
 from app.models.user import User
+from app.utils.caching import MemoryBackend
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_get_register(mock_send_email: Mock, client: FlaskClient):
     response = client.get("/register")
     assert response.status_code == 200
@@ -16,7 +18,7 @@ def test_get_register(mock_send_email: Mock, client: FlaskClient):
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_success(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -37,7 +39,7 @@ def test_register_success(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_missing_fields(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -59,7 +61,7 @@ def test_register_missing_fields(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_invalid_role(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -85,7 +87,7 @@ def test_register_invalid_role(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_invalid_email(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -111,7 +113,7 @@ def test_register_invalid_email(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_duplicate_email(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -134,7 +136,7 @@ def test_register_duplicate_email(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_register_weak_password(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -243,7 +245,7 @@ def test_user_login_unverified(
     return
 
 
-@patch.object(Mail, "send")
+@patch.object(Connection, "send")
 def test_verify_email_sent(
     mock_send_email: Mock, client: FlaskClient, fake_registration_data: dict
 ):
@@ -262,3 +264,52 @@ def test_verify_email_sent(
     assert mock_send_email.call_count == 2
 
     return
+
+
+def test_load_user_fetches_profile_in_one_query(
+    app: Flask, logged_in_example_therapist: User, executed_queries: list
+):
+    user_id = logged_in_example_therapist.id
+    with app.test_request_context():
+        db.session.expire_all()
+        executed_queries.clear()
+        user = load_user(str(user_id))
+
+        # Onboarding status is derived from eagerly loaded data and then cached
+        assert user.onboarding_complete
+        assert len(executed_queries) == 1
+
+        user.therapist.titles = []
+        assert user.onboarding_complete
+        db.session.rollback()
+    return
+
+
+def test_load_user_reuses_cached_user_until_changed(
+    app: Flask, logged_in_example_therapist: User, executed_queries: list
+):
+    user_id = logged_in_example_therapist.id
+    with patch.object(user_cache, "backend", MemoryBackend(100)):
+        with app.test_request_context():
+            db.session.expire_all()
+            load_user(str(user_id))
+
+            # Cached user and profile are reattached without querying database
+            executed_queries.clear()
+            user = load_user(str(user_id))
+            assert user.onboarding_complete
+            assert user.therapist.titles
+            assert len(executed_queries) == 0
+
+            # Committed changes to user's profile invalidate cached data
+            first_name = user.first_name
+            user.first_name = "Changed"
+            db.session.commit()
+            executed_queries.clear()
+            user = load_user(str(user_id))
+            assert user.first_name == "Changed"
+            assert len(executed_queries) > 0
+
+            user.first_name = first_name
+            db.session.commit()
+    return
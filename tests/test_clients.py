@@ -1,5 +1,7 @@
 from flask.testing import FlaskClient
 
+from app import db
+from app.constants import EXAMPLE_CLIENT_EMAIL
 from app.models import User
 from app.models.client import Client
 from app.models.therapist import Therapist
@@ -38,3 +40,45 @@ def test_update_client_profile_missing_fields(
     assert response.status_code == 200
     assert data["success"] is False and "errors" in data
     return
+
+
+def test_filter_clients_returns_facet_counts(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    response = client.post("/clients/filter", data={"submit": "filter"})
+    data = response.get_json()
+    assert data["success"] is True
+    total = int(data["update_targets"]["filter-count"].split()[0])
+    assert total > 0
+
+    # Each client has exactly one gender, occupation and referral source
+    for facet in ["gender", "occupation", "referral_source"]:
+        assert sum(data["facet_counts"][facet].values()) == total
+    assert all(count <= total for count in data["facet_counts"]["issues"].values())
+    return
+
+
+def test_get_client_requires_appointment_with_therapist(
+    client: FlaskClient,
+    logged_in_example_therapist: User,
+    fake_client_profile: Client,
+    executed_queries: list,
+):
+    therapist = logged_in_example_therapist.therapist
+    example_client = (
+        db.session.execute(db.select(User).filter_by(email=EXAMPLE_CLIENT_EMAIL))
+        .scalar_one()
+        .client
+    )
+
+    # Relationship is checked with a single query, without loading appointments
+    executed_queries.clear()
+    assert therapist.has_client(example_client)
+    assert not therapist.has_client(fake_client_profile)
+    assert len(executed_queries) == 2
+
+    response = client.get(f"/clients/{example_client.id}")
+    assert response.status_code == 200
+    response = client.get(f"/clients/{fake_client_profile.id}")
+    assert response.status_code == 403
+    return
@@ -0,0 +1,184 @@
+import smtplib
+from datetime import datetime
+from typing import Any, Generator, List
+from unittest.mock import Mock, patch
+
+import pytest
+from flask import Flask, url_for
+from flask.testing import FlaskClient
+from flask_mail import Connection, Mail
+
+from app import (availability_index, create_app, db, event_broker, mail,
+                 stripe_client, user_cache)
+from app.config import TestConfig
+from app.constants import EXAMPLE_CLIENT_EMAIL
+from app.models.appointment import Appointment
+from app.models.client import Client
+from app.models.email_outbox import EmailOutbox
+from app.models.enums import EmailSubject
+from app.models.user import User
+from app.utils.mail import EmailMessage, drain_outbox
+
+
+@pytest.fixture
+def queued_emails(app: Flask) -> List[EmailOutbox]:
+    appointment = db.session.execute(
+        db.select(Appointment)
+        .join(Appointment.client)
+        .join(Client.user)
+        .where(User.email == EXAMPLE_CLIENT_EMAIL)
+        .limit(1)
+    ).scalar_one()
+    emails = [
+        EmailOutbox(
+            subject=EmailSubject.APPOINTMENT_CANCELLED,
+            recipient_id=appointment.client.user_id,
+            appointment_id=appointment.id,
+            base_url="https://mindli.example/",
+            created_at=datetime.now(),
+            next_attempt_at=datetime.now(),
+        )
+        for _ in range(3)
+    ]
+    db.session.add_all(emails)
+    db.session.commit()
+    yield emails
+
+    # Teardown - remove emails from outbox
+    for email in emails:
+        db.session.delete(email)
+    db.session.commit()
+    return
+
+
+@patch.object(Connection, "send")
+def test_drain_outbox_sends_batch_over_one_connection(
+    mock_send_email: Mock, queued_emails: List[EmailOutbox]
+):
+    with patch.object(Mail, "connect", wraps=mail.connect) as mock_connect:
+        assert drain_outbox() == 3
+
+    mock_connect.assert_called_once()
+    assert mock_send_email.call_count == 3
+
+    # Emails are rendered when sent, with links to site they were requested from
+    message = mock_send_email.call_args.args[0]
+    appointment_id = queued_emails[0].appointment_id
+    assert message.subject == EmailSubject.APPOINTMENT_CANCELLED.value
+    assert message.recipients == [EXAMPLE_CLIENT_EMAIL]
+    assert f"https://mindli.example/appointments/{appointment_id}" in message.html
+    assert all(email.sent_at and not email.next_attempt_at for email in queued_emails)
+    return
+
+
+def test_claimed_emails_leased_to_one_drain(queued_emails: List[EmailOutbox]):
+    # Emails claimed by one drain are not claimed again until their lease expires
+    assert len(EmailOutbox.claim_batch(10, lease=60)) == 3
+    assert EmailOutbox.claim_batch(10, lease=60) == []
+
+    queued_emails[0].next_attempt_at = datetime.now()
+    db.session.commit()
+    assert EmailOutbox.claim_batch(10, lease=60) == [queued_emails[0]]
+    return
+
+
+@patch.object(Connection, "send")
+def test_drain_outbox_retries_failed_emails_with_backoff(
+    mock_send_email: Mock, queued_emails: List[EmailOutbox]
+):
+    mock_send_email.side_effect = [
+        None,
+        smtplib.SMTPRecipientsRefused({}),
+        None,
+    ]
+    assert drain_outbox() == 2
+
+    failed = queued_emails[1]
+    assert failed.sent_at is None and failed.attempts == 1
+    assert failed.next_attempt_at > datetime.now()
+
+    # Server disconnecting defers the rest of the batch
+    failed.next_attempt_at = datetime.now()
+    mock_send_email.side_effect = smtplib.SMTPServerDisconnected()
+    assert drain_outbox() == 0
+    assert failed.attempts == 2
+    assert failed.next_attempt_at > datetime.now()
+    return
+
+
+@patch.object(Connection, "send")
+def test_emails_only_sent_once_committed(mock_send_email: Mock, client: FlaskClient):
+    user = db.session.execute(
+        db.select(User).filter_by(email=EXAMPLE_CLIENT_EMAIL)
+    ).scalar_one()
+    count_query = db.select(db.func.count(EmailOutbox.id)).filter_by(
+        recipient_id=user.id, subject=EmailSubject.PASSWORD_RESET
+    )
+    initial_count = db.session.execute(count_query).scalar_one()
+
+    # Emails queued in a transaction which is rolled back are discarded
+    EmailMessage(recipient=user, subject=EmailSubject.PASSWORD_RESET).send()
+    db.session.rollback()
+    assert db.session.execute(count_query).scalar_one() == initial_count
+    mock_send_email.assert_not_called()
+
+    # Emails committed during a request are sent once the response is ready
+    response = client.post(
+        "/request-password-reset", data={"email": EXAMPLE_CLIENT_EMAIL}
+    )
+    assert response.get_json()["success"] is True
+    assert db.session.execute(count_query).scalar_one() == initial_count + 1
+    mock_send_email.assert_called_once()
+    assert mock_send_email.call_args.args[0].recipients == [EXAMPLE_CLIENT_EMAIL]
+    return
+
+
+@patch.object(Connection, "send")
+def test_emails_queued_outside_request_link_to_site(
+    mock_send_email: Mock, app: Flask, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setitem(app.config, "SITE_URL", "https://mindli.example/app/")
+    appointment = db.session.execute(
+        db.select(Appointment)
+        .join(Appointment.client)
+        .join(Client.user)
+        .where(User.email == EXAMPLE_CLIENT_EMAIL)
+        .limit(1)
+    ).scalar_one()
+
+    # Emails queued by workers are rendered with links to configured site
+    EmailMessage(
+        recipient=appointment.client.user,
+        subject=EmailSubject.APPOINTMENT_CANCELLED,
+        context={"appointment": appointment},
+        url_params={"appointment_id": appointment.id},
+    ).send()
+    db.session.commit()
+    assert drain_outbox() >= 1
+    message = mock_send_email.call_args.args[0]
+    assert f"https://mindli.example/app/appointments/{appointment.id}" in message.html
+    return
+
+
+@pytest.fixture
+def worker_app(app: Flask) -> Generator[Flask, Any, None]:
+    config = type(
+        "WorkerTestConfig", (TestConfig,), {"SITE_URL": "https://mindli.example/app/"}
+    )
+    yield create_app(config=config, celery_worker=True)
+
+    # Teardown - restore extensions shared with test app
+    for extension in [user_cache, event_broker, stripe_client, availability_index]:
+        extension.init_app(app)
+    app.celery.set_default()
+    return
+
+
+def test_worker_builds_urls_for_configured_site(worker_app: Flask):
+    # Workers build external URLs for configured site without a request
+    with worker_app.app_context():
+        assert (
+            url_for("appointments.index", _external=True)
+            == "https://mindli.example/app/appointments/"
+        )
+    return
@@ -0,0 +1,216 @@
+import json
+import re
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app import db, event_broker
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.user import User
+
+
+def test_send_message_updates_inbox(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    conversations = (
+        db.session.execute(Conversation.inbox(logged_in_example_therapist))
+        .scalars()
+        .unique()
+        .all()
+    )
+    assert conversations
+    conversation = conversations[-1]
+
+    response = client.post(
+        f"/messages/{conversation.id}/update", data={"message": "Latest message"}
+    )
+    assert response.get_json()["success"] is True
+
+    # Latest message is denormalised onto conversation, which is listed first
+    # among conversations with messages
+    assert conversation.last_message.content == "Latest message"
+    assert conversation.last_message_at == conversation.last_message.timestamp
+    conversations = (
+        db.session.execute(Conversation.inbox(logged_in_example_therapist))
+        .scalars()
+        .unique()
+        .all()
+    )
+    assert [c for c in conversations if c.last_message][0] == conversation
+
+    response = client.get("/messages/")
+    assert response.status_code == 200
+    assert b"Latest message" in response.data
+    return
+
+
+def test_message_history_paginates_before_message(
+    app: Flask,
+    client: FlaskClient,
+    logged_in_example_therapist: User,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setitem(app.config, "PAGE_SIZE", 4)
+    conversation = db.session.execute(
+        Conversation.inbox(logged_in_example_therapist)
+        .where(Conversation.last_message_id.is_not(None))
+        .limit(1)
+    ).scalar_one()
+    expected = (
+        db.session.execute(
+            db.select(Message.content)
+            .filter_by(conversation_id=conversation.id)
+            .order_by(Message.timestamp, Message.id)
+        )
+        .scalars()
+        .all()
+    )
+
+    # Only selected conversation's latest page is rendered initially
+    response = client.get(f"/messages/?section={conversation.id}")
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert html.count('class="message p-2') == 4
+    before = re.search(
+        rf'data-target="messages-{conversation.id}" data-cursor="(\d+)"', html
+    ).group(1)
+
+    # Walk back through history until first message
+    count = 4
+    while before:
+        response = client.get(
+            f"/messages/{conversation.id}/history", query_string={"before": before}
+        )
+        data = response.get_json()
+        page = data["prepend_targets"][f"messages-{conversation.id}"]
+        count += page.count('class="message p-2')
+        before = data["next_cursor"]
+
+    assert count == len(expected)
+    assert expected[0] in page
+    return
+
+
+def test_message_history_requires_participant(
+    client: FlaskClient, logged_in_client: User
+):
+    conversation = db.session.execute(db.select(Conversation).limit(1)).scalar_one()
+    response = client.get(f"/messages/{conversation.id}/history")
+    assert response.status_code == 403
+    return
+
+
+def test_send_message_requires_participant(client: FlaskClient, logged_in_client: User):
+    conversation = db.session.execute(db.select(Conversation).limit(1)).scalar_one()
+    count_query = db.select(db.func.count(Message.id)).filter_by(
+        conversation_id=conversation.id
+    )
+    message_count = db.session.execute(count_query).scalar_one()
+    response = client.post(
+        f"/messages/{conversation.id}/update", data={"message": "Hello"}
+    )
+    assert response.status_code == 403
+    assert db.session.execute(count_query).scalar_one() == message_count
+    return
+
+
+def test_stream_delivers_sent_messages(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    conversation = db.session.execute(
+        Conversation.inbox(logged_in_example_therapist).limit(1)
+    ).scalar_one()
+
+    response = client.get("/messages/stream")
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    assert next(chunks) == b": connected\n\n"
+
+    # Sending a message publishes it to the author's open stream
+    response_data = client.post(
+        f"/messages/{conversation.id}/update", data={"message": "Streamed message"}
+    ).get_json()
+    assert response_data == {"success": True, "reset_form": True}
+
+    event, data = next(chunks).decode().strip().split("\n")
+    assert event == "event: message"
+    data = json.loads(data.removeprefix("data: "))
+    assert data["conversation_id"] == conversation.id
+    assert data["content"] == "Streamed message"
+    assert data["author_id"] == logged_in_example_therapist.id
+
+    # Closing stream removes its subscription
+    response.close()
+    assert not event_broker.backend.subscriptions
+    return
+
+
+def test_unread_counts_maintained_until_read(
+    client: FlaskClient, logged_in_example_therapist: User
+):
+    therapist_user = logged_in_example_therapist
+    conversation = db.session.execute(
+        Conversation.inbox(therapist_user).limit(1)
+    ).scalar_one()
+    client_user_id = conversation.client_user_id
+    initial_count = therapist_user.unread_message_count
+
+    # Messages from client are counted as unread for therapist
+    for content in ["First unread", "Second unread"]:
+        conversation.add_message(
+            Message(
+                author_id=client_user_id,
+                content=content,
+                timestamp=datetime.now(),
+            )
+        )
+        db.session.commit()
+    assert conversation.therapist_unread_count == 2
+    assert therapist_user.unread_message_count == initial_count + 2
+
+    # Marking conversation read resets counts and notifies client
+    subscription = event_broker.subscribe(client_user_id)
+    response = client.post(f"/messages/{conversation.id}/read")
+    data = response.get_json()
+    assert data["unread_count"] == 0
+    assert data["unread_message_count"] == initial_count
+    assert conversation.therapist_last_read_message_id == conversation.last_message_id
+    assert json.loads(subscription.get(timeout=1)) == {
+        "event": "read",
+        "data": {
+            "conversation_id": conversation.id,
+            "message_id": conversation.last_message_id,
+        },
+    }
+    subscription.close()
+    return
+
+
+def test_backfill_last_messages(app: Flask):
+    # Conversations created before latest messages were maintained are unsorted
+    latest = dict(
+        db.session.execute(
+            db.select(Conversation.id, Conversation.last_message_id).where(
+                Conversation.last_message_id.is_not(None)
+            )
+        ).all()
+    )
+    db.session.execute(
+        sa.update(Conversation).values(last_message_id=None, last_message_at=None)
+    )
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["messages", "backfill-last-messages"])
+    assert f"of {len(latest)} conversations" in result.output
+    assert latest == dict(
+        db.session.execute(
+            db.select(Conversation.id, Conversation.last_message_id).where(
+                Conversation.last_message_id.is_not(None)
+            )
+        ).all()
+    )
+    return
@@ -0,0 +1,342 @@
+import hashlib
+import hmac
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Barrier
+from typing import Any, Generator, List
+from unittest.mock import Mock, patch
+
+import pytest
+import stripe
+from flask import Flask
+from flask.testing import FlaskClient
+from flask_mail import Connection
+
+from app import db, stripe_client
+from app.constants import EXAMPLE_CLIENT_EMAIL
+from app.models.appointment import Appointment
+from app.models.client import Client
+from app.models.enums import AppointmentStatus, EmailSubject, PaymentStatus
+from app.models.stripe_event import StripeEvent
+from app.models.user import User
+from app.utils.mail import drain_outbox
+from app.utils.stripe_events import process_events
+from tests.fake_stripe import FakeStripe
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+@pytest.fixture
+def pending_appointment() -> Generator[Appointment, Any, None]:
+    appointment = db.session.execute(
+        db.select(Appointment)
+        .join(Appointment.client)
+        .join(Client.user)
+        .where(User.email == EXAMPLE_CLIENT_EMAIL)
+        .limit(1)
+    ).scalar_one()
+    statuses = appointment.appointment_status, appointment.payment_status
+    appointment.appointment_status = AppointmentStatus.SCHEDULED
+    appointment.payment_status = PaymentStatus.PENDING
+    db.session.commit()
+    yield appointment
+
+    # Teardown - restore statuses and remove stored events
+    appointment.appointment_status, appointment.payment_status = statuses
+    db.session.execute(db.delete(StripeEvent))
+    db.session.commit()
+    return
+
+
+def make_event(event_id: str, event_type: str, appointment: Appointment) -> dict:
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "created": int(time.time()),
+        "data": {
+            "object": {
+                "object": "checkout.session",
+                "payment_status": "paid",
+                "metadata": {"appointment_id": str(appointment.id)},
+            }
+        },
+    }
+
+
+def post_event(client: FlaskClient, event: dict, secret: str = WEBHOOK_SECRET):
+    # Sign payload as Stripe does
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return client.post(
+        "/stripe/webhook",
+        data=payload,
+        headers={"Stripe-Signature": f"t={timestamp},v1={signature}"},
+    )
+
+
+@patch.object(Connection, "send")
+def test_webhook_processes_redelivered_event_once(
+    mock_send_email: Mock,
+    app: Flask,
+    client: FlaskClient,
+    pending_appointment: Appointment,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setitem(app.config, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    event = make_event("evt_paid", "checkout.session.completed", pending_appointment)
+
+    # Events with invalid signatures are rejected without being stored
+    response = post_event(client, event, secret="whsec_other")
+    assert response.status_code == 400
+    assert db.session.get(StripeEvent, "evt_paid") is None
+
+    for _ in range(2):
+        response = post_event(client, event)
+        assert response.status_code == 200
+
+    stored_event = db.session.get(StripeEvent, "evt_paid")
+    assert stored_event.processed_at and stored_event.appointment_id == (
+        pending_appointment.id
+    )
+    assert pending_appointment.payment_status == PaymentStatus.SUCCEEDED
+    assert mock_send_email.call_count == 2
+    return
+
+
+@patch.object(Connection, "send")
+def test_events_processed_in_order_for_each_appointment(
+    mock_send_email: Mock, app: Flask, pending_appointment: Appointment
+):
+    failed_event = make_event(
+        "evt_failed", "checkout.session.async_payment_failed", pending_appointment
+    )
+    succeeded_event = make_event(
+        "evt_succeeded", "checkout.session.async_payment_succeeded", pending_appointment
+    )
+    succeeded_event["created"] += 1
+    for event in [failed_event, succeeded_event]:
+        assert StripeEvent.record(event, json.dumps(event))
+    assert not StripeEvent.record(failed_event, json.dumps(failed_event))
+
+    # Later event for appointment waits while earlier event is retried
+    with patch("app.utils.stripe_events.handle_payment_failed", side_effect=Exception):
+        assert process_events() == 0
+    assert db.session.get(StripeEvent, "evt_failed").attempts == 1
+    assert db.session.get(StripeEvent, "evt_succeeded").processed_at is None
+    assert pending_appointment.payment_status == PaymentStatus.PENDING
+
+    # Replaying earlier event processes both in order
+    result = app.test_cli_runner().invoke(
+        args=["stripe", "replay-events", "evt_failed"]
+    )
+    assert "2 processed" in result.output
+    assert pending_appointment.payment_status == PaymentStatus.SUCCEEDED
+    return
+
+
+@patch.object(Connection, "send")
+def test_late_payment_reinstates_or_refunds_released_appointment(
+    mock_send_email: Mock, app: Flask, pending_appointment: Appointment
+):
+    # Appointment's hold was released before its payment was processed
+    original_time = pending_appointment.time
+    pending_appointment.time = datetime.combine(
+        datetime.now().date() + timedelta(days=200), datetime.min.time()
+    ) + timedelta(hours=10)
+    pending_appointment.appointment_status = AppointmentStatus.CANCELLED
+    pending_appointment.hold_expires_at = datetime.now() - timedelta(minutes=1)
+    clash = Appointment(
+        therapist_id=pending_appointment.therapist_id,
+        client_id=pending_appointment.client_id,
+        appointment_type_id=pending_appointment.appointment_type_id,
+        time=pending_appointment.time,
+    )
+    db.session.add(clash)
+    db.session.commit()
+
+    # Payment is refunded if slot has since been booked
+    event = make_event("evt_late", "checkout.session.completed", pending_appointment)
+    assert StripeEvent.record(event, json.dumps(event))
+    assert process_events() == 1
+    assert pending_appointment.payment_status == PaymentStatus.REFUND_DUE
+    assert pending_appointment.appointment_status == AppointmentStatus.CANCELLED
+    drain_outbox()
+    message = mock_send_email.call_args.args[0]
+    assert message.subject == EmailSubject.PAYMENT_REFUND_CLIENT.value
+
+    # Appointment is reinstated if slot is still free
+    db.session.delete(clash)
+    pending_appointment.payment_status = PaymentStatus.PENDING
+    db.session.commit()
+    event = make_event(
+        "evt_late_free", "checkout.session.completed", pending_appointment
+    )
+    assert StripeEvent.record(event, json.dumps(event))
+    assert process_events() == 1
+    assert pending_appointment.payment_status == PaymentStatus.SUCCEEDED
+    assert pending_appointment.appointment_status == AppointmentStatus.SCHEDULED
+    assert pending_appointment.hold_expires_at is None
+
+    # Teardown - restore appointment time
+    pending_appointment.time = original_time
+    db.session.commit()
+    return
+
+
+def test_concurrent_claims_never_overlap(file_app: Flask):
+    with file_app.app_context():
+        event_ids = [f"evt_claim_{i}" for i in range(40)]
+        for event_id in event_ids:
+            event = {
+                "id": event_id,
+                "type": "checkout.session.completed",
+                "created": int(time.time()),
+                "data": {"object": {"metadata": {}}},
+            }
+            assert StripeEvent.record(event, json.dumps(event))
+
+    # Workers claiming batches at the same time never claim the same event
+    barrier = Barrier(2)
+
+    def claim_events(_) -> List[str]:
+        claimed = []
+        with file_app.app_context():
+            barrier.wait()
+            while events := StripeEvent.claim_batch(5, lease=60):
+                claimed += [event.id for event in events]
+        return claimed
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first, second = executor.map(claim_events, range(2))
+    assert not set(first) & set(second)
+    assert sorted(first + second) == sorted(event_ids)
+    return
+
+
+def test_checkout_session_reused_until_expiry(
+    client: FlaskClient,
+    logged_in_example_client: User,
+    pending_appointment: Appointment,
+    stripe_api: FakeStripe,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(pending_appointment.therapist, "stripe_account_id", "acct_test")
+
+    # Repeated payment attempts reuse the stored checkout session
+    urls = [
+        client.get(f"/stripe/checkout/{pending_appointment.id}").location
+        for _ in range(2)
+    ]
+    assert urls == [pending_appointment.checkout_session_url] * 2
+    assert len(stripe_api.requests) == 1
+    params = stripe_api.requests[0]["params"]
+    assert params["metadata[appointment_id]"] == str(pending_appointment.id)
+
+    # Expired checkout session is replaced
+    pending_appointment.checkout_session_expires_at = datetime.now()
+    response = client.get(f"/stripe/checkout/{pending_appointment.id}")
+    assert response.location == pending_appointment.checkout_session_url != urls[0]
+    assert len(stripe_api.requests) == 2
+    return
+
+
+def test_checkout_extends_hold_only_up_to_limit(
+    app: Flask,
+    client: FlaskClient,
+    logged_in_example_client: User,
+    pending_appointment: Appointment,
+    stripe_api: FakeStripe,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(pending_appointment.therapist, "stripe_account_id", "acct_test")
+    now = datetime.now()
+    pending_appointment.created_at = now
+    pending_appointment.hold_expires_at = now + timedelta(
+        seconds=app.config["APPOINTMENT_HOLD_TTL"]
+    )
+    pending_appointment.checkout_session_url = None
+    db.session.commit()
+    appointment_url = f"/appointments/{pending_appointment.id}"
+
+    # Reopening checkout each time session expires extends hold up to its limit,
+    # after which checkout is refused
+    for attempt in range(1, 20):
+        response = client.get(f"/stripe/checkout/{pending_appointment.id}")
+        limit = pending_appointment.created_at + timedelta(
+            seconds=app.config["APPOINTMENT_HOLD_MAX"]
+        )
+        assert pending_appointment.hold_expires_at <= limit
+        if response.location.endswith(appointment_url):
+            break
+        assert len(stripe_api.requests) == attempt
+
+        # Move appointment 20 minutes into the past, expiring its session
+        for attribute in ["created_at", "hold_expires_at"]:
+            setattr(
+                pending_appointment,
+                attribute,
+                getattr(pending_appointment, attribute) - timedelta(minutes=20),
+            )
+        pending_appointment.checkout_session_expires_at = datetime.now()
+        db.session.commit()
+    assert 1 < attempt < 19 and len(stripe_api.requests) == attempt - 1
+
+    # Teardown - release hold and forget checkout session
+    pending_appointment.hold_expires_at = None
+    pending_appointment.checkout_session_url = None
+    db.session.commit()
+    return
+
+
+def test_stripe_calls_share_client_and_retry(
+    client: FlaskClient,
+    logged_in_therapist: User,
+    stripe_api: FakeStripe,
+):
+    # Failed account creation is retried, with all calls made by shared client
+    stripe_api.failures = 1
+    response = client.post("/stripe/create-account")
+    assert response.get_json() == {
+        "success": True,
+        "url": "https://connect.stripe.test/setup/acct_test",
+    }
+    assert [r["path"] for r in stripe_api.requests] == [
+        "/v1/accounts",
+        "/v1/accounts",
+        "/v1/account_links",
+    ]
+    assert stripe.default_http_client is stripe_client.http_client
+
+    # Latency is recorded for each operation
+    stats = stripe_client.stats()
+    assert stats["Account.create"]["count"] >= 1
+    assert stats["AccountLink.create"]["max"] > 0
+    return
+
+
+def test_stripe_latencies_logged_periodically(
+    client: FlaskClient,
+    logged_in_therapist: User,
+    stripe_api: FakeStripe,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    # Latencies are not logged until interval has passed
+    client.post("/stripe/create-account")
+    assert "Stripe call latencies" not in capsys.readouterr().out
+
+    # Next call logs latencies recorded since they were last logged, which are
+    # then recorded afresh
+    monkeypatch.setattr(stripe_client, "stats_interval", 0)
+    client.post("/stripe/create-account")
+    output = capsys.readouterr().out
+    assert "Stripe call latencies: " in output
+    assert "AccountLink.create count=" in output
+    assert stripe_client.stats() == {}
+    return
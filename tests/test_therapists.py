@@ -1,7 +1,23 @@
+import re
+from typing import List
+
+import pytest
+import sqlalchemy as sa
+from faker import Faker
+from flask import Flask
 from flask.testing import FlaskClient
 
+from app import db
 from app.models import User
+from app.models.appointment_type import AppointmentType
+from app.models.enums import Gender, TherapyMode, TherapyType, UserRole
+from app.models.intervention import Intervention
+from app.models.issue import Issue
+from app.models.language import Language
 from app.models.therapist import Therapist
+from app.models.therapist_search import TherapistSearch, TherapistSearchVersion
+from app.models.title import Title
+from app.utils.facet_index import TherapistFacetIndex
 
 
 def test_get_therapists(logged_in_therapist: User, client: FlaskClient):
@@ -46,3 +62,254 @@ def test_update_therapist_profile_missing_fields(
     assert response.status_code == 200
     assert data["success"] is False and "errors" in data
     return
+
+
+def test_therapist_directory_query_count_is_bounded(
+    client: FlaskClient,
+    logged_in_therapist: User,
+    fake: Faker,
+    seeded_data: dict,
+    executed_queries: list,
+):
+    def count_directory_queries() -> "tuple[int, int]":
+        db.session.expire_all()
+        executed_queries.clear()
+        response = client.get("/therapists/")
+        assert response.status_code == 200
+        index_count = len(executed_queries)
+
+        db.session.expire_all()
+        executed_queries.clear()
+        response = client.post("/therapists/filter", data={"submit": "filter"})
+        assert response.get_json()["success"] is True
+        return index_count, len(executed_queries)
+
+    initial_counts = count_directory_queries()
+
+    # Insert additional therapists with populated profiles
+    extra_users = []
+    for _ in range(5):
+        user = User(
+            email=fake.unique.email().lower(),
+            password_hash="",
+            first_name=fake.first_name(),
+            last_name=fake.last_name(),
+            gender=Gender.FEMALE,
+            role=UserRole.THERAPIST,
+            verified=True,
+            active=True,
+        )
+        user.therapist = Therapist(
+            country="Singapore",
+            qualifications="Example qualification",
+            titles=seeded_data[Title][:2],
+            languages=seeded_data[Language][:2],
+            specialisations=seeded_data[Issue][:2],
+            interventions=seeded_data[Intervention][:2],
+            appointment_types=[
+                AppointmentType(
+                    therapy_type=TherapyType.INDIVIDUAL,
+                    therapy_mode=TherapyMode.VIDEO,
+                    duration=60,
+                    fee_amount=100,
+                    fee_currency="SGD",
+                )
+            ],
+        )
+        extra_users.append(user)
+    db.session.add_all(extra_users)
+    for user in extra_users:
+        TherapistSearch.sync(user.therapist)
+    db.session.commit()
+
+    assert count_directory_queries() == initial_counts
+
+    # Teardown - remove additional therapists
+    for user in extra_users:
+        db.session.delete(user)
+    db.session.commit()
+    return
+
+
+def test_filter_therapists_paginates_with_cursor(
+    app: Flask,
+    client: FlaskClient,
+    logged_in_therapist: User,
+    monkeypatch: pytest.MonkeyPatch,
+    executed_queries: List[str],
+):
+    monkeypatch.setitem(app.config, "PAGE_SIZE", 3)
+
+    executed_queries.clear()
+    response = client.post("/therapists/filter", data={"submit": "filter"})
+    data = response.get_json()
+    assert data["success"] is True
+    total = int(data["update_targets"]["filter-count"].split()[0])
+    assert total == TherapistFacetIndex.get().snapshot.listed.bit_count()
+
+    # Only therapists on the page are fetched, and matches are counted in memory
+    therapist_queries = [
+        query for query in executed_queries if "FROM therapist " in query
+    ]
+    assert not any("count(" in query for query in executed_queries)
+    assert therapist_queries[0].count("?") <= 3
+
+    # Follow cursors until all pages have been fetched
+    pages = [data["update_targets"]["therapist-cards"]]
+    next_cursor = data["next_cursor"]
+    while next_cursor:
+        response = client.post(
+            "/therapists/filter", data={"submit": "filter", "cursor": next_cursor}
+        )
+        data = response.get_json()
+        assert data["success"] is True
+        pages.append(data["append_targets"]["therapist-cards"])
+        next_cursor = data["next_cursor"]
+
+    assert len(pages) == -(-total // 3)
+    therapist_ids = re.findall(r'id="profileAccordion(\d+)"', "".join(pages))
+    assert len(therapist_ids) == len(set(therapist_ids)) == total
+    return
+
+
+def test_filter_therapists_invalid_cursor(
+    client: FlaskClient, logged_in_therapist: User
+):
+    response = client.post(
+        "/therapists/filter", data={"submit": "filter", "cursor": "invalid"}
+    )
+    assert response.status_code == 400
+    return
+
+
+def test_filter_therapists_matches_profile_data(
+    client: FlaskClient, logged_in_therapist: User, seeded_data: dict
+):
+    language = seeded_data[Language][0]
+
+    response = client.post(
+        "/therapists/filter",
+        data={"submit": "filter", "language": language.id, "therapy_mode": ["VIDEO"]},
+    )
+    data = response.get_json()
+    assert data["success"] is True
+
+    # Results agree with relational profile data of listed therapists
+    expected = {
+        therapist.id
+        for therapist in db.session.execute(db.select(Therapist)).scalars()
+        if therapist.user.active
+        and language in therapist.languages
+        and any(
+            at.therapy_mode == TherapyMode.VIDEO
+            for at in therapist.active_appointment_types
+        )
+    }
+    returned = set(
+        map(
+            int,
+            re.findall(
+                r'id="profileAccordion(\d+)"', data["update_targets"]["therapist-cards"]
+            ),
+        )
+    )
+    assert returned == expected
+    return
+
+
+def test_search_data_refreshed_on_appointment_type_changes(
+    client: FlaskClient,
+    logged_in_therapist: User,
+    fake_therapist_profile: Therapist,
+):
+    def listed_therapist_ids() -> list:
+        response = client.post(
+            "/therapists/filter",
+            data={"submit": "filter", "name": logged_in_therapist.full_name},
+        )
+        cards = response.get_json()["update_targets"]["therapist-cards"]
+        return list(map(int, re.findall(r'id="profileAccordion(\d+)"', cards)))
+
+    # Therapists without appointment types are not listed
+    assert fake_therapist_profile.id not in listed_therapist_ids()
+
+    response = client.post(
+        "/appointment-types/create",
+        data={
+            "new-therapy_type": TherapyType.INDIVIDUAL.name,
+            "new-therapy_mode": TherapyMode.VIDEO.name,
+            "new-duration": 60,
+            "new-fee_amount": 100,
+            "new-fee_currency": "SGD",
+        },
+    )
+    assert response.get_json()["success"] is True
+    assert fake_therapist_profile.search.listed is True
+    assert fake_therapist_profile.id in listed_therapist_ids()
+
+    # Soft deleting the only appointment type removes therapist from directory
+    appointment_type = fake_therapist_profile.active_appointment_types[0]
+    response = client.post(
+        "/appointment-types/delete",
+        data={"appointment_type_id": appointment_type.id},
+    )
+    assert response.get_json()["success"] is True
+    assert fake_therapist_profile.search.listed is False
+    assert fake_therapist_profile.id not in listed_therapist_ids()
+    return
+
+
+def test_facet_index_rebuilt_only_when_version_changes(app: Flask):
+    index = TherapistFacetIndex.get()
+    snapshot = index.snapshot
+    assert snapshot.version == TherapistSearchVersion.current()
+
+    # Unchanged version reuses loaded snapshot
+    assert TherapistFacetIndex.get().snapshot is snapshot
+
+    # Writes to therapist search data replace the snapshot as a whole
+    TherapistSearchVersion.bump()
+    db.session.commit()
+    assert TherapistFacetIndex.get().snapshot is not snapshot
+    assert index.snapshot.version == TherapistSearchVersion.current()
+    return
+
+
+def test_backfill_search_data(app: Flask):
+    listed = TherapistFacetIndex.get().snapshot.listed.bit_count()
+
+    # Therapists created before search data was maintained are not listed
+    db.session.execute(sa.delete(TherapistSearch))
+    TherapistSearchVersion.bump()
+    db.session.commit()
+    assert TherapistFacetIndex.get().snapshot.listed.bit_count() == 0
+
+    result = app.test_cli_runner().invoke(
+        args=["therapists", "backfill-search", "--batch-size", "2"]
+    )
+    therapist_count = db.session.execute(sa.func.count(Therapist.id)).scalar()
+    assert f"for {therapist_count} therapists" in result.output
+    assert TherapistFacetIndex.get().snapshot.listed.bit_count() == listed
+    return
+
+
+def test_filter_therapists_returns_facet_counts(
+    client: FlaskClient, logged_in_therapist: User, seeded_data: dict
+):
+    language = seeded_data[Language][0]
+
+    response = client.post(
+        "/therapists/filter", data={"submit": "filter", "language": language.id}
+    )
+    data = response.get_json()
+    assert data["success"] is True
+
+    # Every therapist found speaks the selected language
+    total = int(data["update_targets"]["filter-count"].split()[0])
+    assert data["facet_counts"].get("language", {}).get(str(language.id), 0) == total
+    assert all(
+        count <= total
+        for counts in data["facet_counts"].values()
+        for count in counts.values()
+    )
+    return
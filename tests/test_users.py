@@ -1,11 +1,14 @@
 from io import BytesIO
 
+import sqlalchemy as sa
+from flask import Flask
 from flask.testing import FlaskClient
 from werkzeug.datastructures import FileStorage
 
 from app import db
 from app.models import User
 from app.models.enums import Gender
+from app.models.user_name_ngram import UserNameNgram
 
 
 def test_get_user_profile_fails(client: FlaskClient, logged_in_client: User):
@@ -80,3 +83,49 @@ def test_update_user_profile_invalid_file_type(
     assert data["success"] is False
     assert "profile_picture" in data["errors"]
     return
+
+
+def test_search_name_updated_with_user_profile(
+    client: FlaskClient, logged_in_client: User
+):
+    response = client.post(
+        f"/user/{logged_in_client.id}",
+        data={
+            "first_name": "Zoë",
+            "last_name": "Quintero-Nakamura",
+            "gender": Gender.FEMALE.name,
+        },
+        content_type="multipart/form-data",
+    )
+    assert response.get_json()["success"] is True
+    assert logged_in_client.search_name == "zoe quintero-nakamura"
+    ngrams = db.session.execute(
+        db.select(UserNameNgram.ngram).filter_by(user_id=logged_in_client.id)
+    ).scalars()
+    assert set(ngrams) == UserNameNgram.ngrams(logged_in_client.search_name)
+
+    # Substring search ignores case and accents, and only matches whole terms
+    for term, expected in [("ZOË QUINT", True), ("ntero-nak", True), ("zoeq", False)]:
+        user_ids = db.session.execute(
+            db.select(User.id).where(User.name_matches(term))
+        ).scalars()
+        assert (logged_in_client.id in user_ids) is expected
+    return
+
+
+def test_backfill_search_names(app: Flask, fake_user_client: User):
+    # Users created before search names were maintained cannot be found by name
+    db.session.execute(sa.delete(UserNameNgram))
+    db.session.execute(sa.update(User).values(search_name=None))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(
+        args=["user", "backfill-search-names", "--batch-size", "2"]
+    )
+    user_count = db.session.execute(sa.func.count(User.id)).scalar()
+    assert f"of {user_count} users" in result.output
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.name_matches(fake_user_client.full_name))
+    ).scalars()
+    assert fake_user_client.id in user_ids
+    return